@@ -1,89 +1,165 @@
 import streamlit as st
-import requests
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import openai
+import os
+import io
+import asyncio
+import note_metrics
+import generation_pool
+import formulary_index
+import drug_names
+import partd_batch
+from partd_client import PartDClient, make_prompt, SUMMARY_SYSTEM_PROMPT
 
 # Configure your API keys in .streamlit/secrets.toml:
 # CMS_PLAN_FINDER_KEY = "your_cms_api_key_here"
 # OPENAI_API_KEY       = "your_openai_api_key_here"
 
-openai.api_key = st.secrets["OPENAI_API_KEY"]
+OPENAI = {
+    "api_base": os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1"),
+    "api_key": st.secrets["OPENAI_API_KEY"],
+}
 
 st.set_page_config(page_title="Medicare Part D Advisor", layout="centered")
 st.title("Medicare Part D Plan Advisor MVP")
+note_metrics.render_metrics_panel()
+
+FORMULARY_INDEX_DIR = os.environ.get("FORMULARY_INDEX_DIR", "formulary_index")
 
 # ------- Helper Functions ------- #
 
+@st.cache_resource
+def get_partd_client():
+    # One pooled session and lookup cache for the whole process
+    return PartDClient(st.secrets["CMS_PLAN_FINDER_KEY"])
+
+
 def lookup_partd_plans(zip_code, meds_list):
     """
     Call the CMS Plan Finder API to fetch Part D plans matching the given ZIP and medications.
     Returns a list of dicts: [{"plan_name": ..., "premium": ..., "tier_info": ...}, ...]
+    Repeat lookups of the same ZIP + medication set are served from the client's cache.
     """
-    endpoint = "https://api.cms.gov/plan-finder/v1/part-d"  # placeholder
-    headers = {"Authorization": f"Bearer {st.secrets['CMS_PLAN_FINDER_KEY']}"}
-    payload = {
-        "zipCode": zip_code,
-        "medications": meds_list,
-        "topN": 3
-    }
     try:
-        resp = requests.post(endpoint, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json().get("plans", [])
-        plans = []
-        for p in data:
-            plans.append({
-                "plan_name": p.get("planDisplayName"),
-                "premium": p.get("monthlyPremium"),
-                "tier_info": ", ".join([f"{d['drugName']}: Tier {d['tier']}" for d in p.get("drugList", [])])
-            })
+        plans, source = get_partd_client().lookup(zip_code, meds_list)
+        if source != "network":
+            st.caption("Plan data served from cache" + (" (refreshing in background)" if source == "stale" else ""))
         return plans
     except Exception as e:
         st.error(f"Error fetching plans: {e}")
         return []
 
 
-def make_prompt(zip_code, meds_list, plans):
-    header = f"User in {zip_code} takes: {', '.join(meds_list)}.\nHere are three Part D plans:\n"
-    body_lines = [f"- {p['plan_name']}: ${p['premium']} premium, {p['tier_info']}" for p in plans]
-    tail = "\nPlease summarize in plain language which plan is best for this user and why."  
-    return header + "\n".join(body_lines) + tail
+@st.cache_resource
+def get_formulary_index(index_dir):
+    # Arrays are memory-mapped, so this is cheap and shared by all sessions
+    return formulary_index.FormularyIndex(index_dir)
+
+
+def rank_local_plans(zip_code, meds_list, top_n):
+    """Rank every plan in the ZIP's region from the offline formulary index."""
+    index = get_formulary_index(FORMULARY_INDEX_DIR)
+    region = index.region_for_zip(zip_code)
+    if region is None:
+        st.error(f"ZIP {zip_code} is not covered by the local formulary index.")
+        return []
+    plans, unmatched = index.rank_plans(region, meds_list, top_n)
+    if unmatched:
+        st.warning(f"Not found in the local formulary: {', '.join(unmatched)}")
+    return plans
+
 
 # ------- UI ------- #
 
 zip_code = st.text_input("Enter Your ZIP Code")
 meds_input = st.text_area("List Your Medications (comma-separated)")
 
+data_source = "CMS Plan Finder API"
+if formulary_index.exists(FORMULARY_INDEX_DIR):
+    data_source = st.radio("Plan Data Source", ["Local formulary index", "CMS Plan Finder API"], horizontal=True)
+    top_n = st.slider("Number of plans", min_value=1, max_value=10, value=3)
+else:
+    top_n = 3
+
 if st.button("Find My Plans"):
     if not zip_code or not meds_input:
         st.error("Please provide both ZIP code and at least one medication.")
     else:
-        meds_list = [m.strip() for m in meds_input.split(",") if m.strip()]
+        raw_meds = [m.strip() for m in meds_input.split(",") if m.strip()]
+        # Canonical ingredient names keep lookups cacheable and match the formulary
+        matches = [drug_names.normalize(m) for m in raw_meds]
+        meds_list = drug_names.canonical_list(raw_meds)
+        corrected = [f"{m['input']} → {drug_names.describe(m)}" for m in matches
+                     if m["ingredient"] and m["term"] != " ".join(m["input"].lower().split())]
+        if corrected:
+            st.caption("Interpreted as: " + "; ".join(corrected))
+        unknown = [m["input"] for m in matches if not m["ingredient"]]
+        if unknown:
+            st.warning(f"Not recognized, searched as typed: {', '.join(unknown)}")
         with st.spinner("Looking up Part D plans..."):
-            plans = lookup_partd_plans(zip_code, meds_list)
+            if data_source == "Local formulary index":
+                plans = rank_local_plans(zip_code, meds_list, top_n)
+            else:
+                plans = lookup_partd_plans(zip_code, meds_list)
         if plans:
-            st.subheader("Top 3 Plans")
+            st.subheader(f"Top {len(plans)} Plans")
             for idx, p in enumerate(plans, 1):
                 st.markdown(f"**{idx}. {p['plan_name']}**")
                 st.write(f"- Monthly Premium: ${p['premium']}")
                 st.write(f"- Drug Tiers: {p['tier_info']}")
+                if p.get("annual_cost") is not None:
+                    st.write(f"- Estimated Annual Cost: ${p['annual_cost']:,.2f}")
 
             # LLM Explanation
-            prompt = make_prompt(zip_code, meds_list, plans)
+            timer = note_metrics.StageTimer("cms_plan_finder", "plan_summary", model="gpt-4")
+            prompt = make_prompt(zip_code, [drug_names.describe(m) for m in matches], plans)
+            timer.prompt_built()
             with st.spinner("Generating plain-language summary..."):
-                response = openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a friendly Medicare advisor."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=200
-                )
+                with generation_pool.slot():
+                    timer.dispatched()
+                    response = openai.ChatCompletion.create(
+                        model="gpt-4",
+                        messages=[
+                            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=200,
+                        **OPENAI,
+                    )
+                timer.finished(response)
                 explanation = response.choices[0].message.content
                 st.subheader("Why This Plan?")
                 st.write(explanation)
         else:
             st.warning("No plans found. Please check your inputs and try again.")
 
+# ------- Batch Mode ------- #
+
+with st.expander("Batch Mode: whole patient panel"):
+    st.caption("Upload a CSV with columns patient, zip, medications (medications separated by ';').")
+    panel_file = st.file_uploader("Patient panel CSV", type=["csv"], key="batch_panel")
+    batch_concurrency = st.slider("Concurrent lookups", min_value=1, max_value=32, value=8, key="batch_concurrency")
+    batch_summaries = st.checkbox("Include plain-language summaries", value=True, key="batch_summaries")
+    if panel_file is not None and st.button("Run Batch", key="batch_run"):
+        rows = partd_batch.read_panel(io.StringIO(panel_file.getvalue().decode("utf-8-sig")))
+        if data_source == "Local formulary index":
+            lookup = partd_batch.local_lookup(get_formulary_index(FORMULARY_INDEX_DIR), top_n)
+        else:
+            lookup = partd_batch.api_lookup(get_partd_client())
+        progress = st.progress(0.0, text=f"0/{len(rows)} patients")
+
+        def on_result(result, done, total):
+            progress.progress(done / total, text=f"{done}/{total} patients (last: {result['patient']} {result['status']})")
+
+        out = io.StringIO()
+        counts = asyncio.run(partd_batch.run_batch(
+            rows, out, lookup, batch_concurrency, "gpt-4" if batch_summaries else None, on_result, OPENAI
+        ))
+        st.success(", ".join(f"{status}: {n}" for status, n in sorted(counts.items())))
+        st.download_button("Download Results CSV", out.getvalue(), file_name="partd_batch_results.csv",
+                           mime="text/csv", key="batch_download")
+
 # ------- End of MVP ------- #
 
 st.markdown("---")
@@ -1,17 +1,33 @@
+import os
 import streamlit as st
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import openai
 import datetime
 import time
+import note_metrics
+import lab_trends
+import ckd_staging
+import prompt_compress
+import multi_problem
+import generation_pool
+import note_segmenter
+import throughput_store
 
 # --------------------------
 # Configure the DeepSeek API using the beta endpoint and lower temperature
 # --------------------------
-openai.api_base = "https://api.deepseek.com/beta"
-openai.api_key = st.secrets.get("DEEPSEEK_API_KEY", "YOUR_API_KEY")
+# Passed with each request rather than set on the shared openai module
+DEEPSEEK = {
+    "api_base": os.environ.get("DEEPSEEK_API_BASE", "https://api.deepseek.com/beta"),
+    "api_key": st.secrets.get("DEEPSEEK_API_KEY", "YOUR_API_KEY"),
+}
 
 # --------------------------
 # Final Instruction for Note Generation
 # --------------------------
+# Sent as the system message: it is byte-identical for every visit, so the provider's prefix cache can serve
+# it, while the visit data (date first) follows in the user message.
 final_instruction = (
     "Generate a comprehensive narrative note in paragraph form, written in the style of a seasoned nephrologist at the end of the visit. "
     "The note should include a clear and succinct Subjective section summarizing the patient's history and current status, and an Assessment & Plan "
@@ -37,6 +53,8 @@ condition = st.sidebar.selectbox(
     key="condition"
 )
 
+note_metrics.render_metrics_panel()
+
 if st.sidebar.button("Reset Form"):
     st.session_state.clear()
     st.experimental_rerun()
@@ -46,7 +64,7 @@ st.header(f"{condition} Progress Note")
 # --------------------------
 # Choose between Structured Input and Free Text modes
 # --------------------------
-input_mode = st.radio("Select Input Mode", options=["Structured Input", "Free Text"], key="input_mode")
+input_mode = st.radio("Select Input Mode", options=["Structured Input", "Free Text", "Multi-Condition"], key="input_mode")
 
 if input_mode == "Structured Input":
     if condition == "CKD":
@@ -69,22 +87,30 @@ Subjective:
 Patient presents with the following symptoms: {symptoms}.
 Risk Factors: {risk_factors}.
 Additional Info: Diabetes Mellitus Status: {dm_status}, Hypertension Status: {htn_status}.
-Lab Data: {labs}.
+Lab Data: {lab_trends.compact_labs(labs)}.
 Additional Comments: {additional_details}.
 
 Assessment & Plan:
 {assessment_plan}
-
-{final_instruction}
             """
         else:
             reason_for_visit = st.text_input("Reason for Visit", "CKD Follow-Up", key="ckd_fu_reason")
             interval_history = st.text_area("Interval History", "Enter changes since last visit...", key="ckd_fu_interval")
-            ckd_stage = st.selectbox("CKD Stage", options=["1", "2", "3", "4", "5"], index=2, key="ckd_fu_stage")
+            # Labs come first so stage and trend can be derived from them (CKD-EPI 2021, KDIGO)
+            labs = st.text_area("Lab Data", "Enter updated lab data...", key="ckd_fu_labs",
+                                help="e.g. Cr 1.8 -> 2.1 over 6 months, UACR 450 fills in stage and trend")
+            age_col, sex_col = st.columns(2)
+            age = age_col.number_input("Age", min_value=18, max_value=110, value=65, key="ckd_fu_age")
+            sex = sex_col.selectbox("Sex", options=["Female", "Male"], key="ckd_fu_sex")
+            derived = ckd_staging.from_labs(labs, age, sex)
+            st.session_state.setdefault("ckd_fu_stage", "3")
+            ckd_staging.apply_to_widgets(st.session_state, derived, "ckd_fu_stage", "ckd_fu_trend", "ckd_fu_derived")
+            ckd_stage = st.selectbox("CKD Stage", options=["1", "2", "3", "4", "5"], key="ckd_fu_stage")
             kidney_trend = st.selectbox("Kidney Function Trend", options=["Improving", "Stable", "Worsening"], key="ckd_fu_trend")
+            if derived:
+                st.caption(f"From labs: {ckd_staging.describe(derived)}")
             dm_status = st.text_input("Diabetes Mellitus Status", "Controlled/Uncontrolled", key="ckd_fu_dm_status")
             htn_status = st.text_input("Hypertension Status", "Controlled/Uncontrolled", key="ckd_fu_htn_status")
-            labs = st.text_area("Lab Data", "Enter updated lab data...", key="ckd_fu_labs")
             assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan (integrate any medication changes)...", key="ckd_fu_ap")
             additional_details = st.text_area("Additional Comments (Optional)", "", key="ckd_fu_extra")
             
@@ -96,13 +122,11 @@ Reason for Visit: {reason_for_visit}
 Interval History: {interval_history}
 CKD Details: Stage: {ckd_stage}, Kidney Function Trend: {kidney_trend}.
 Additional Info: Diabetes Mellitus Status: {dm_status}, Hypertension Status: {htn_status}.
-Lab Data: {labs}.
+Lab Data: {lab_trends.compact_labs(labs)}.
 Additional Comments: {additional_details}.
 
 Assessment & Plan:
 {assessment_plan}
-
-{final_instruction}
             """
     else:
         if visit_type == "New Patient":
@@ -118,13 +142,11 @@ Reason for Visit: {reason_for_visit}
 
 Subjective:
 HPI: {hpi}.
-Lab Data: {labs}.
+Lab Data: {lab_trends.compact_labs(labs)}.
 Additional Comments: {additional_comments}.
 
 Assessment & Plan:
 {assessment_plan}
-
-{final_instruction}
             """
         else:
             reason_for_visit = st.text_input("Reason for Visit", f"{condition} Follow-Up", key=f"{condition}_fu_reason")
@@ -138,27 +160,58 @@ Visit Date: {datetime.date.today().strftime("%B %d, %Y")}
 Reason for Visit: {reason_for_visit}
 
 Interval History: {interval_history}
-Lab Data: {labs}.
+Lab Data: {lab_trends.compact_labs(labs)}.
 Additional Comments: {additional_comments}.
 
 Assessment & Plan:
 {assessment_plan}
-
-{final_instruction}
             """
+elif input_mode == "Multi-Condition":
+    # Shared history once; each condition's Assessment & Plan is its own concurrent request
+    prompt, multi_problems = multi_problem.render_form(
+        "multi", visit_type, datetime.date.today().strftime("%B %d, %Y"))
 else:
     # Free Text Mode
     free_text_input = st.text_area("Enter your note details in free text", "Type your note here...", key="free_text")
-    prompt = f"""
+    if st.checkbox("Split into structured fields", value=True, key="free_text_segment",
+                   help="Reason, history, labs, meds and A&P are detected locally and sent like Structured Input"):
+        segments = note_segmenter.segment(free_text_input)
+        prompt = note_segmenter.structured_prompt(segments, condition, visit_type,
+                                                  datetime.date.today().strftime("%B %d, %Y"))
+        st.caption("Detected: " + (", ".join(name for name in note_segmenter.SECTIONS if segments[name]) or "nothing"))
+    else:
+        prompt = f"""
 Visit Date: {datetime.date.today().strftime("%B %d, %Y")}
 
 {free_text_input}
-
-{final_instruction}
             """
 
+# Placeholder defaults, empty sections and repeated instructions are dropped before sending
+prompt, prompt_savings = prompt_compress.compress_with_stats(prompt)
+
 # Display the constructed prompt for review (for debugging)
 st.code(prompt, language="plaintext")
+st.caption(prompt_compress.describe(prompt_savings))
+
+# --------------------------
+# Throughput tracking: input time, generation latency and edit time of every note
+# --------------------------
+def note_generated(text, input_s, latency_s, caption=None, error=None):
+    """Record the note in the throughput store and keep it for editing across reruns."""
+    note_id = throughput_store.record_generation(
+        "app.py", condition, visit_type, input_mode, input_s, latency_s, len(text or ""),
+        session=generation_pool.current_session(), error=error,
+    )
+    if error is None:
+        st.session_state.generated_note = {"note_id": note_id, "finished": time.time(), "caption": caption}
+        st.session_state.final_note = text
+        # The next note's input time starts now; a failed attempt keeps the stamp so its retry is timed in full
+        st.session_state.start_time = time.time()
+
+def note_edited(kind="edit"):
+    generated = st.session_state.generated_note
+    throughput_store.record_edit(generated["note_id"], time.time() - generated["finished"],
+                                 len(st.session_state.final_note), kind)
 
 # --------------------------
 # Generate Note Button
@@ -169,17 +222,49 @@ if st.button("Generate Progress Note", key="generate_note"):
     else:
         elapsed = time.time() - st.session_state.start_time
         st.write(f"Time taken to input variables: {elapsed:.2f} seconds")
-        with st.spinner("Generating progress note..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=600,
-                    temperature=0.4,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Progress Note")
-                final_note = st.text_area("Final Note (Editable)", value=generated_note, height=300, key="final_note")
-                st.download_button("Download Note", data=final_note, file_name="progress_note.txt", mime="text/plain")
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        if input_mode == "Multi-Condition":
+            with st.spinner(f"Generating {len(multi_problems)} problems in parallel..."):
+                started = time.perf_counter()
+                subjective, results = multi_problem.generate(prompt, multi_problems, "app.py", DEEPSEEK)
+                wall_s = time.perf_counter() - started
+            for result in [subjective] + results:
+                if result["error"]:
+                    st.error(f"{result['stage']} failed: {result['error']}")
+            note_generated(multi_problem.stitch(prompt, subjective, results), elapsed, wall_s,
+                           caption=multi_problem.describe_timing(subjective, results, wall_s))
+        else:
+            # The prompt is assembled above on every rerun, so there is no build time to attribute here
+            timer = note_metrics.StageTimer("app.py", f"{condition} {visit_type} ({input_mode})", model="deepseek-chat")
+            timer.annotate(**prompt_savings)
+            timer.prompt_built()
+            started = time.perf_counter()
+            with st.spinner("Generating progress note..."):
+                try:
+                    with generation_pool.slot():
+                        timer.dispatched()
+                        response = openai.ChatCompletion.create(
+                            model="deepseek-chat",
+                            messages=[
+                                {"role": "system", "content": final_instruction},
+                                {"role": "user", "content": prompt},
+                            ],
+                            max_tokens=600,
+                            temperature=0.4,
+                            **DEEPSEEK,
+                        )
+                    timer.finished(response)
+                    note_generated(response.choices[0].message.content.strip(), elapsed,
+                                   time.perf_counter() - started)
+                except Exception as e:
+                    timer.failed(e)
+                    note_generated(None, elapsed, time.perf_counter() - started, error=str(e))
+                    st.error(f"API call failed: {e}")
+
+# The last generated note stays editable across reruns; edits and the download are timed
+if "generated_note" in st.session_state:
+    st.subheader("Generated Progress Note")
+    final_note = st.text_area("Final Note (Editable)", height=300, key="final_note", on_change=note_edited)
+    if st.session_state.generated_note["caption"]:
+        st.caption(st.session_state.generated_note["caption"])
+    st.download_button("Download Note", data=final_note, file_name="progress_note.txt", mime="text/plain",
+                       on_click=note_edited, args=("download",))
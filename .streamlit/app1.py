@@ -1,11 +1,21 @@
+import os
 import streamlit as st
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import openai
 import json
 import datetime
-
-# Configure the OpenAI SDK for DeepSeek (Beta Endpoint)
-openai.api_base = "https://api.deepseek.com/beta"  # Use the beta endpoint
-openai.api_key = st.secrets.get("DEEPSEEK_API_KEY", "")  # Ensure your API key is added in Streamlit secrets
+import note_metrics
+import lab_trends
+import hpi_prefetch
+import generation_pool
+import consult_prompts
+
+# DeepSeek (Beta Endpoint) credentials, passed with each request rather than set on the shared openai module
+DEEPSEEK = {
+    "api_base": os.environ.get("DEEPSEEK_API_BASE", "https://api.deepseek.com/beta"),  # Use the beta endpoint
+    "api_key": st.secrets.get("DEEPSEEK_API_KEY", ""),  # Ensure your API key is added in Streamlit secrets
+}
 
 # Initialize session state variables if not present
 if 'current_generated_note' not in st.session_state:
@@ -15,7 +25,51 @@ if 'current_soap_note' not in st.session_state:
 if 'dataset_entries' not in st.session_state:
     st.session_state.dataset_entries = []
 
+
+def chat(system, user, max_tokens, timer):
+    # Time spent waiting for a generation slot shows up as the stage's queue wait
+    with generation_pool.slot():
+        timer.dispatched()
+        return openai.ChatCompletion.create(
+            model="deepseek-chat",
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            max_tokens=max_tokens,
+            temperature=0.7,
+            **DEEPSEEK,
+        )
+
+
+def generate_hpi(inputs, stage="hpi"):
+    """HPI alone, so it can be prefetched while the Assessment & Plan is still being typed."""
+    timer = note_metrics.StageTimer("app1", stage, model="deepseek-chat")
+    prompt = f"""
+**Reason for Consultation:**
+{inputs['reason']}
+
+**Presenting Symptoms:**
+{inputs['symptoms']}
+
+**Clinical History & Context:**
+{inputs['context_history']}
+
+**Labs:**
+{inputs['labs']}
+"""
+    timer.prompt_built()
+    try:
+        response = chat(consult_prompts.HPI_SYSTEM, prompt, 500, timer)
+    except Exception as e:
+        timer.failed(e)
+        raise
+    timer.finished(response)
+    return response.choices[0].message.content.strip()
+
+
 st.title("AI Note Writer for Nephrology Consultations")
+note_metrics.render_metrics_panel()
+prefetch_enabled = hpi_prefetch.toggle()
+prefetcher = hpi_prefetch.session_prefetcher(
+    st.session_state, "app1", lambda inputs: generate_hpi(inputs, stage="hpi_prefetch"))
 
 ##############################################
 # Section 1: Generate Consultation Note
@@ -37,41 +91,55 @@ assessment_plan_input = st.text_area(
     height=150
 )
 
-if st.button("Generate Consultation Note"):
-    prompt = f"""
-Generate a comprehensive Epic consultation note in the style of a board-certified nephrologist using the following inputs:
+hpi_inputs = {"reason": reason, "symptoms": symptoms, "context_history": context_history,
+              "labs": lab_trends.compact_labs(labs)}
+if prefetch_enabled:
+    prefetcher.update(hpi_inputs)
+    st.caption(f"HPI prefetch: {prefetcher.status(hpi_inputs)}")
+else:
+    prefetcher.cancel()
 
+if st.button("Generate Consultation Note"):
+    if prefetch_enabled:
+        # The HPI comes from the prefetch (or is generated now); only the Assessment & Plan is left to wait for
+        with st.spinner("Generating Consultation Note..."):
+            hpi = prefetcher.get(hpi_inputs)
+            hpi_prefetched = hpi is not None
+            if not hpi_prefetched:
+                hpi = generate_hpi(hpi_inputs)
+            timer = note_metrics.StageTimer("app1", "assessment_plan", model="deepseek-chat")
+            timer.annotate(hpi_prefetched=hpi_prefetched)
+            prompt = f"""
 **Reason for Consultation:**
 {reason}
 
-**Presenting Symptoms:**
-{symptoms}
-
-**Clinical History & Context:**
-{context_history}
+**History of Present Illness (HPI):**
+{hpi}
 
 **Labs:**
-{labs}
+{hpi_inputs['labs']}
 
 **Assessment & Plan (Targeted):**
 {assessment_plan_input}
-
-Based on the above, generate a note that includes:
-1. **Reason for Consultation:** Restate the consultation reason.
-2. **History of Present Illness (HPI):** Provide a concise narrative summarizing the presenting symptoms, clinical history & context, and labs.
-3. **Assessment and Plan:** For each problem mentioned in the 'Assessment & Plan' input, elaborate a brief assessment using clinical details from the HPI and then integrate the corresponding targeted treatment options.
-Do not add any extra summary sections.
 """
-    with st.spinner("Generating Consultation Note..."):
-        response = openai.Completion.create(
-            model="deepseek-chat",
-            prompt=prompt,
-            max_tokens=1200,
-            temperature=0.7,
-        )
-        generated_note = response.choices[0].text.strip()
-        st.session_state.current_generated_note = generated_note
-        st.text_area("Consultation Note:", value=generated_note, height=400)
+            timer.prompt_built()
+            response = chat(consult_prompts.ASSESSMENT_SYSTEM, prompt, 800, timer)
+            timer.finished(response)
+            generated_note = (f"**Reason for Consultation:** {reason}\n\n"
+                              f"**History of Present Illness (HPI):**\n{hpi}\n\n"
+                              f"{response.choices[0].message.content.strip()}")
+            st.session_state.current_generated_note = generated_note
+            st.text_area("Consultation Note:", value=generated_note, height=400)
+    else:
+        timer = note_metrics.StageTimer("app1", "consult", model="deepseek-chat")
+        prompt = consult_prompts.consult_prompt(reason, symptoms, context_history, hpi_inputs['labs'], assessment_plan_input)
+        timer.prompt_built()
+        with st.spinner("Generating Consultation Note..."):
+            response = chat(consult_prompts.CONSULT_SYSTEM, prompt, 1200, timer)
+            timer.finished(response)
+            generated_note = response.choices[0].message.content.strip()
+            st.session_state.current_generated_note = generated_note
+            st.text_area("Consultation Note:", value=generated_note, height=400)
 
 ##############################################
 # Section 2: Generate SOAP Note from Consultation Note with Case Update
@@ -84,29 +152,13 @@ if st.button("Generate SOAP Note"):
     if not st.session_state.current_generated_note:
         st.error("Please generate a consultation note first.")
     else:
-        soap_prompt = f"""
-Using the following consultation note and case update, generate a SOAP note for a progress note in the style of a board-certified nephrologist.
-In the SOAP note:
-- **Subjective:** Provide a concise statement of the patient's current condition using the case update.
-- **Assessment and Plan:** Reflect the problem list and treatment options as provided in the consultation note.
-- **Objective:** Omit this section.
-
-Consultation Note:
-{st.session_state.current_generated_note}
-
-Case Update:
-{case_update}
-
-SOAP Note:
-"""
+        timer = note_metrics.StageTimer("app1", "soap", model="deepseek-chat")
+        prompt = consult_prompts.soap_prompt(st.session_state.current_generated_note, case_update)
+        timer.prompt_built()
         with st.spinner("Generating SOAP Note..."):
-            response = openai.Completion.create(
-                model="deepseek-chat",
-                prompt=soap_prompt,
-                max_tokens=800,
-                temperature=0.7,
-            )
-            soap_note = response.choices[0].text.strip()
+            response = chat(consult_prompts.SOAP_SYSTEM, prompt, 800, timer)
+            timer.finished(response)
+            soap_note = response.choices[0].message.content.strip()
             st.session_state.current_soap_note = soap_note
             st.text_area("SOAP Note:", value=soap_note, height=400)
 
@@ -1,13 +1,51 @@
 import streamlit as st
-import openai
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import boto3
-import json
+import os
 import datetime
+import difflib
 import tempfile
+import note_metrics
+import lab_trends
+import lab_series
+import note_sanitizer
+import prompt_compress
+import model_router
+import note_jobs
+import note_history
+import census
 
-# Configure OpenAI SDK for DeepSeek (Beta Endpoint)
-openai.api_base = "https://api.deepseek.com/beta"
-openai.api_key = st.secrets.get("DEEPSEEK_API_KEY", "")
+# Consult and follow-up notes are routed per task and fail over to OpenAI when DeepSeek is unhealthy
+router = model_router.get_router(st.secrets)
+
+# Generate a routed note as a background job: it streams through the note sanitizer, survives reruns and is
+# saved into the record it was generated for, even if another patient is selected by then
+def submit_note(task, prompt, max_tokens, timer, label, record, field, note_type):
+    def run(job):
+        pieces, route = router.stream(
+            task,
+            [{"role": "user", "content": prompt}],
+            "app_phase1", timer=timer,
+            max_tokens=max_tokens,
+            temperature=0.7,
+        )
+        raw, note = note_sanitizer.consume(pieces, prompt, on_text=lambda text: setattr(job, "partial", text))
+        # Streamed responses carry no usage block, so tokens are counted locally
+        prompt_tokens, tokenizer = prompt_compress.count_tokens(prompt)
+        route["timer"].annotate(token_count_source=tokenizer)
+        route["timer"].finished(prompt_tokens=prompt_tokens, completion_tokens=prompt_compress.count_tokens(raw)[0])
+        if route["backend"] != "deepseek":
+            job.caption = f"Generated by {route['backend']}/{route['model']} (failover)"
+        return note
+
+    def on_done(job):
+        record[field] = job.result
+        record["note_type"] = note_type
+        record["last_updated"] = str(datetime.datetime.now())
+
+    note_jobs.submit(f"{record['id']}: {label}", run, on_done, patient=record["id"], task=task)
+    st.success(f"{label} queued for patient {record['id']}; it is saved to the record when ready.")
 
 # S3 integration functions
 def get_s3_client():
@@ -19,19 +57,59 @@ def get_s3_client():
     )
     return s3
 
+def history_configured():
+    return bool(os.environ.get("NOTE_HISTORY_DIR")) or "BUCKET_NAME" in st.secrets
+
+def get_history_store():
+    # NOTE_HISTORY_DIR keeps the version history on local disk instead of S3 (development, offline use)
+    if os.environ.get("NOTE_HISTORY_DIR"):
+        return note_history.LocalStore(os.environ["NOTE_HISTORY_DIR"])
+    return note_history.S3Store(get_s3_client(), st.secrets["BUCKET_NAME"])
+
 def upload_patient_record_to_s3(record):
-    s3 = get_s3_client()
-    bucket = st.secrets["BUCKET_NAME"]
-    # Create a unique key for the record using patient ID and current timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
-    file_key = f"patients/{record['id']}_{timestamp}.json"
-    # Convert the record to JSON string
-    record_json = json.dumps(record)
-    # Upload the JSON string to S3
-    s3.put_object(Body=record_json, Bucket=bucket, Key=file_key)
-    st.success(f"Patient record saved to S3 with key: {file_key}")
-
-# Initialize or load patient data in session state
+    # Each save is a version in the patient's history: a full snapshot now and then, line deltas in between
+    store = get_history_store()
+    entry = note_history.save(store, record)
+    if entry is None:
+        st.info(f"No changes since the last saved version of patient {record['id']}.")
+    else:
+        census.record_saved(store, record, entry["saved_at"])
+        st.success(f"Patient record saved as version {entry['v']} ({entry['kind']}, {entry['size']} bytes)")
+
+def render_history(patient_id):
+    store = get_history_store()
+    entries = note_history.versions(store, patient_id)
+    if not entries:
+        return
+    with st.expander(f"Version History ({len(entries)} saved)"):
+        labels = {e["v"]: f"v{e['v']} - {e['saved_at']} - {e['note_type']}" for e in reversed(entries)}
+        version = st.selectbox("Version", list(labels), format_func=labels.get)
+        record = note_history.load(store, patient_id, version)
+        field = st.radio("Note", ["consultation_note", "soap_note"], horizontal=True, key=f"history_field_{patient_id}")
+        st.text_area("Saved note:", value=record.get(field, ""), height=300, disabled=True)
+        older = [e["v"] for e in entries if e["v"] < version]
+        if older:
+            previous = note_history.load(store, patient_id, older[-1])
+            diff = difflib.unified_diff(previous.get(field, "").splitlines(), record.get(field, "").splitlines(),
+                                        f"v{older[-1]}", f"v{version}", lineterm="")
+            st.code("\n".join(diff) or "No changes to this note", language="diff")
+
+def get_lab_store(record):
+    # One live store per patient; the record keeps its serialized form for S3
+    stores = st.session_state.setdefault("lab_stores", {})
+    if record["id"] not in stores:
+        stores[record["id"]] = lab_series.LabStore.from_dict(record.get("lab_series"))
+    return stores[record["id"]]
+
+# Initialize or load patient data in session state: the current census (patients saved in the last 48h) is
+# preloaded in parallel when record storage is configured
+if "patients" not in st.session_state and history_configured():
+    started = datetime.datetime.now()
+    census_records = census.preload(get_history_store())
+    if census_records:
+        elapsed_ms = (datetime.datetime.now() - started).total_seconds() * 1000
+        st.session_state.patients = census_records
+        st.session_state.census_note = f"Census: {len(census_records)} patients preloaded in {elapsed_ms:.0f} ms"
 if "patients" not in st.session_state:
     st.session_state.patients = [
         {
@@ -57,6 +135,8 @@ if "current_patient" not in st.session_state:
 
 # Sidebar: Active Patients List and Add New Patient
 st.sidebar.title("Active Patients")
+if "census_note" in st.session_state:
+    st.sidebar.caption(st.session_state.census_note)
 
 # Display active patient list
 patient_options = [
@@ -86,6 +166,9 @@ if st.sidebar.button("Add Patient"):
     else:
         st.sidebar.error("Please enter both Patient ID and Reason for Consult.")
 
+note_metrics.render_metrics_panel()
+model_router.render_panel(router)
+
 # Load the selected patient record
 if selected_patient:
     selected_id = selected_patient.split(" - ")[0]
@@ -95,6 +178,10 @@ if selected_patient:
     st.header(f"Patient {patient_record['id']} - {patient_record['note_type']}")
     st.write(f"**Reason for Consult:** {patient_record['reason']}")
     st.write(f"**Last Updated:** {patient_record.get('last_updated', 'N/A')}")
+    lab_store = get_lab_store(patient_record)
+    if lab_store.series:
+        with st.expander("Lab Trends"):
+            st.text(lab_store.summary())
 
     # Create tabs for Consultation Note, SOAP Note, and Follow-Up Update
     tab1, tab2, tab3 = st.tabs(["Consultation Note", "SOAP Note", "Follow-Up Update"])
@@ -117,6 +204,8 @@ if selected_patient:
             key="assessment"
         )
         if st.button("Generate Consultation Note"):
+            timer = note_metrics.StageTimer("app_phase1", "consult", model="deepseek-chat")
+            lab_store.add_text(labs)
             prompt = f"""
 Generate a comprehensive Epic consultation note in the style of a board-certified nephrologist using the following inputs:
 
@@ -130,7 +219,7 @@ Generate a comprehensive Epic consultation note in the style of a board-certifie
 {context_history}
 
 **Labs:**
-{labs}
+{lab_trends.compact_labs(labs)}
 
 **Assessment & Plan (Targeted):**
 {assessment_plan_input}
@@ -141,19 +230,10 @@ Based on the above, generate a note that includes:
 3. **Assessment and Plan:** For each problem mentioned in the 'Assessment & Plan' input, elaborate a brief assessment using clinical details from the HPI and then integrate the corresponding targeted treatment options.
 Do not add any extra summary sections.
 """
-            with st.spinner("Generating Consultation Note..."):
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=1200,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                patient_record["consultation_note"] = generated_note
-                patient_record["note_type"] = "Consult"
-                patient_record["last_updated"] = str(datetime.datetime.now())
-                st.success("Consultation note generated and saved!")
-                st.text_area("Consultation Note:", value=generated_note, height=400)
+            timer.prompt_built()
+            submit_note("consult", prompt, 1200, timer, "Consultation Note", patient_record, "consultation_note", "Consult")
+        if patient_record.get("consultation_note"):
+            st.text_area("Consultation Note:", value=patient_record["consultation_note"], height=400)
 
     with tab2:
         st.subheader("Generate SOAP Note")
@@ -162,6 +242,7 @@ Do not add any extra summary sections.
             if not patient_record.get("consultation_note"):
                 st.error("Please generate a consultation note first.")
             else:
+                timer = note_metrics.StageTimer("app_phase1", "soap", model="deepseek-chat")
                 soap_prompt = f"""
 Using the following consultation note and case update, generate a SOAP note for a progress note in the style of a board-certified nephrologist.
 In the SOAP note:
@@ -175,27 +256,25 @@ Consultation Note:
 Case Update:
 {case_update}
 
+Lab Trends:
+{lab_store.summary() or "None recorded"}
+
 SOAP Note:
 """
-                with st.spinner("Generating SOAP Note..."):
-                    response = openai.Completion.create(
-                        model="deepseek-chat",
-                        prompt=soap_prompt,
-                        max_tokens=800,
-                        temperature=0.7,
-                    )
-                    soap_note = response.choices[0].text.strip()
-                    patient_record["soap_note"] = soap_note
-                    patient_record["note_type"] = "Progress"
-                    patient_record["last_updated"] = str(datetime.datetime.now())
-                    st.success("SOAP note generated and saved!")
-                    st.text_area("SOAP Note:", value=soap_note, height=400)
+                timer.prompt_built()
+                submit_note("follow_up", soap_prompt, 800, timer, "SOAP Note", patient_record, "soap_note", "Progress")
+        if patient_record.get("soap_note"):
+            st.text_area("SOAP Note:", value=patient_record["soap_note"], height=400)
 
     with tab3:
         st.subheader("Generate Follow-Up Update")
         # Set height to 68 pixels instead of 50
         new_update = st.text_area("Enter New Update:", "Provide a one-liner update...", height=68, key="new_update")
+        new_labs = st.text_area("New Labs:", "", height=68, key="new_labs",
+                                help="Today's values (e.g., Cr 2.6, K 4.8) are added to the patient's lab trends")
         if st.button("Generate Follow-Up Note"):
+            timer = note_metrics.StageTimer("app_phase1", "follow_up", model="deepseek-chat")
+            lab_store.add_text(new_labs)
             if patient_record.get("soap_note"):
                 base_note = patient_record.get("soap_note")
             else:
@@ -209,23 +288,21 @@ Previous Note:
 New Update:
 {new_update}
 
+Lab Trends:
+{lab_store.summary() or "None recorded"}
+
 Generate an updated SOAP note that integrates the new subjective information with the existing assessment and plan.
 """
-            with st.spinner("Generating Follow-Up Note..."):
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=followup_prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                new_soap_note = response.choices[0].text.strip()
-                patient_record["soap_note"] = new_soap_note
-                patient_record["note_type"] = "Progress"
-                patient_record["last_updated"] = str(datetime.datetime.now())
-                st.success("Follow-Up note generated and saved!")
-                st.text_area("Updated Follow-Up SOAP Note:", value=new_soap_note, height=400)
+            timer.prompt_built()
+            submit_note("follow_up", followup_prompt, 800, timer, "Follow-Up Note", patient_record, "soap_note", "Progress")
+
+    # Notes generating in the background for any patient of this session
+    note_jobs.render_panel()
 
     # Button to save the patient record to S3 (persistent storage)
     if st.button("Save Patient Record to S3"):
+        patient_record["lab_series"] = lab_store.to_dict()
         upload_patient_record_to_s3(patient_record)
         st.json(patient_record)
+    if history_configured():
+        render_history(patient_record["id"])
@@ -1,38 +1,18 @@
 import streamlit as st
-import openai
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import json
+import note_metrics
+import lab_trends
+import hpi_prefetch
+import model_router
+import note_triggers
 
-# Configure OpenAI API
-openai.api_key = st.secrets["OPENAI_API_KEY"]
-
-# Define trigger descriptions
-TRIGGERS = {
-    "AKI workup": "Renal ultrasound, urine electrolytes (Na, Cl, Cr), quantify proteinuria",
-    "AIN workup": "Urine eosinophils",
-    "Proteinuria workup": "ANA, ANCA, SPEP, free light chain ratio, PLA2R",
-    "Screen for monoclonal gammopathy": "SPEP, free light chain ratio",
-    "Evaluate for infection-related GN": "C3, C4, quantify proteinuria, AIN workup (urine eosinophils)",
-    "Post renal AKI": "Bladder scan",
-    "Anemia of chronic disease workup": "Iron saturation, ferritin, transferrin saturation",
-    "Hypercalcemia workup": "PTH, vitamin D, calcitriol, SPEP, free light chain ratio, PTHrP, ACE level",
-    "Bone mineral disease": "Phosphorus, PTH",
-    "Hyponatremia workup": "Urine sodium, urine osmolality, TSH, cortisol (skip if already ordered)",
-    "HRS workup": "Urine sodium and creatinine to calculate FeNa",
-    "Start isotonic bicarbonate fluid": "D5W + 150 mEq sodium bicarbonate",
-    "Low chloride fluid": "Lactated Ringer's",
-    "Lokelma": "10 g daily",
-    "Start Bumex": "2 mg IV twice daily",
-    "Hyponatremia": "Target sodium correction 6-8 mEq/L, D5W ± DDAVP if rapid correction, serial sodium monitoring",
-    "Samsca protocol": "Tolvaptan 7.5 mg daily, serial sodium monitoring, liberalize water intake, monitor neurological status",
-    "Initiate CRRT": "CVVHDF @ 25 cc/kg/hr, UF 0-100 cc/hr, BMP q8h, daily phosphorus, dose meds to eGFR 25 mL/min",
-    "Start HD": "Discuss side effects: hypotension, cramps, chills, arrhythmias, death",
-    "Septic shock": "On antibiotics, pressor support",
-    "Hypoxic respiratory failure": "Intubated on mechanical ventilation",
-    "HRS management": "Albumin 25% 1 g/kg/day x48 h, Midodrine 10 mg TID, Octreotide 100 mcg BID, target SBP >= 110 mmHg"
-}
+# Extraction, HPI and the full note are routed per task, with failover to DeepSeek where the task allows it
+router = model_router.get_router(st.secrets)
 
-# Create the trigger list once
-TRIGGER_LIST = list(TRIGGERS.keys())
+# Trigger descriptions live in note_triggers so offline tools can score notes against them
+TRIGGER_LIST = note_triggers.TRIGGER_LIST
 
 # Modified extraction prompt to include lab interpretation
 EXTRACTOR_SYSTEM = """
@@ -103,8 +83,35 @@ extract_fn = {
     }
 }
 
+def generate_hpi(inputs, stage="hpi"):
+    """HPI stage; runs on the button press, or in the background when prefetch is on."""
+    timer = note_metrics.StageTimer("appopenAi", stage, model="gpt-4-0613")
+    hpi_content = f"""
+Context: {inputs['context']}
+Current Labs: {inputs['current_labs']}
+Trending Labs: {inputs['trending_labs']}
+"""
+    timer.prompt_built()
+    result = router.complete(
+        "hpi",
+        [
+            {"role": "system", "content": GENERATOR_SYSTEM},
+            {"role": "user", "content": hpi_content}
+        ],
+        "appopenAi", stage=stage, timer=timer,
+        temperature=0.7,
+        max_tokens=800
+    )
+    return result["text"]
+
+
 # Streamlit UI
 st.title("AI Note Writer for Nephrology Consultations")
+note_metrics.render_metrics_panel()
+model_router.render_panel(router)
+prefetch_enabled = hpi_prefetch.toggle()
+prefetcher = hpi_prefetch.session_prefetcher(
+    st.session_state, "appopenAi", lambda inputs: generate_hpi(inputs, stage="hpi_prefetch"))
 
 reason = st.text_input("Reason for Consultation:")
 
@@ -124,44 +131,50 @@ hpi_context = st.text_area("HPI Context:", height=100,
 assessment_plan = st.text_area("Assessment & Plan:", height=200,
                              help="Enter your assessment and plan with your preferred section headings")
 
+# Trends are computed locally so the prompt carries exact numbers instead of raw text to interpret
+prompt_current_labs = lab_trends.compact_labs(current_labs)
+prompt_trending_labs = lab_trends.compact_labs(trending_labs)
+hpi_inputs = {"context": hpi_context, "current_labs": prompt_current_labs, "trending_labs": prompt_trending_labs}
+if prefetch_enabled:
+    prefetcher.update(hpi_inputs)
+    st.caption(f"HPI prefetch: {prefetcher.status(hpi_inputs)}")
+else:
+    prefetcher.cancel()
+
 if st.button("Generate Consultation Note"):
+    if prompt_trending_labs != trending_labs or prompt_current_labs != current_labs:
+        with st.expander("Computed lab trends"):
+            st.text(f"{prompt_current_labs}\n{prompt_trending_labs}".strip())
+
     # 1) Extract sections and related triggers
     with st.spinner("Processing input..."):
-        resp1 = openai.ChatCompletion.create(
-            model="gpt-4-0613",
-            messages=[
+        result = router.complete(
+            "extraction",
+            [
                 {"role": "system", "content": EXTRACTOR_SYSTEM},
                 {"role": "user", "content": assessment_plan}
             ],
+            "appopenAi",
             functions=[extract_fn],
             function_call={"name": "extract_content"},
             temperature=0
         )
-        content = json.loads(resp1.choices[0].message.function_call.arguments)
+        content = json.loads(result["function_arguments"])
         sections = content["sections"]
 
-    # 2) Generate HPI with lab integration
+    # 2) Generate HPI with lab integration (already under way if prefetched with these inputs)
     with st.spinner("Generating HPI..."):
-        hpi_content = f"""
-Context: {hpi_context}
-Current Labs: {current_labs}
-Trending Labs: {trending_labs}
-"""
-        hpi_response = openai.ChatCompletion.create(
-            model="gpt-4-0613",
-            messages=[
-                {"role": "system", "content": GENERATOR_SYSTEM},
-                {"role": "user", "content": hpi_content}
-            ],
-            temperature=0.7,
-            max_tokens=800
-        )
-        generated_hpi = hpi_response.choices[0].message.content.strip()
+        generated_hpi = prefetcher.get(hpi_inputs) if prefetch_enabled else None
+        hpi_prefetched = generated_hpi is not None
+        if not hpi_prefetched:
+            generated_hpi = generate_hpi(hpi_inputs)
 
     # 3) Generate final note
     if not sections:
         st.error("No valid sections found. Please check your input.")
     else:
+        timer = note_metrics.StageTimer("appopenAi", "full_note", model="gpt-4-0613")
+        timer.annotate(hpi_prefetched=hpi_prefetched)
         sections_content = "\n\n".join(
             f"SECTION: {section['heading']}\n"
             f"CONTENT: {section['content']}\n"
@@ -172,23 +185,27 @@ Trending Labs: {trending_labs}
         user_content = (
             f"**Reason for Consultation:** {reason}\n\n"
             f"**HPI:** {generated_hpi}\n\n"
-            f"**Current Labs:** {current_labs}\n"
-            f"**Trending Labs:** {trending_labs}\n\n"
+            f"**Current Labs:** {prompt_current_labs}\n"
+            f"**Trending Labs:** {prompt_trending_labs}\n\n"
             f"**Assessment & Plan Sections:**\n{sections_content}\n\n"
             f"**Original Text:**\n{assessment_plan}"
         )
 
+        timer.prompt_built()
         with st.spinner("Generating comprehensive note..."):
-            resp2 = openai.ChatCompletion.create(
-                model="gpt-4-0613",
-                messages=[
+            result = router.complete(
+                "full_note",
+                [
                     {"role": "system", "content": GENERATOR_SYSTEM},
                     {"role": "user", "content": user_content}
                 ],
+                "appopenAi", timer=timer,
                 temperature=0.7,
                 max_tokens=1500
             )
-            note = resp2.choices[0].message.content.strip()
+            note = result["text"]
 
         st.subheader("Consultation Note")
         st.markdown(note)
+        st.caption(f"Generated by {result['backend']}/{result['model']}"
+                   + (f" after {len(result['attempts'])} failed attempt(s)" if result["attempts"] else ""))
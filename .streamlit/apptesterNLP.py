@@ -1,13 +1,21 @@
 import streamlit as st
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import openai
 import json
 import datetime
+import os
+import note_metrics
+import generation_pool
 
 # Secure your API key in .streamlit/secrets.toml:
 # OPENAI_API_KEY = "your_api_key_here"
 
 # Configure OpenAI API
-openai.api_key = st.secrets["OPENAI_API_KEY"]
+OPENAI = {
+    "api_base": os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1"),
+    "api_key": st.secrets["OPENAI_API_KEY"],
+}
 
 # System prompt for note formatting, lab integration, diagnostic & therapeutic triggers
 SYSTEM_PROMPT = """
@@ -63,6 +71,7 @@ if 'current_note' not in st.session_state:
     st.session_state.current_note = ""
 
 st.title("AI Note Writer for Nephrology Consultations")
+note_metrics.render_metrics_panel()
 
 # Section 1: Generate Consultation Note
 st.header("1. Generate Consultation Note")
@@ -96,13 +105,16 @@ ap_shorthand = st.text_area(
 )
 
 if st.button("Generate Consultation Note"):
+    timer = note_metrics.StageTimer("apptesterNLP", "consult", model="gpt-4")
     user_input = (
         f"**Reason for Consultation:** {reason}\n\n"
         f"**HPI:** {hpi}\n\n"
         f"**Labs:** {labs}\n\n"
         f"**Assessment & Plan:**\n{ap_shorthand}"
     )
-    with st.spinner("Generating Note..."):
+    timer.prompt_built()
+    with st.spinner("Generating Note..."), generation_pool.slot():
+        timer.dispatched()
         response = openai.ChatCompletion.create(
             model="gpt-4",
             messages=[
@@ -111,7 +123,9 @@ if st.button("Generate Consultation Note"):
             ],
             max_tokens=1200,
             temperature=0.7,
+            **OPENAI,
         )
+        timer.finished(response)
     st.session_state.current_note = response.choices[0].message.content.strip()
 
 # Display generated note
@@ -0,0 +1,226 @@
+"""
+Service/date partitioned patient records with a per-day census manifest.
+
+Flat keys (patients/<id>_<timestamp>.json) made finding a shift's patients a
+scan of the whole prefix. Records are now laid out by service and day, and
+every save also updates that day's census manifest:
+
+    census/<service>/<YYYY-MM-DD>.json               id -> reason, note type, saved_at, where the record is
+    patients/<service>/<YYYY-MM-DD>/<id>_<ts>.json   full records (hugging_face.py)
+    patients/<service>/latest/<id>.json              the patient's newest census entry, whatever its age
+    history/<id>/...                                 version history (note_history, app_phase1.py)
+
+preload() reads the manifests of the last CENSUS_WINDOW_HOURS (default 48,
+i.e. today's and yesterday's) and fetches every listed record concurrently
+(CENSUS_PRELOAD_WORKERS threads, default 16) into a process-wide cache, so
+opening the app costs a couple of manifest reads plus parallel GETs, and
+records that have not changed since another session loaded them are not
+fetched again. find_latest() reads a patient seen before the window through
+the latest pointer. PATIENT_SERVICE names the service (default "nephrology").
+Manifest updates are serialized within the process; concurrent saves from
+separate processes on the same day can race, and the next save of the
+patient restores the entry.
+
+    python .streamlit/census.py migrate --dir ./history_store [--delete]
+    python .streamlit/census.py show --dir ./history_store
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import copy
+import datetime
+import json
+import os
+import threading
+
+import note_history
+
+SERVICE = os.environ.get("PATIENT_SERVICE", "nephrology")
+WINDOW_HOURS = float(os.environ.get("CENSUS_WINDOW_HOURS", "48"))
+WORKERS = int(os.environ.get("CENSUS_PRELOAD_WORKERS", "16"))
+
+_RECORDS = {}  # (service, id) -> (saved_at, record)
+_RECORDS_LOCK = threading.Lock()
+_MANIFEST_LOCKS = collections.defaultdict(threading.Lock)
+
+
+def manifest_key(service, day):
+    return f"census/{service}/{day}.json"
+
+
+def record_key(service, record_id, when):
+    return f"patients/{service}/{when:%Y-%m-%d}/{record_id}_{when:%Y%m%dT%H%M%S}.json"
+
+
+def latest_key(service, record_id):
+    return f"patients/{service}/latest/{record_id}.json"
+
+
+def read_manifest(store, service, day):
+    data = store.get(manifest_key(service, day))
+    return json.loads(data) if data else {}
+
+
+def record_saved(store, record, saved_at, key=None, service=None):
+    """
+    List a saved record in the census of the day it was saved: key for a full record object, None when it
+    was saved to the patient's version history.
+    """
+    service = service or record.get("service") or SERVICE
+    day = saved_at[:10]
+    entry = {"reason": record.get("reason"), "note_type": record.get("note_type"), "saved_at": saved_at}
+    if key:
+        entry["key"] = key
+    with _MANIFEST_LOCKS[(service, day)]:
+        manifest = read_manifest(store, service, day)
+        # A newer save of this patient may be listed already (migration)
+        if manifest.get(record["id"], {}).get("saved_at", "") <= saved_at:
+            manifest[record["id"]] = entry
+            store.put(manifest_key(service, day), json.dumps(manifest, indent=1).encode("utf-8"))
+    with _MANIFEST_LOCKS[(service, "latest", record["id"])]:
+        pointer = store.get(latest_key(service, record["id"]))
+        if not pointer or json.loads(pointer)["saved_at"] <= saved_at:
+            store.put(latest_key(service, record["id"]), json.dumps(entry).encode("utf-8"))
+
+
+def save_record(store, record, when=None, service=None):
+    """Save a full record under its service/day partition and list it in the census. Returns the key."""
+    service = service or record.get("service") or SERVICE
+    when = when or datetime.datetime.now()
+    key = record_key(service, record["id"], when)
+    store.put(key, json.dumps(record).encode("utf-8"))
+    record_saved(store, record, when.isoformat(timespec="seconds"), key, service)
+    return key
+
+
+def census(store, service=None, hours=WINDOW_HOURS, now=None):
+    """id -> newest manifest entry for the patients saved within the window, reading the manifests in parallel."""
+    service = service or SERVICE
+    now = now or datetime.datetime.now()
+    since = (now - datetime.timedelta(hours=hours)).isoformat(timespec="seconds")
+    days = []
+    day = now.date()
+    while day.isoformat() >= since[:10]:
+        days.append(day.isoformat())
+        day -= datetime.timedelta(days=1)
+    with concurrent.futures.ThreadPoolExecutor(min(len(days), WORKERS)) as pool:
+        manifests = list(pool.map(lambda d: read_manifest(store, service, d), days))
+    entries = {}
+    for manifest in manifests:
+        for record_id, entry in manifest.items():
+            if entry["saved_at"] >= since and entry["saved_at"] > entries.get(record_id, {}).get("saved_at", ""):
+                entries[record_id] = entry
+    return entries
+
+
+def _fetch(store, service, record_id, entry):
+    with _RECORDS_LOCK:
+        cached = _RECORDS.get((service, record_id))
+    if cached and cached[0] == entry["saved_at"]:
+        return cached[1]
+    if "key" in entry:
+        record = json.loads(store.get(entry["key"]))
+    else:
+        record = note_history.load(store, record_id)
+    with _RECORDS_LOCK:
+        _RECORDS[(service, record_id)] = (entry["saved_at"], record)
+    return record
+
+
+def preload(store, service=None, hours=WINDOW_HOURS, now=None):
+    """The latest record of every patient in the census window, fetched concurrently; private copies, by id."""
+    service = service or SERVICE
+    entries = census(store, service, hours, now)
+    if not entries:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(min(len(entries), WORKERS)) as pool:
+        records = pool.map(lambda item: _fetch(store, service, *item), sorted(entries.items()))
+        return [copy.deepcopy(record) for record in records if record is not None]
+
+
+def find_latest(store, patient_id, service=None, hours=WINDOW_HOURS):
+    """
+    A patient's latest record: from the census window, else through the patient's latest pointer. Records
+    saved before pointers existed are found by listing the service partitions, the version history and the
+    legacy flat keys, in that order.
+    """
+    service = service or SERVICE
+    entry = census(store, service, hours).get(patient_id)
+    if not entry:
+        pointer = store.get(latest_key(service, patient_id))
+        entry = json.loads(pointer) if pointer else None
+    if entry:
+        return copy.deepcopy(_fetch(store, service, patient_id, entry))
+    partitioned = sorted((k for k in store.list(f"patients/{service}/")
+                          if k.rsplit("/", 1)[-1].rsplit("_", 1)[0] == patient_id and "/latest/" not in k),
+                         key=lambda k: k.rsplit("_", 1)[-1])
+    if partitioned:
+        return json.loads(store.get(partitioned[-1]))
+    if note_history.versions(store, patient_id):
+        return note_history.load(store, patient_id)
+    keys = sorted(k for k in store.list(f"patients/{patient_id}_") if k.endswith(".json"))
+    return json.loads(store.get(keys[-1])) if keys else None
+
+
+def _legacy_time(key):
+    # patients/<id>_<%Y%m%dT%H%M%S>.json
+    stamp = key.rsplit("_", 1)[-1][:-len(".json")]
+    return datetime.datetime.strptime(stamp, "%Y%m%dT%H%M%S")
+
+
+def migrate(store, service=None, delete=False, log=print):
+    """
+    Move flat patients/<id>_<ts>.json records into the service/day layout and list every record, and every
+    patient with a version history, in the census of the day it was saved and in the patient's latest
+    pointer. Safe to run again.
+    """
+    service = service or SERVICE
+    moved = 0
+    for key in store.list("patients/"):
+        name = key[len("patients/"):]
+        if "/" in name or not name.endswith(".json"):
+            continue  # partitioned already
+        record = json.loads(store.get(key))
+        when = _legacy_time(key)
+        new_key = save_record(store, record, when, record.get("service") or service)
+        if delete:
+            store.delete(key)
+        log(f"{key} -> {new_key}")
+        moved += 1
+    listed = 0
+    for record_id in note_history.patients(store):
+        entries = note_history.versions(store, record_id)
+        record = note_history.load(store, record_id)
+        record_saved(store, record, entries[-1]["saved_at"], service=record.get("service") or service)
+        listed += 1
+    log(f"Moved {moved} records, listed {listed} version histories")
+    return moved, listed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Census manifests and the partitioned record layout")
+    parser.add_argument("command", choices=["show", "migrate"])
+    parser.add_argument("--service", default=SERVICE)
+    parser.add_argument("--hours", type=float, default=WINDOW_HOURS)
+    parser.add_argument("--delete", action="store_true", help="remove the flat keys after copying them")
+    parser.add_argument("--dir", help="local store directory (default: S3 bucket from BUCKET_NAME)")
+    args = parser.parse_args()
+
+    if args.dir:
+        store = note_history.LocalStore(args.dir)
+    else:
+        import boto3
+
+        store = note_history.S3Store(boto3.client("s3"), os.environ["BUCKET_NAME"])
+
+    if args.command == "migrate":
+        migrate(store, args.service, args.delete)
+    else:
+        for record_id, entry in sorted(census(store, args.service, args.hours).items()):
+            print(f"{record_id:10} {entry['saved_at']}  {entry['note_type']:9} {entry['reason']}  "
+                  f"{entry.get('key', 'history')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Vectorized eGFR and CKD staging.
+
+CKD-EPI 2021 (race-free) creatinine and creatinine-cystatin C equations,
+KDIGO G and A categories and an eGFR trend classification. Every function
+takes scalars or NumPy arrays, so one visit and a whole clinic panel go
+through the same code.
+
+    python .streamlit/ckd_staging.py panel.csv staged.csv
+
+panel.csv columns: patient, age, sex, creatinine, and optionally cystatin_c,
+uacr, prior_creatinine and months_between (months since the prior value).
+"""
+
+import argparse
+import csv
+
+import numpy as np
+
+import lab_trends
+
+G_BOUNDS = np.array([15, 30, 45, 60, 90])
+G_LABELS = np.array(["G5", "G4", "G3b", "G3a", "G2", "G1"])
+# Clinic stage selectboxes use 1-5 with G3a/G3b both "3"
+STAGE_LABELS = np.array(["5", "4", "3", "3", "2", "1"])
+A_BOUNDS = np.array([30, 300])
+A_LABELS = np.array(["A1", "A2", "A3"])
+# KDIGO: a sustained change of 5 mL/min/1.73m2 per year, or a 25% change, is a real trend
+RAPID_SLOPE = 5.0
+CERTAIN_DRIFT = 0.25
+
+
+def _female(sex):
+    sex = np.asarray(sex)
+    if sex.dtype.kind == "b":
+        return sex
+    return np.char.lower(np.char.strip(sex.astype(str))).astype("U1") == "f"
+
+
+def egfr_cr(scr, age, sex):
+    """CKD-EPI 2021 creatinine equation (mg/dL, years) -> mL/min/1.73m2."""
+    scr = np.asarray(scr, dtype=float)
+    age = np.asarray(age, dtype=float)
+    female = _female(sex)
+    kappa = np.where(female, 0.7, 0.9)
+    alpha = np.where(female, -0.241, -0.302)
+    ratio = scr / kappa
+    return (142 * np.minimum(ratio, 1) ** alpha * np.maximum(ratio, 1) ** -1.200
+            * 0.9938 ** age * np.where(female, 1.012, 1.0))
+
+
+def egfr_cr_cys(scr, scys, age, sex):
+    """CKD-EPI 2021 creatinine-cystatin C equation (mg/dL, mg/L, years) -> mL/min/1.73m2."""
+    scr = np.asarray(scr, dtype=float)
+    scys = np.asarray(scys, dtype=float)
+    age = np.asarray(age, dtype=float)
+    female = _female(sex)
+    kappa = np.where(female, 0.7, 0.9)
+    alpha = np.where(female, -0.219, -0.144)
+    ratio = scr / kappa
+    cys = scys / 0.8
+    return (135 * np.minimum(ratio, 1) ** alpha * np.maximum(ratio, 1) ** -0.544
+            * np.minimum(cys, 1) ** -0.323 * np.maximum(cys, 1) ** -0.778
+            * 0.9961 ** age * np.where(female, 0.963, 1.0))
+
+
+def _g_index(egfr):
+    return np.searchsorted(G_BOUNDS, np.asarray(egfr, dtype=float), side="right")
+
+
+def g_category(egfr):
+    return G_LABELS[_g_index(egfr)]
+
+
+def clinic_stage(egfr):
+    return STAGE_LABELS[_g_index(egfr)]
+
+
+def a_category(uacr):
+    """KDIGO albuminuria category from UACR in mg/g; "" where UACR is missing."""
+    uacr = np.asarray(uacr, dtype=float)
+    # A1 < 30, A2 30-300 (both ends included), A3 > 300
+    with np.errstate(invalid="ignore"):
+        labels = A_LABELS[(uacr >= A_BOUNDS[0]).astype(int) + (uacr > A_BOUNDS[1])]
+    return np.where(np.isnan(uacr), "", labels)
+
+
+def classify_trend(egfr_before, egfr_now, years=None):
+    """Improving / Stable / Worsening from two eGFRs, using the annual slope when the interval is known."""
+    before = np.asarray(egfr_before, dtype=float)
+    now = np.asarray(egfr_now, dtype=float)
+    change = (now - before) / before
+    worse = change <= -CERTAIN_DRIFT
+    better = change >= CERTAIN_DRIFT
+    if years is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (now - before) / np.asarray(years, dtype=float)
+        worse |= np.nan_to_num(slope) <= -RAPID_SLOPE
+        better |= np.nan_to_num(slope) >= RAPID_SLOPE
+    return np.where(worse, "Worsening", np.where(better, "Improving", "Stable"))
+
+
+def stage_panel(scr, age, sex, scys=None, uacr=None, prior_scr=None, years=None):
+    """Stage every patient at once; returns a dict of equal-length arrays."""
+    scr = np.atleast_1d(np.asarray(scr, dtype=float))
+    egfr = egfr_cr(scr, age, sex)
+    if scys is not None:
+        scys = np.atleast_1d(np.asarray(scys, dtype=float))
+        egfr = np.where(np.isnan(scys), egfr, egfr_cr_cys(scr, scys, age, sex))
+    result = {
+        "egfr": egfr,
+        "g_category": g_category(egfr),
+        "a_category": a_category(uacr) if uacr is not None else np.full(len(scr), ""),
+        "ckd_stage": clinic_stage(egfr),
+        "trend": np.full(len(scr), ""),
+    }
+    if prior_scr is not None:
+        prior_scr = np.atleast_1d(np.asarray(prior_scr, dtype=float))
+        trend = classify_trend(egfr_cr(prior_scr, age, sex), egfr, years)
+        result["trend"] = np.where(np.isnan(prior_scr), "", trend)
+    return result
+
+
+def from_labs(labs, age, sex):
+    """
+    Derive stage and trend for one visit from free-text labs ("Cr 1.8 -> 2.1 over 6 months, UACR 450").
+    Returns None when the labs carry neither creatinine nor eGFR.
+    """
+    series = {s["analyte"]: s for s in lab_trends.parse_labs(labs)[0]}
+    if "Cr" in series:
+        # The trend compares like with like (creatinine-only eGFRs); cystatin C refines only the current value
+        egfrs = egfr_cr(series["Cr"]["values"], age, sex)
+        current = egfrs[-1]
+        source = "CKD-EPI 2021"
+        if "CysC" in series:
+            current = egfr_cr_cys(series["Cr"]["values"][-1], series["CysC"]["values"][-1], age, sex)
+            source = "CKD-EPI 2021 cr-cys"
+        span = series["Cr"]["span_hours"]
+    elif "eGFR" in series:
+        egfrs = series["eGFR"]["values"]
+        current = egfrs[-1]
+        source = "reported"
+        span = series["eGFR"]["span_hours"]
+    else:
+        return None
+    derived = {
+        "egfr": float(current),
+        "source": source,
+        "g_category": str(g_category(current)),
+        "a_category": str(a_category(series["UACR"]["values"][-1])) if "UACR" in series else "",
+        "ckd_stage": str(clinic_stage(current)),
+        "trend": None,
+    }
+    if len(egfrs) > 1:
+        years = span / (24 * 365.25) if span else None
+        derived["trend"] = str(classify_trend(egfrs[0], egfrs[-1], years))
+    return derived
+
+
+def describe(derived):
+    label = f"eGFR {derived['egfr']:.0f} ({derived['source']}), {derived['g_category']}{derived['a_category']}"
+    return label + (f", {derived['trend'].lower()}" if derived["trend"] else "")
+
+
+def apply_to_widgets(state, derived, stage_key, trend_key, marker_key):
+    """
+    Pre-set the stage and trend selectboxes from derived values. Call before the widgets are created.
+    Values are only written when the derivation changes, so a manual override sticks until the labs change.
+    """
+    if derived is None:
+        return
+    marker = (derived["ckd_stage"], derived["trend"])
+    if state.get(marker_key) == marker:
+        return
+    state[marker_key] = marker
+    state[stage_key] = derived["ckd_stage"]
+    if derived["trend"]:
+        state[trend_key] = derived["trend"]
+
+
+def _column(rows, name):
+    return np.array([float(r[name]) if r.get(name) not in (None, "") else np.nan for r in rows])
+
+
+def stage_csv(in_path, out_path):
+    with open(in_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    names = rows[0].keys() if rows else []
+    months = _column(rows, "months_between") if "months_between" in names else None
+    result = stage_panel(
+        _column(rows, "creatinine"), _column(rows, "age"), [r["sex"] for r in rows],
+        scys=_column(rows, "cystatin_c") if "cystatin_c" in names else None,
+        uacr=_column(rows, "uacr") if "uacr" in names else None,
+        prior_scr=_column(rows, "prior_creatinine") if "prior_creatinine" in names else None,
+        years=months / 12 if months is not None else None,
+    )
+    fields = list(names) + ["egfr", "g_category", "a_category", "ckd_stage", "trend"]
+    with open(out_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for i, r in enumerate(rows):
+            writer.writerow({**r, "egfr": f"{result['egfr'][i]:.1f}", "g_category": result["g_category"][i],
+                             "a_category": result["a_category"][i], "ckd_stage": result["ckd_stage"][i],
+                             "trend": result["trend"][i]})
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-stage a clinic panel with CKD-EPI 2021 and KDIGO categories")
+    parser.add_argument("panel_csv")
+    parser.add_argument("output_csv")
+    args = parser.parse_args()
+    print(f"Staged {stage_csv(args.panel_csv, args.output_csv)} patients into {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Prompts for the consultation and SOAP notes in app1.py.
+
+Kept outside the app so benchmarks/replay_eval.py replays saved dataset
+entries through exactly the prompts the app sends; edit them here and replay
+before shipping a change.
+"""
+
+# Static instructions go in the system message, byte-identical on every request, so the provider's prefix
+# cache can serve them; the patient inputs follow in the user message.
+CONSULT_SYSTEM = """Generate a comprehensive Epic consultation note in the style of a board-certified nephrologist using the inputs provided. The note includes:
+1. **Reason for Consultation:** Restate the consultation reason.
+2. **History of Present Illness (HPI):** Provide a concise narrative summarizing the presenting symptoms, clinical history & context, and labs.
+3. **Assessment and Plan:** For each problem mentioned in the 'Assessment & Plan' input, elaborate a brief assessment using clinical details from the HPI and then integrate the corresponding targeted treatment options.
+Do not add any extra summary sections."""
+
+HPI_SYSTEM = """Write the History of Present Illness (HPI) of an Epic consultation note in the style of a board-certified nephrologist: a concise narrative summarizing the presenting symptoms, clinical history & context, and labs provided. Return only the HPI narrative."""
+
+ASSESSMENT_SYSTEM = """Generate the Assessment and Plan of an Epic consultation note in the style of a board-certified nephrologist using the inputs provided. For each problem mentioned in the 'Assessment & Plan' input, elaborate a brief assessment using clinical details from the HPI and then integrate the corresponding targeted treatment options.
+Return only the **Assessment and Plan:** section. Do not add any extra summary sections."""
+
+SOAP_SYSTEM = """Using the consultation note and case update provided, generate a SOAP note for a progress note in the style of a board-certified nephrologist.
+In the SOAP note:
+- **Subjective:** Provide a concise statement of the patient's current condition using the case update.
+- **Assessment and Plan:** Reflect the problem list and treatment options as provided in the consultation note.
+- **Objective:** Omit this section."""
+
+
+def consult_prompt(reason, symptoms, context_history, labs, assessment_plan):
+    return f"""
+**Reason for Consultation:**
+{reason}
+
+**Presenting Symptoms:**
+{symptoms}
+
+**Clinical History & Context:**
+{context_history}
+
+**Labs:**
+{labs}
+
+**Assessment & Plan (Targeted):**
+{assessment_plan}
+"""
+
+
+def soap_prompt(consultation_note, case_update):
+    return f"""
+Consultation Note:
+{consultation_note}
+
+Case Update:
+{case_update}
+
+SOAP Note:
+"""
@@ -0,0 +1,232 @@
+"""
+Local medication-name normalization.
+
+Maps free-text medication entries ("Lisinopril 10mg", "lisinoprl", "Eliquis
+5 mg BID") to a canonical ingredient plus strength using the bundled
+RxNorm-style term file (data/rxnorm_ingredients.tsv: term, term type,
+ingredient). Lookups try an exact match first, then an exact match with salt
+and release-form words removed, then a trigram-filtered search by edit distance, so a
+typo costs microseconds instead of a failed plan lookup and a retry. The fuzzy
+step only accepts a single edit on a long name with one unambiguous closest
+term: at two or three edits, real drugs turn into other real drugs
+(prednisolone -> prednisone, nicardipine -> nifedipine), so anything further
+away stays unrecognized.
+
+    python .streamlit/drug_names.py "Lisinopril 10mg" "amlodipin 5 mg" eliquis
+    python .streamlit/drug_names.py --bench
+"""
+
+import argparse
+import functools
+import os
+import re
+import time
+
+DRUG_NAMES_FILE = os.environ.get(
+    "DRUG_NAMES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rxnorm_ingredients.tsv")
+)
+
+STRENGTH_RE = re.compile(
+    r"(\d+(?:\.\d+)?(?:\s*-\s*\d+(?:\.\d+)?)*)\s*(mg|mcg|µg|g|units?|iu|meq|ml|%)(?:\s*/\s*(\d+(?:\.\d+)?)?\s*(ml|l|hr|h|dose|act))?\b",
+    re.IGNORECASE,
+)
+# Dose forms, routes, frequencies and release forms that never change the ingredient
+NOISE_WORDS = {
+    "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules", "oral", "po", "iv", "sq", "subq",
+    "inj", "injection", "solution", "pen", "daily", "qd", "qday", "bid", "tid", "qid", "qhs", "hs", "prn",
+    "weekly", "ds", "er", "xl", "xr", "sr", "dr", "la", "ec", "od", "once", "twice", "a", "day", "x",
+}
+SALT_WORDS = {"hcl", "hydrochloride", "sodium", "potassium", "calcium", "succinate", "tartrate", "besylate",
+              "mesylate", "maleate", "fumarate", "acetate", "carbonate", "citrate", "sulfate", "magnesium"}
+
+
+def _clean(text):
+    # Combination products match whether written "a / b", "a-b" or "a b"
+    text = re.sub(r"[^a-z0-9%. ]+", " ", text.lower().replace("µ", "mc"))
+    return " ".join(w for w in text.split() if w not in NOISE_WORDS)
+
+
+def parse_strength(text):
+    """Return (text without strength, normalized strength or None)."""
+    m = STRENGTH_RE.search(text)
+    if not m:
+        return text, None
+    amount, unit, per_amount, per_unit = m.groups()
+    unit = unit.lower().replace("µg", "mcg")
+    unit = "units" if unit.startswith("unit") or unit == "iu" else unit
+    strength = "-".join(f"{float(a):g}" for a in amount.split("-")) + f" {unit}"
+    if per_unit:
+        strength += f"/{per_amount + ' ' if per_amount else ''}{per_unit.lower()}"
+    return (text[:m.start()] + " " + text[m.end():]).strip(), strength
+
+
+def levenshtein(a, b, limit=None):
+    """Edit distance; with a limit, stops early and returns limit + 1 once it is exceeded."""
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_distance(term):
+    # One typo on a long name; short names and more edits collide with other drugs ("asa", terazosin -> prazosin)
+    return 0 if len(term) < 8 else 1
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted trigram index; only terms sharing enough trigrams with the query get an edit-distance check."""
+
+    def __init__(self, words=()):
+        self.postings = {}
+        self.grams = {}
+        for word in words:
+            self.grams[word] = trigrams(word)
+            for gram in self.grams[word]:
+                self.postings.setdefault(gram, []).append(word)
+
+    def search(self, word, limit):
+        """Return [(distance, term)] within limit, closest first."""
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for term in self.postings.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        found = []
+        for term, count in shared.items():
+            # Each edit destroys at most 3 trigrams, so fewer shared trigrams than this rules the term out
+            if count < max(len(grams), len(self.grams[term])) - 3 * limit:
+                continue
+            d = levenshtein(word, term, limit)
+            if d <= limit:
+                found.append((d, term))
+        return sorted(found)
+
+
+class DrugNameIndex:
+    def __init__(self, path=DRUG_NAMES_FILE):
+        self.terms = {}  # term -> ingredient
+        self.term_types = {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                term, tty, ingredient = line.rstrip("\n").split("\t")
+                key = _clean(term)
+                self.terms[key] = ingredient
+                self.term_types[key] = tty
+        self.ingredients = set(self.terms.values())
+        self.fuzzy = TrigramIndex(self.terms)
+
+    @functools.lru_cache(maxsize=4096)
+    def normalize(self, text, fuzzy=True):
+        """Return {"input", "ingredient", "strength", "term", "distance"}; ingredient is None if unknown.
+
+        With fuzzy=False only exact terms (after salt and noise words are removed) match.
+        """
+        name, strength = parse_strength(text or "")
+        key = _clean(name)
+        result = {"input": text, "ingredient": None, "strength": strength, "term": None, "distance": None}
+        if not key:
+            return result
+        for candidate in (key, " ".join(w for w in key.split() if w not in SALT_WORDS)):
+            if candidate in self.terms:
+                result.update(ingredient=self.terms[candidate], term=candidate, distance=0)
+                return result
+        matches = self.fuzzy.search(key, max_distance(key)) if fuzzy else []
+        if matches:
+            distance, term = matches[0]
+            # Two different drugs equally close is a guess, not a typo correction
+            if not any(d == distance and self.terms[t] != self.terms[term] for d, t in matches[1:]):
+                result.update(ingredient=self.terms[term], term=term, distance=distance)
+                return result
+        parts = [p for p in re.split(r"[-/+]| and ", name) if p.strip()]
+        if len(parts) == 1:
+            # "losartan hctz": the same combination written with spaces only
+            parts = [w for w in key.split() if w not in SALT_WORDS]
+            fuzzy = False
+        if len(parts) > 1:
+            # Combination written with abbreviations, e.g. "lisinopril-hctz"
+            matched = [self.normalize(p, fuzzy) for p in parts]
+            if all(m["ingredient"] for m in matched):
+                ingredients = [m["ingredient"] for m in matched]
+                combo = " / ".join(ingredients)
+                reverse = " / ".join(reversed(ingredients))
+                result.update(ingredient=reverse if reverse in self.ingredients else combo, term=combo,
+                              distance=sum(m["distance"] for m in matched))
+        return result
+
+    def canonical(self, text, fuzzy=True):
+        """Canonical ingredient name, or the cleaned input when nothing matches."""
+        match = self.normalize(text, fuzzy)
+        return match["ingredient"] or _clean(parse_strength(text or "")[0])
+
+    def canonical_list(self, meds_list):
+        """Canonical names for a medication list, de-duplicated, in input order."""
+        seen = []
+        for med in meds_list:
+            name = self.canonical(med)
+            if name and name not in seen:
+                seen.append(name)
+        return seen
+
+
+@functools.lru_cache(maxsize=1)
+def default_index():
+    return DrugNameIndex()
+
+
+def normalize(text, fuzzy=True):
+    return default_index().normalize(text, fuzzy)
+
+
+def canonical(text, fuzzy=True):
+    return default_index().canonical(text, fuzzy)
+
+
+def canonical_list(meds_list):
+    return default_index().canonical_list(meds_list)
+
+
+def describe(match):
+    """Short label such as "apixaban 5 mg" for showing the user what was understood."""
+    label = match["ingredient"] or match["input"]
+    return f"{label} {match['strength']}" if match["strength"] else label
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize medication names against the local term file")
+    parser.add_argument("meds", nargs="*")
+    parser.add_argument("--bench", action="store_true", help="time exact and fuzzy lookups")
+    args = parser.parse_args()
+
+    index = default_index()
+    for med in args.meds:
+        print(f"{med!r:32} -> {index.normalize(med)}")
+    if args.bench:
+        samples = ["Lisinopril 10mg", "lisinoprl", "Eliquis 5 mg BID", "amlodipin", "metformin hcl er 500 mg",
+                   "sevelamer carbonat", "insulin glargin 20 units", "unknowndrug"]
+        repeats = 200
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for s in samples:
+                DrugNameIndex.normalize.__wrapped__(index, s)  # bypass the memo to time the lookup itself
+        elapsed = (time.perf_counter() - started) / (repeats * len(samples))
+        print(f"{len(index.terms)} terms: {elapsed * 1e6:.0f} us per uncached lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Offline Part D formulary index for local plan ranking.
+
+`build` ingests plan/formulary CSVs into a directory of .npy arrays that are
+memory-mapped on load; `rank_plans` then prices a medication list against
+every plan in a region with vectorized NumPy and returns the cheapest N.
+
+Input CSVs (prepared from the CMS Part D public-use files, or a local sample):
+
+    plans.csv        plan_id, plan_name, region, monthly_premium, deductible
+    formulary.csv    plan_id, drug, tier                (tiers 1..N)
+    tier_costs.csv   plan_id, tier, monthly_copay
+    drug_prices.csv  drug, monthly_retail               (optional, cost when not covered)
+    zip_regions.csv  zip, region                        (optional, ZIP -> plan region)
+
+Cost model per plan (annual):
+    12 * premium + 12 * sum(monthly cost per drug) + deductible if any covered
+    drug sits on a deductible tier (DEDUCTIBLE_TIER and above); drugs not on
+    the formulary cost their retail price.
+
+    python .streamlit/formulary_index.py build puf_dir/ formulary_index/
+    python .streamlit/formulary_index.py sample formulary_index/ --plans 5000 --drugs 3000
+    python .streamlit/formulary_index.py bench formulary_index/ --region R01 --meds lisinopril,metformin
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+import drug_names
+
+DEDUCTIBLE_TIER = 3
+DEFAULT_RETAIL = 150.0  # monthly, when drug_prices.csv has no entry
+ARRAYS = ("premium", "deductible", "region", "tier", "tier_cost", "retail")
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _drug_key(name, fuzzy=False):
+    # Brand names and strengths collapse onto the canonical ingredient; typo correction is for user input only,
+    # a formulary row must never be filed under a neighbouring drug
+    return drug_names.canonical(name, fuzzy)
+
+
+def build(source_dir, index_dir):
+    """Ingest the CSVs in source_dir and write the index to index_dir."""
+    plans = _read_csv(os.path.join(source_dir, "plans.csv"))
+    formulary = _read_csv(os.path.join(source_dir, "formulary.csv"))
+    tier_costs = _read_csv(os.path.join(source_dir, "tier_costs.csv"))
+    prices_path = os.path.join(source_dir, "drug_prices.csv")
+    prices = {_drug_key(r["drug"]): float(r["monthly_retail"]) for r in _read_csv(prices_path)} \
+        if os.path.exists(prices_path) else {}
+    zips_path = os.path.join(source_dir, "zip_regions.csv")
+    zip_regions = {r["zip"].strip()[:5]: r["region"] for r in _read_csv(zips_path)} \
+        if os.path.exists(zips_path) else {}
+
+    plan_pos = {p["plan_id"]: i for i, p in enumerate(plans)}
+    drugs = sorted({_drug_key(r["drug"]) for r in formulary} | set(prices))
+    drug_pos = {d: i for i, d in enumerate(drugs)}
+    regions = sorted({p["region"] for p in plans})
+    region_pos = {r: i for i, r in enumerate(regions)}
+    max_tier = max([int(r["tier"]) for r in formulary] + [int(r["tier"]) for r in tier_costs] + [1])
+
+    arrays = {
+        "premium": np.array([float(p["monthly_premium"]) for p in plans], dtype=np.float32),
+        "deductible": np.array([float(p["deductible"]) for p in plans], dtype=np.float32),
+        "region": np.array([region_pos[p["region"]] for p in plans], dtype=np.int32),
+        "tier": np.zeros((len(plans), len(drugs)), dtype=np.int8),  # 0 = not on formulary
+        "tier_cost": np.zeros((len(plans), max_tier + 1), dtype=np.float32),
+        "retail": np.array([prices.get(d, DEFAULT_RETAIL) for d in drugs], dtype=np.float32),
+    }
+    for r in formulary:
+        if r["plan_id"] in plan_pos:
+            arrays["tier"][plan_pos[r["plan_id"]], drug_pos[_drug_key(r["drug"])]] = int(r["tier"])
+    for r in tier_costs:
+        if r["plan_id"] in plan_pos:
+            arrays["tier_cost"][plan_pos[r["plan_id"]], int(r["tier"])] = float(r["monthly_copay"])
+
+    meta = {
+        "plan_ids": [p["plan_id"] for p in plans],
+        "plan_names": [p["plan_name"] for p in plans],
+        "drugs": drugs,
+        "regions": regions,
+        "zip_regions": zip_regions,
+    }
+    save(index_dir, arrays, meta)
+    return index_dir
+
+
+def save(index_dir, arrays, meta):
+    os.makedirs(index_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(index_dir, f"{name}.npy"), arrays[name])
+    with open(os.path.join(index_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def exists(index_dir):
+    return os.path.exists(os.path.join(index_dir, "meta.json"))
+
+
+class FormularyIndex:
+    """Memory-mapped plan x drug arrays plus the name vocabularies."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+        self.plan_ids = meta["plan_ids"]
+        self.plan_names = meta["plan_names"]
+        self.drugs = meta["drugs"]
+        self.regions = meta["regions"]
+        self.zip_regions = meta["zip_regions"]
+        self.drug_pos = {d: i for i, d in enumerate(self.drugs)}
+        self.region_pos = {r: i for i, r in enumerate(self.regions)}
+        # Plan rows per region, so a lookup touches only its region's rows
+        region = np.asarray(self.region)
+        self.region_rows = {r: np.flatnonzero(region == i) for r, i in self.region_pos.items()}
+
+    def region_for_zip(self, zip_code):
+        zip_code = zip_code.strip()[:5]
+        if zip_code in self.zip_regions:
+            return self.zip_regions[zip_code]
+        # Without a ZIP map, regions are keyed by 3-digit ZIP prefix
+        return zip_code[:3] if zip_code[:3] in self.region_pos else None
+
+    def rank_plans(self, region, meds_list, top_n=3):
+        """Return (plans, unmatched meds) for the top_n cheapest plans in a region."""
+        rows = self.region_rows.get(region)
+        if rows is None or not len(rows):
+            return [], list(meds_list)
+        keys = [_drug_key(m, fuzzy=True) for m in meds_list]
+        matched = [k for k in keys if k in self.drug_pos]
+        unmatched = [m for m, k in zip(meds_list, keys) if k not in self.drug_pos]
+        cols = np.array([self.drug_pos[k] for k in matched], dtype=np.intp)
+
+        premium = self.premium[rows]
+        tiers = self.tier[np.ix_(rows, cols)].astype(np.intp)           # (plans, drugs)
+        copays = np.take_along_axis(self.tier_cost[rows], tiers, axis=1)
+        monthly = np.where(tiers > 0, copays, self.retail[cols])
+        hits_deductible = (tiers >= DEDUCTIBLE_TIER).any(axis=1)
+        annual = 12 * (premium + monthly.sum(axis=1)) + np.where(hits_deductible, self.deductible[rows], 0)
+
+        n = min(top_n, len(rows))
+        best = np.argpartition(annual, n - 1)[:n]
+        best = best[np.argsort(annual[best], kind="stable")]
+        plans = []
+        for i in best:
+            row = rows[i]
+            tier_info = ", ".join(
+                f"{name}: Tier {t}" if t else f"{name}: not covered"
+                for name, t in zip(matched, tiers[i])
+            )
+            plans.append({
+                "plan_id": self.plan_ids[row],
+                "plan_name": self.plan_names[row],
+                "premium": round(float(premium[i]), 2),
+                "tier_info": tier_info,
+                "annual_cost": round(float(annual[i]), 2),
+            })
+        return plans, unmatched
+
+
+def make_sample(index_dir, n_plans=5000, n_drugs=3000, n_regions=34, seed=0):
+    """Synthetic index for demos and benchmarks."""
+    rng = np.random.default_rng(seed)
+    common = ["lisinopril", "metformin", "atorvastatin", "amlodipine", "losartan", "furosemide",
+              "sevelamer", "calcitriol", "cinacalcet", "tacrolimus", "mycophenolate", "insulin glargine"]
+    drugs = common + [f"drug{i:05d}" for i in range(n_drugs - len(common))]
+    tier = rng.integers(0, 6, size=(n_plans, len(drugs)), dtype=np.int8)
+    tier_cost = np.column_stack([np.zeros(n_plans)] + [rng.uniform(lo, hi, n_plans) for lo, hi in
+                                                       [(0, 5), (5, 15), (30, 50), (80, 120), (150, 300)]])
+    arrays = {
+        "premium": rng.uniform(0, 110, n_plans).astype(np.float32),
+        "deductible": rng.choice([0, 250, 545], n_plans).astype(np.float32),
+        "region": rng.integers(0, n_regions, n_plans).astype(np.int32),
+        "tier": tier,
+        "tier_cost": tier_cost.astype(np.float32),
+        "retail": rng.uniform(10, 600, len(drugs)).astype(np.float32),
+    }
+    meta = {
+        "plan_ids": [f"S{i:04d}-{i % 1000:03d}" for i in range(n_plans)],
+        "plan_names": [f"Sample Plan {i}" for i in range(n_plans)],
+        "drugs": drugs,
+        "regions": [f"R{i:02d}" for i in range(n_regions)],
+        "zip_regions": {},
+    }
+    save(index_dir, arrays, meta)
+    return index_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the offline Part D formulary index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="ingest CSVs into an index")
+    b.add_argument("source_dir")
+    b.add_argument("index_dir")
+    s = sub.add_parser("sample", help="write a synthetic index")
+    s.add_argument("index_dir")
+    s.add_argument("--plans", type=int, default=5000)
+    s.add_argument("--drugs", type=int, default=3000)
+    q = sub.add_parser("bench", help="time rank_plans")
+    q.add_argument("index_dir")
+    q.add_argument("--region", required=True)
+    q.add_argument("--meds", required=True, help="comma-separated")
+    q.add_argument("--top", type=int, default=3)
+    q.add_argument("--repeats", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Index written to {build(args.source_dir, args.index_dir)}")
+    elif args.command == "sample":
+        print(f"Sample index written to {make_sample(args.index_dir, args.plans, args.drugs)}")
+    else:
+        index = FormularyIndex(args.index_dir)
+        meds = [m.strip() for m in args.meds.split(",") if m.strip()]
+        index.rank_plans(args.region, meds, args.top)  # warm the page cache
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            plans, unmatched = index.rank_plans(args.region, meds, args.top)
+        elapsed = (time.perf_counter() - started) / args.repeats
+        print(f"{len(index.region_rows.get(args.region, []))} plans in {args.region}: "
+              f"{elapsed * 1000:.2f} ms per ranking")
+        for p in plans:
+            print(f"  {p['plan_name']}: ${p['annual_cost']:.2f}/yr ({p['tier_info']})")
+        if unmatched:
+            print(f"  unmatched: {', '.join(unmatched)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Process-wide admission control for outbound generation calls.
+
+Every LLM request from the apps takes a slot from one GenerationPool per
+process before it is sent, so at most GENERATION_WORKERS requests (and
+sockets) are in flight however many people have the app open. Requests that
+cannot get a slot wait in a queue per session, and free slots are handed out
+round-robin across sessions, so one user generating a multi-problem note
+cannot starve everyone else. While a request waits, the page shows its queue
+position. When the queue is full (GENERATION_MAX_QUEUE in total, or
+GENERATION_SESSION_QUEUE for one session), or a request has waited
+GENERATION_QUEUE_TIMEOUT seconds, it is rejected (a warning on the page, or
+PoolSaturated off the script thread) instead of piling up.
+
+    with generation_pool.slot():
+        timer.dispatched()
+        response = openai.ChatCompletion.create(..., **credentials)
+
+and `async with generation_pool.slot():` in coroutines. Requests made off the
+script thread (HPI prefetch) share the "background" session, so they queue
+behind interactive users rather than ahead of them; background note jobs
+queue under the session that submitted them (acting_for). Credentials
+are passed per call (api_base/api_key) rather than set on the shared openai
+module.
+"""
+
+import asyncio
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import streamlit as st
+
+WORKERS = int(os.environ.get("GENERATION_WORKERS", "8"))
+MAX_QUEUE = int(os.environ.get("GENERATION_MAX_QUEUE", "64"))
+SESSION_QUEUE = int(os.environ.get("GENERATION_SESSION_QUEUE", "8"))
+QUEUE_TIMEOUT_S = float(os.environ.get("GENERATION_QUEUE_TIMEOUT", "120"))
+
+BACKGROUND = "background"
+
+
+class PoolSaturated(RuntimeError):
+    """The generation queue is full, or a request waited too long for a slot."""
+
+
+class Ticket:
+    def __init__(self, session):
+        self.session = session
+        self.enqueued = time.perf_counter()
+        self.granted = threading.Event()
+
+
+class GenerationPool:
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE, session_queue=SESSION_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.session_queue = session_queue
+        self.active = 0
+        self._queues = collections.OrderedDict()  # session -> deque of tickets, in round-robin order
+        self._lock = threading.Lock()
+
+    def request(self, session):
+        """A ticket that is either granted already or queued; raises PoolSaturated when the queue is full."""
+        ticket = Ticket(session)
+        with self._lock:
+            if self.active < self.workers and not self._queues:
+                self.active += 1
+                ticket.granted.set()
+                return ticket
+            waiting = sum(len(q) for q in self._queues.values())
+            if waiting >= self.max_queue:
+                raise PoolSaturated(f"{waiting} generation requests are already queued")
+            queue = self._queues.setdefault(session, collections.deque())
+            if len(queue) >= self.session_queue:
+                raise PoolSaturated(f"This session already has {len(queue)} generation requests queued")
+            queue.append(ticket)
+            self._grant()
+        return ticket
+
+    def position(self, ticket):
+        """Number of queued requests that will be served before this one (0 once granted)."""
+        with self._lock:
+            queue = self._queues.get(ticket.session)
+            if ticket.granted.is_set() or queue is None or ticket not in queue:
+                return 0
+            rank = queue.index(ticket)
+            ahead = rank
+            for session, other in self._queues.items():
+                if session == ticket.session:
+                    break
+                ahead += min(len(other), rank + 1)  # served before us in every round up to ours
+            past = False
+            for session, other in self._queues.items():
+                if past:
+                    ahead += min(len(other), rank)
+                past = past or session == ticket.session
+            return ahead
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.granted.is_set():
+                self.active -= 1
+            else:
+                queue = self._queues.get(ticket.session)
+                if queue and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[ticket.session]
+            self._grant()
+
+    def _grant(self):
+        # Called with the lock held: hand free slots to the head of each session's queue in turn
+        while self.active < self.workers and self._queues:
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            del self._queues[session]
+            if queue:
+                self._queues[session] = queue  # to the back of the rotation
+            self.active += 1
+            ticket.granted.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {"workers": self.workers, "active": self.active,
+                    "queued": sum(len(q) for q in self._queues.values()), "sessions_waiting": len(self._queues)}
+
+
+_POOL = GenerationPool()
+
+
+def get_pool():
+    return _POOL
+
+
+def _script_ctx():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+
+_LOCAL = threading.local()
+
+
+@contextlib.contextmanager
+def acting_for(session):
+    """Queue the requests this thread makes (e.g. a background job) under the session that asked for them."""
+    previous = getattr(_LOCAL, "session", None)
+    _LOCAL.session = session
+    try:
+        yield
+    finally:
+        _LOCAL.session = previous
+
+
+def current_session():
+    """The Streamlit session of the calling thread (or the one it acts for), else BACKGROUND."""
+    ctx = _script_ctx()
+    if ctx is not None:
+        return ctx.session_id
+    return getattr(_LOCAL, "session", None) or BACKGROUND
+
+
+class slot:
+    """
+    Context manager holding one generation slot. On the script thread, shows the queue position while
+    waiting and stops the run with a warning when the request is rejected or times out; elsewhere raises
+    PoolSaturated.
+    """
+
+    def __init__(self, session=None, pool=None, timeout=QUEUE_TIMEOUT_S):
+        self.session = session or current_session()
+        self.pool = pool or _POOL
+        self.timeout = timeout
+        self.ticket = None
+        self.wait_s = 0.0
+
+    def __enter__(self):
+        try:
+            self.ticket = self.pool.request(self.session)
+            if not self.ticket.granted.is_set():
+                try:
+                    self._wait()
+                except BaseException:
+                    self.pool.release(self.ticket)
+                    raise
+        except PoolSaturated as e:
+            if _script_ctx() is None:
+                raise
+            # On the script thread, end this run with a notice instead of a traceback
+            st.warning(f"The note generator is busy ({e}). Please try again in a moment.")
+            st.stop()
+        self.wait_s = time.perf_counter() - self.ticket.enqueued
+        return self
+
+    def _wait(self):
+        placeholder = st.empty() if _script_ctx() is not None else None
+        deadline = self.ticket.enqueued + self.timeout
+        while not self.ticket.granted.wait(0.5):
+            if time.perf_counter() > deadline:
+                raise PoolSaturated(f"No generation slot became free within {self.timeout:.0f}s")
+            if placeholder is not None:
+                state = self.pool.snapshot()
+                placeholder.info(f"Waiting for a generation slot: {self.pool.position(self.ticket)} ahead "
+                                 f"({state['active']}/{state['workers']} busy)")
+        if placeholder is not None:
+            placeholder.empty()
+
+    def __exit__(self, *exc):
+        self.pool.release(self.ticket)
+        return False
+
+    async def __aenter__(self):
+        # For concurrent requests from one script run (multi_problem): waits off the event loop, without UI
+        self.ticket = self.pool.request(self.session)
+        try:
+            if not await asyncio.to_thread(self.ticket.granted.wait, self.timeout):
+                raise PoolSaturated(f"No generation slot became free within {self.timeout:.0f}s")
+        except BaseException:
+            self.pool.release(self.ticket)
+            raise
+        self.wait_s = time.perf_counter() - self.ticket.enqueued
+        return self
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
@@ -0,0 +1,114 @@
+"""
+Debounced speculative HPI generation.
+
+The HPI inputs (context, labs) are usually final long before the clinician
+finishes the Assessment & Plan. With prefetch enabled, every rerun hands the
+current HPI inputs to the session's HPIPrefetcher; once they have stayed the
+same for `debounce` seconds the HPI is generated on a background thread and
+kept against a hash of those inputs. The final button then calls `get()`,
+which returns the finished (or still running) result for unchanged inputs and
+None otherwise, in which case the app generates the HPI as before.
+
+The generate function runs without a Streamlit script context, so it must not
+call st.* (note_metrics timers still record to the process-wide buffer).
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+
+import streamlit as st
+
+DEFAULT_DEBOUNCE = float(os.environ.get("HPI_PREFETCH_DEBOUNCE", "2.0"))
+
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="hpi-prefetch")
+
+
+def inputs_key(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class HPIPrefetcher:
+    def __init__(self, generate, debounce=DEFAULT_DEBOUNCE, max_entries=8):
+        self.generate = generate
+        self.debounce = debounce
+        self.max_entries = max_entries
+        self.futures = collections.OrderedDict()  # inputs key -> Future
+        self._timer = None
+        self._timer_key = None
+        self._lock = threading.Lock()
+
+    def update(self, inputs):
+        """Note the current HPI inputs; (re)starts the debounce timer when they changed."""
+        if not any(str(v).strip() for v in inputs.values()):
+            return
+        key = inputs_key(inputs)
+        with self._lock:
+            if key in self.futures or key == self._timer_key:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer_key = key
+            self._timer = threading.Timer(self.debounce, self._start, args=(key, inputs))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _start(self, key, inputs):
+        with self._lock:
+            if key != self._timer_key or key in self.futures:
+                return
+            self.futures[key] = _EXECUTOR.submit(self.generate, inputs)
+            while len(self.futures) > self.max_entries:
+                self.futures.popitem(last=False)
+
+    def status(self, inputs):
+        key = inputs_key(inputs)
+        with self._lock:
+            future = self.futures.get(key)
+            if future is None:
+                return "waiting" if key == self._timer_key else "idle"
+        if not future.done():
+            return "running"
+        return "failed" if future.exception() else "ready"
+
+    def get(self, inputs, timeout=None):
+        """Prefetched HPI for exactly these inputs (waiting for it if still running), or None."""
+        key = inputs_key(inputs)
+        with self._lock:
+            future = self.futures.get(key)
+            if future is None and key == self._timer_key and self._timer is not None:
+                # Button pressed inside the debounce window: start now instead of waiting it out
+                self._timer.cancel()
+                future = self.futures[key] = _EXECUTOR.submit(self.generate, inputs)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            with self._lock:
+                self.futures.pop(key, None)
+            return None
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._timer_key = None
+
+
+def toggle():
+    """Sidebar opt-in; off by default so nothing is generated that the clinician did not ask for."""
+    return st.sidebar.checkbox("Prefetch HPI while typing", key="hpi_prefetch_enabled",
+                               help="Start the HPI in the background once its inputs stop changing")
+
+
+def session_prefetcher(state, name, generate, debounce=DEFAULT_DEBOUNCE):
+    """One prefetcher per session and app, kept in st.session_state."""
+    key = f"hpi_prefetcher_{name}"
+    if key not in state:
+        state[key] = HPIPrefetcher(generate, debounce)
+    return state[key]
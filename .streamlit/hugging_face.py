@@ -2,27 +2,140 @@ import os
 os.environ["STREAMLIT_WATCH_FILES"] = "false"
 
 import streamlit as st
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
 import boto3
-import json
 import datetime
+import queue
 import tempfile
-import re
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
-
-# Helper function to remove leading asterisks from each line
-def remove_leading_asterisks(text):
-    cleaned_lines = [re.sub(r"^\s*\*\s*", "", line) for line in text.splitlines()]
-    return "\n".join(cleaned_lines)
-
-# Load Hugging Face model without caching
+import threading
+import time
+import note_metrics
+import model_store
+import note_sanitizer
+import note_history
+import census
+
+# Load Hugging Face model. transformers (and torch) are imported here rather than
+# at module level so the page renders before the heavy imports run.
 def load_huggingface_model():
+    from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+
     model_name = "gpt2"  # You can change this to a model that suits your needs
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
+    if model_store.has_model(model_name):
+        # Memory-mapped weights shared with the other worker processes
+        model, tokenizer = model_store.load_model(model_name)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name)
     generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
     return generator
 
-generator = load_huggingface_model()
+class ModelWarmup:
+    """Loads the generator once per process, on a background thread."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._generator = None
+        self._error = None
+        self.memory_before = None
+        self.memory_after = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="hf-model-preload", daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        try:
+            self.memory_before = model_store.rss_report()
+            self._generator = self._loader()
+            self.memory_after = model_store.rss_report()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def get(self):
+        """Return the generator, loading it (or waiting for the preload) if needed."""
+        self.start()
+        self._ready.wait()
+        if self._error is not None:
+            error = self._error
+            # Let the next generation retry instead of caching the failure for the process lifetime
+            with self._lock:
+                self._thread = None
+                self._error = None
+                self._ready.clear()
+            raise error
+        return self._generator
+
+@st.cache_resource
+def model_warmup():
+    return ModelWarmup(load_huggingface_model)
+
+# Optional boot-time preload: warm the model in the background while the UI is already interactive
+if os.environ.get("HF_PRELOAD", "0") == "1":
+    model_warmup().start()
+
+def token_counts(generator, prompt, completion):
+    return len(generator.tokenizer.encode(prompt)), len(generator.tokenizer.encode(completion))
+
+# Seconds to wait for the next decoded piece before giving up on a stalled generation
+STREAM_TIMEOUT = float(os.environ.get("HF_STREAM_TIMEOUT", "120"))
+
+# Run the pipeline on a background thread and yield completion text as it is decoded
+def stream_generation(generator, prompt, max_length):
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                    timeout=STREAM_TIMEOUT)
+    failure = []
+
+    def run():
+        try:
+            generator(prompt, max_length=max_length, temperature=0.7, streamer=streamer)
+        except Exception as e:
+            # Hand the error to the consumer and end the stream, otherwise it waits for pieces that never come
+            failure.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="hf-generate", daemon=True)
+    thread.start()
+    try:
+        yield from streamer
+    except queue.Empty:
+        raise TimeoutError(f"No output from the model for {STREAM_TIMEOUT:g} s") from None
+    if failure:
+        raise failure[0]
+
+# Stream, sanitize and display one generation; returns the cleaned note
+def generate_note(prompt, max_length, timer, label, key):
+    # The prompt is ready before the model is; the load/preload wait is reported as its own stage
+    timer.prompt_built()
+    waited = time.perf_counter()
+    generator = model_warmup().get()
+    timer.annotate(model_wait_s=round(time.perf_counter() - waited, 6))
+    timer.dispatched()
+    placeholder = st.empty()
+    try:
+        raw, note = note_sanitizer.stream_to(placeholder, stream_generation(generator, prompt, max_length),
+                                             prompt=prompt, on_first_piece=timer.first_token)
+    except Exception as e:
+        timer.failed(e)
+        raise
+    prompt_tokens, completion_tokens = token_counts(generator, prompt, raw)
+    timer.finished(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    placeholder.text_area(label, value=note, height=400, key=key)
+    return note
 
 # S3 integration functions (unchanged)
 def get_s3_client():
@@ -34,36 +147,32 @@ def get_s3_client():
     )
     return s3
 
+def get_record_store():
+    # NOTE_HISTORY_DIR keeps records on local disk instead of S3 (development, offline use)
+    if os.environ.get("NOTE_HISTORY_DIR"):
+        return note_history.LocalStore(os.environ["NOTE_HISTORY_DIR"])
+    return note_history.S3Store(get_s3_client(), st.secrets["BUCKET_NAME"])
+
 def upload_patient_record_to_s3(record):
-    s3 = get_s3_client()
-    bucket = st.secrets["BUCKET_NAME"]
-    timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
-    file_key = f"patients/{record['id']}_{timestamp}.json"
-    record_json = json.dumps(record)
-    s3.put_object(Body=record_json, Bucket=bucket, Key=file_key)
+    # Partitioned by service and day, and listed in that day's census manifest
+    file_key = census.save_record(get_record_store(), record)
     st.success(f"Patient record saved to S3 with key: {file_key}")
 
 def load_latest_patient_record_from_s3(patient_id):
-    s3 = get_s3_client()
-    bucket = st.secrets["BUCKET_NAME"]
-    prefix = f"patients/{patient_id}_"
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    
-    if 'Contents' not in response:
+    record = census.find_latest(get_record_store(), patient_id)
+    if record is None:
         st.warning("No records found for this patient in S3.")
-        return None
-
-    objects = sorted(response['Contents'], key=lambda obj: obj['LastModified'], reverse=True)
-    latest_key = objects[0]['Key']
-    obj = s3.get_object(Bucket=bucket, Key=latest_key)
-    content = obj['Body'].read().decode('utf-8')
-    record = json.loads(content)
     return record
 
 # Rest of your app code remains unchanged...
 # (Patient management, tabs for note generation, etc.)
 
-# Initialize or load patient data in session state
+# Initialize or load patient data in session state: the current census is preloaded in parallel when record
+# storage is configured
+if "patients" not in st.session_state and (os.environ.get("NOTE_HISTORY_DIR") or "BUCKET_NAME" in st.secrets):
+    census_records = census.preload(get_record_store())
+    if census_records:
+        st.session_state.patients = census_records
 if "patients" not in st.session_state:
     st.session_state.patients = [
         {
@@ -115,6 +224,16 @@ if st.sidebar.button("Add Patient", key="add_patient"):
     else:
         st.sidebar.error("Please enter both Patient ID and Reason for Consult.")
 
+note_metrics.render_metrics_panel()
+warmup = model_warmup()
+if warmup.ready and warmup.memory_after:
+    st.sidebar.caption(
+        f"Local model: ready. RSS {warmup.memory_before.get('VmRSS')} → {warmup.memory_after.get('VmRSS')} MB "
+        f"(file-backed {warmup.memory_after.get('RssFile', 'n/a')} MB)"
+    )
+else:
+    st.sidebar.caption("Local model: loads on first generation")
+
 if selected_patient:
     selected_id = selected_patient.split(" - ")[0]
     patient_record = next((p for p in st.session_state.patients if p["id"] == selected_id), None)
@@ -155,6 +274,7 @@ if selected_patient:
             key="assessment_input"
         )
         if st.button("Generate Consultation Note", key="generate_consult"):
+            timer = note_metrics.StageTimer("hugging_face", "consult", model="gpt2")
             prompt = f"""
 Generate a comprehensive Epic consultation note in the style of a board-certified nephrologist using the following inputs:
 
@@ -180,13 +300,11 @@ Based on the above, generate a note that includes:
 Do not add any extra summary sections.
 """
             with st.spinner("Generating Consultation Note..."):
-                generated_note = generator(prompt, max_length=1200, temperature=0.7)[0]["generated_text"].strip()
-                generated_note = remove_leading_asterisks(generated_note)
+                generated_note = generate_note(prompt, 1200, timer, "Consultation Note:", "consult_note_display")
                 patient_record["consultation_note"] = generated_note
                 patient_record["note_type"] = "Consult"
                 patient_record["last_updated"] = str(datetime.datetime.now())
                 st.success("Consultation note generated and saved!")
-                st.text_area("Consultation Note:", value=generated_note, height=400, key="consult_note_display")
 
     with tab2:
         st.subheader("Generate SOAP Note")
@@ -195,6 +313,7 @@ Do not add any extra summary sections.
             if not patient_record.get("consultation_note"):
                 st.error("Please generate a consultation note first.")
             else:
+                timer = note_metrics.StageTimer("hugging_face", "soap", model="gpt2")
                 soap_prompt = f"""
 Using the following consultation note and case update, generate a SOAP note for a progress note in the style of a board-certified nephrologist.
 In the SOAP note:
@@ -211,18 +330,17 @@ Case Update:
 SOAP Note:
 """
                 with st.spinner("Generating SOAP Note..."):
-                    soap_note = generator(soap_prompt, max_length=800, temperature=0.7)[0]["generated_text"].strip()
-                    soap_note = remove_leading_asterisks(soap_note)
+                    soap_note = generate_note(soap_prompt, 800, timer, "SOAP Note:", "soap_note_display")
                     patient_record["soap_note"] = soap_note
                     patient_record["note_type"] = "Progress"
                     patient_record["last_updated"] = str(datetime.datetime.now())
                     st.success("SOAP note generated and saved!")
-                    st.text_area("SOAP Note:", value=soap_note, height=400, key="soap_note_display")
 
     with tab3:
         st.subheader("Generate Follow-Up Update")
         new_update = st.text_area("Enter New Update:", "Provide a one-liner update...", height=68, key="new_update_input")
         if st.button("Generate Follow-Up Note", key="generate_followup"):
+            timer = note_metrics.StageTimer("hugging_face", "follow_up", model="gpt2")
             if patient_record.get("soap_note"):
                 base_note = patient_record.get("soap_note")
             else:
@@ -239,13 +357,11 @@ New Update:
 Generate an updated SOAP note that integrates the new subjective information with the existing assessment and plan.
 """
             with st.spinner("Generating Follow-Up Note..."):
-                new_soap_note = generator(followup_prompt, max_length=800, temperature=0.7)[0]["generated_text"].strip()
-                new_soap_note = remove_leading_asterisks(new_soap_note)
+                new_soap_note = generate_note(followup_prompt, 800, timer, "Updated Follow-Up SOAP Note:", "followup_display")
                 patient_record["soap_note"] = new_soap_note
                 patient_record["note_type"] = "Progress"
                 patient_record["last_updated"] = str(datetime.datetime.now())
                 st.success("Follow-Up note generated and saved!")
-                st.text_area("Updated Follow-Up SOAP Note:", value=new_soap_note, height=400, key="followup_display")
 
     if st.button("Save Patient Record to S3", key="save_patient_record"):
         upload_patient_record_to_s3(patient_record)
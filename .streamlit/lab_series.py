@@ -0,0 +1,177 @@
+"""
+Per-patient longitudinal lab store.
+
+Each analyte keeps array-backed timestamp/value columns that grow by
+doubling, plus running aggregates (count, min, max, sums for the mean and the
+least-squares slope). Appending a day's labs updates the aggregates in O(1),
+trend lookups read them in O(1), and the latest N values are a view of the
+tail of the column, so a long ICU stay costs no more per note than day one.
+
+The store serializes to a JSON-safe dict (columns as base64 float64) that is
+saved with the patient record.
+"""
+
+import base64
+import datetime
+import time
+
+import numpy as np
+
+import lab_trends
+
+DAY = 86400.0
+
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array, dtype="<f8").tobytes()).decode("ascii")
+
+
+def _decode(text):
+    return np.frombuffer(base64.b64decode(text), dtype="<f8").copy()
+
+
+class LabSeries:
+    """Timestamped values for one analyte with incrementally maintained trend aggregates."""
+
+    def __init__(self, analyte, unit, capacity=16):
+        self.analyte = analyte
+        self.unit = unit
+        self.t = np.empty(capacity)
+        self.v = np.empty(capacity)
+        self.n = 0
+        self.t0 = None  # slope sums use days since the first value to keep them well conditioned
+        self.sum_x = self.sum_y = self.sum_xx = self.sum_xy = 0.0
+        self.min = self.max = None
+
+    def append(self, timestamp, value):
+        """Add a value; values not newer than the last one are ignored (labs re-entered on a later day)."""
+        if self.n and timestamp <= self.t[self.n - 1]:
+            return False
+        if self.n == len(self.t):
+            self.t = np.resize(self.t, 2 * len(self.t))
+            self.v = np.resize(self.v, 2 * len(self.v))
+        self.t[self.n] = timestamp
+        self.v[self.n] = value
+        self.n += 1
+        if self.t0 is None:
+            self.t0 = timestamp
+        x = (timestamp - self.t0) / DAY
+        self.sum_x += x
+        self.sum_y += value
+        self.sum_xx += x * x
+        self.sum_xy += x * value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return True
+
+    def latest(self, count=3):
+        """(timestamps, values) of the last `count` values, as views."""
+        start = max(self.n - count, 0)
+        return self.t[start:self.n], self.v[start:self.n]
+
+    def slope_per_day(self):
+        """Least-squares slope over every stored value, from the running sums."""
+        denom = self.n * self.sum_xx - self.sum_x ** 2
+        if self.n < 2 or denom <= 0:
+            return None
+        return (self.n * self.sum_xy - self.sum_x * self.sum_y) / denom
+
+    def trend(self, count=3):
+        if not self.n:
+            return None
+        times, values = self.latest(count)
+        return {
+            "analyte": self.analyte,
+            "unit": self.unit,
+            "n": self.n,
+            "first": float(self.v[0]),
+            "last": float(self.v[self.n - 1]),
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum_y / self.n,
+            "slope_per_day": self.slope_per_day(),
+            "since": float(self.t[0]),
+            "latest": [float(v) for v in values],
+            "latest_times": [float(t) for t in times],
+        }
+
+    def to_dict(self):
+        return {"unit": self.unit, "t": _encode(self.t[:self.n]), "v": _encode(self.v[:self.n]),
+                "t0": self.t0, "sums": [self.sum_x, self.sum_y, self.sum_xx, self.sum_xy],
+                "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, analyte, data):
+        t, v = _decode(data["t"]), _decode(data["v"])
+        series = cls(analyte, data["unit"], capacity=max(16, 2 * len(t)))
+        series.t[:len(t)] = t
+        series.v[:len(v)] = v
+        series.n = len(t)
+        series.t0 = data["t0"]
+        series.sum_x, series.sum_y, series.sum_xx, series.sum_xy = data["sums"]
+        series.min, series.max = data["min"], data["max"]
+        return series
+
+
+class LabStore:
+    """All analytes for one patient."""
+
+    def __init__(self):
+        self.series = {}
+        self.last_text = None
+
+    def add(self, analyte, value, timestamp=None, unit=""):
+        timestamp = time.time() if timestamp is None else timestamp
+        if analyte not in self.series:
+            self.series[analyte] = LabSeries(analyte, unit)
+        return self.series[analyte].append(timestamp, value)
+
+    def add_text(self, labs, timestamp=None):
+        """
+        Parse free-text labs and append them. A multi-value series ending at `timestamp` is spread evenly
+        over its stated span (one day apart when no span is given); a leading value equal to the last stored
+        one is treated as already recorded. Returns the number of values added.
+        """
+        if labs == self.last_text:
+            return 0  # the same entry submitted again (e.g. regenerating a note)
+        self.last_text = labs
+        timestamp = time.time() if timestamp is None else timestamp
+        added = 0
+        for s in lab_trends.parse_labs(labs)[0]:
+            values = s["values"]
+            existing = self.series.get(s["analyte"])
+            if existing and existing.n and len(values) > 1 and values[0] == existing.v[existing.n - 1]:
+                # "Cr 3.1 -> 2.6" written the day after 3.1 was stored starts from the stored value
+                values = values[1:]
+            step = (s["span_hours"] * 3600 / (len(values) - 1)) if s["span_hours"] and len(values) > 1 else DAY
+            times = timestamp - step * np.arange(len(values) - 1, -1, -1)
+            for t, v in zip(times, values):
+                added += self.add(s["analyte"], float(v), float(t), s["unit"])
+        return added
+
+    def trends(self, count=3):
+        return [s.trend(count) for s in self.series.values() if s.n]
+
+    def summary(self, count=3):
+        """Compact prompt lines, e.g. "Cr (9 values since Mar 02): 3.1→2.6→2.2 mg/dL, peak 3.4, low 1.1, -0.21/day"."""
+        lines = []
+        for t in self.trends(count):
+            since = datetime.datetime.fromtimestamp(t["since"]).strftime("%b %d")
+            line = (f"{t['analyte']} ({t['n']} value{'s' if t['n'] != 1 else ''} since {since}): "
+                    f"{'→'.join(f'{v:g}' for v in t['latest'])} {t['unit']}")
+            if t["n"] > len(t["latest"]):
+                line += f", peak {t['max']:g}, low {t['min']:g}"
+            if t["slope_per_day"] is not None:
+                line += f", {t['slope_per_day']:+.2g}/day"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {analyte: s.to_dict() for analyte, s in self.series.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        for analyte, series in (data or {}).items():
+            store.series[analyte] = LabSeries.from_dict(analyte, series)
+        return store
@@ -0,0 +1,196 @@
+"""
+Structured lab parsing with locally computed trends.
+
+Free-text labs such as "Cr 1.2→2.4→3.1 over 3 days, Na 138, K 5.2" are parsed
+into per-analyte value arrays, and trends (delta, percent change, slope, KDIGO
+AKI stage from creatinine, sodium correction rate) are computed with NumPy for
+all series at once. `compact_labs` returns the short computed summary that goes
+into the prompt in place of the raw text (values exactly as entered, plus
+whatever text did not parse), so the note quotes exact numbers instead of
+model estimates.
+
+    python .streamlit/lab_trends.py "Cr 1.2→2.4→3.1 over 3 days, Na 118 -> 130 in 24h, K 5.2"
+"""
+
+import re
+import sys
+
+import numpy as np
+
+# alias -> (analyte, default unit)
+ANALYTES = {
+    "creatinine": ("Cr", "mg/dL"), "creat": ("Cr", "mg/dL"), "scr": ("Cr", "mg/dL"), "cr": ("Cr", "mg/dL"),
+    "cystatin c": ("CysC", "mg/L"), "cysc": ("CysC", "mg/L"),
+    "bun": ("BUN", "mg/dL"), "urea": ("BUN", "mg/dL"),
+    "egfr": ("eGFR", "mL/min/1.73m2"), "gfr": ("eGFR", "mL/min/1.73m2"),
+    "sodium": ("Na", "mEq/L"), "na": ("Na", "mEq/L"),
+    "potassium": ("K", "mEq/L"), "k": ("K", "mEq/L"),
+    "chloride": ("Cl", "mEq/L"), "cl": ("Cl", "mEq/L"),
+    "bicarbonate": ("HCO3", "mEq/L"), "bicarb": ("HCO3", "mEq/L"), "hco3": ("HCO3", "mEq/L"), "co2": ("HCO3", "mEq/L"),
+    "calcium": ("Ca", "mg/dL"), "ca": ("Ca", "mg/dL"),
+    "phosphorus": ("Phos", "mg/dL"), "phos": ("Phos", "mg/dL"), "po4": ("Phos", "mg/dL"),
+    "magnesium": ("Mg", "mg/dL"), "mg": ("Mg", "mg/dL"),
+    "albumin": ("Alb", "g/dL"), "alb": ("Alb", "g/dL"),
+    "hemoglobin": ("Hgb", "g/dL"), "hgb": ("Hgb", "g/dL"), "hb": ("Hgb", "g/dL"),
+    "glucose": ("Glu", "mg/dL"), "glu": ("Glu", "mg/dL"),
+    "uacr": ("UACR", "mg/g"), "acr": ("UACR", "mg/g"), "upcr": ("UPCR", "g/g"),
+    "pth": ("PTH", "pg/mL"), "uric acid": ("UA", "mg/dL"),
+    "serum osm": ("Sosm", "mOsm/kg"), "sosm": ("Sosm", "mOsm/kg"),
+    "urine osm": ("Uosm", "mOsm/kg"), "uosm": ("Uosm", "mOsm/kg"),
+}
+UNITS = r"mg/dl|meq/l|mmol/l|g/dl|mg/l|mg/g|g/g|pg/ml|mosm/kg|ml/min(?:/1\.73\s?m2)?|%"
+NUMBER = r"\d+(?:\.\d+)?"
+ARROW = r"\s*(?:→|⇒|-+>|=>|>|\bto\b)\s*"
+HOURS = {"h": 1, "hr": 1, "hrs": 1, "hour": 1, "hours": 1, "d": 24, "day": 24, "days": 24,
+         "wk": 168, "wks": 168, "week": 168, "weeks": 168, "mo": 730.5, "mos": 730.5, "month": 730.5,
+         "months": 730.5, "yr": 8766, "yrs": 8766, "year": 8766, "years": 8766}
+
+_alias = "|".join(sorted((re.escape(a) for a in ANALYTES), key=len, reverse=True))
+LAB_RE = re.compile(
+    rf"\b(?P<alias>{_alias})\b\s*[:=]?\s*"
+    rf"(?P<values>{NUMBER}(?:{ARROW}{NUMBER})*)"
+    rf"\s*(?P<unit>{UNITS})?"
+    rf"(?:\s*\(?\s*(?:over|in|within|x)\s*(?P<span>{NUMBER})\s*(?P<span_unit>{'|'.join(HOURS)})\b\)?)?",
+    re.IGNORECASE,
+)
+UNIT_NAMES = {"mg/dl": "mg/dL", "meq/l": "mEq/L", "mmol/l": "mmol/L", "g/dl": "g/dL", "mg/l": "mg/L",
+              "mg/g": "mg/g", "g/g": "g/g", "pg/ml": "pg/mL", "mosm/kg": "mOsm/kg"}
+
+# Sodium should rise no more than this per 24 h in chronic hyponatremia (osmotic demyelination risk)
+NA_CORRECTION_LIMIT = 8
+
+
+def parse_labs(text):
+    """Return (series, leftover text). Each series: analyte, unit, values (float array), span_hours, raw."""
+    series, leftover, last = [], [], 0
+    for m in LAB_RE.finditer(text or ""):
+        analyte, default_unit = ANALYTES[m.group("alias").lower()]
+        unit = m.group("unit")
+        values = np.array(re.split(ARROW, m.group("values")), dtype=float)
+        span = m.group("span")
+        series.append({
+            "analyte": analyte,
+            "unit": UNIT_NAMES.get(unit.lower(), unit) if unit else default_unit,
+            "values": values,
+            "span_hours": float(span) * HOURS[m.group("span_unit").lower()] if span else None,
+            "raw": m.group(0).strip(),
+        })
+        leftover.append(text[last:m.start()])
+        last = m.end()
+    leftover.append((text or "")[last:])
+    # Separators alone ("Cr 2.4, Na 138; K 5.2") do not count as unparsed content
+    rest = re.sub(r"[\s,;.:/|-]+", " ", "".join(leftover)).strip()
+    return series, rest
+
+
+def compute_trends(series):
+    """Vectorized trend metrics for every series; returns one dict per series."""
+    if not series:
+        return []
+    lengths = np.array([len(s["values"]) for s in series])
+    padded = np.full((len(series), lengths.max()), np.nan)
+    for i, s in enumerate(series):
+        padded[i, :lengths[i]] = s["values"]
+    rows = np.arange(len(series))
+    first = padded[:, 0]
+    last = padded[rows, lengths - 1]
+    # AKI is a value rising above an earlier one: each value against the lowest value before it, the worst kept
+    # (a falling or recovering series is staged by its rise, never by its starting point)
+    prior_min = np.fmin.accumulate(padded, axis=1)[:, :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rise_ratio = np.nan_to_num(padded[:, 1:] / prior_min, nan=-np.inf)
+    worst = rise_ratio.argmax(axis=1) if padded.shape[1] > 1 else np.zeros(len(series), dtype=int)
+    baseline = prior_min[rows, worst] if padded.shape[1] > 1 else first
+    peak = padded[rows, worst + 1] if padded.shape[1] > 1 else first
+    delta = last - first
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(first != 0, delta / first * 100, np.nan)
+        hours = np.array([s["span_hours"] or np.nan for s in series])
+        per_day = delta / hours * 24
+
+    trends = []
+    for i, s in enumerate(series):
+        t = {"analyte": s["analyte"], "unit": s["unit"], "values": s["values"], "span_hours": s["span_hours"],
+             "first": first[i], "last": last[i], "n": int(lengths[i])}
+        if lengths[i] > 1:
+            t.update(delta=delta[i], pct_change=pct[i], per_day=None if np.isnan(per_day[i]) else per_day[i])
+        # KDIGO AKI criteria cover rises within 7 days; slower changes are CKD progression, and without a
+        # time span there is nothing to stage against
+        if s["analyte"] == "Cr" and lengths[i] > 1 and s["span_hours"] and s["span_hours"] <= 168:
+            t["aki_stage"], t["aki_ratio"] = kdigo_aki_stage(baseline[i], peak[i], s["span_hours"])
+        if s["analyte"] == "Na" and lengths[i] > 1 and s["span_hours"]:
+            t["na_rate_24h"] = per_day[i]
+        trends.append(t)
+    return trends
+
+
+def kdigo_aki_stage(baseline, peak, span_hours):
+    """KDIGO creatinine criteria over a rise of span_hours; returns (stage 0-3, peak/baseline ratio)."""
+    if not baseline or baseline <= 0:
+        return 0, None
+    ratio = peak / baseline
+    rise = round(peak - baseline, 2)  # 1.4 - 1.1 is 0.2999... in floating point
+    # AKI must be established before it is staged: a rise of 0.3 mg/dL within 48 hours or 1.5x baseline
+    if not (ratio >= 1.5 or (rise >= 0.3 and span_hours <= 48)):
+        return 0, ratio
+    if ratio >= 3 or peak >= 4.0:
+        return 3, ratio
+    if ratio >= 2:
+        return 2, ratio
+    return 1, ratio
+
+
+def _fmt(x):
+    return f"{x:g}"  # as entered: the summary replaces the typed values in the prompt
+
+
+def _span(hours):
+    if hours >= HOURS["months"] * 2:
+        return f"{hours / HOURS['months']:.3g} mo"
+    return f"{hours:g} h" if hours < 48 else f"{hours / 24:.3g} d"
+
+
+def describe(t):
+    """One compact line per analyte, e.g. "Cr 1.2→2.4→3.1 mg/dL over 3 d: +1.9 (+158%), +0.63/day, KDIGO AKI stage 2"."""
+    line = f"{t['analyte']} {'→'.join(_fmt(v) for v in t['values'])} {t['unit']}"
+    if t["n"] < 2:
+        return line
+    if t["span_hours"]:
+        line += f" over {_span(t['span_hours'])}"
+    parts = [f"{t['delta']:+.3g}" + (f" ({t['pct_change']:+.0f}%)" if not np.isnan(t["pct_change"]) else "")]
+    if t.get("per_day") is not None and "na_rate_24h" not in t:
+        parts.append(f"{t['per_day']:+.2g}/day")
+    if "aki_stage" in t:
+        parts.append(f"KDIGO AKI stage {t['aki_stage']} ({t['aki_ratio']:.1f}x baseline)" if t["aki_stage"]
+                     else "no KDIGO AKI")
+    if "na_rate_24h" in t:
+        rate = t["na_rate_24h"]
+        parts.append(f"correction {rate:+.1f} mEq/L per 24 h"
+                     + (f", exceeds {NA_CORRECTION_LIMIT} mEq/L/24 h limit" if abs(rate) > NA_CORRECTION_LIMIT else ""))
+    return line + ": " + ", ".join(parts)
+
+
+def summarize(text):
+    """Return (trends, fully parsed?) for free-text labs."""
+    series, rest = parse_labs(text)
+    return compute_trends(series), not rest
+
+
+def _unparsed(text):
+    """The text around the parsed lab values, punctuation kept ("renal US 3.5 cm cyst")."""
+    pieces = (piece.strip(" \t\n,;|") for piece in LAB_RE.sub("\0", text).split("\0"))
+    return "; ".join(piece for piece in pieces if piece.strip(" .:/-"))
+
+
+def compact_labs(text):
+    """Prompt-ready labs: the computed summary in place of the text, plus any part of it that did not parse."""
+    trends, fully_parsed = summarize(text)
+    if not any(t["n"] > 1 for t in trends):
+        return text  # single values: the summary would only add units
+    summary = "; ".join(describe(t) for t in trends)
+    return summary if fully_parsed else f"{summary}; {_unparsed(text)}"
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        print(compact_labs(arg))
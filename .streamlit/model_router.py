@@ -0,0 +1,311 @@
+"""
+Per-task model routing with live latency tracking and failover.
+
+Each task type (extraction, hpi, full_note, consult, follow_up) has an ordered list of
+(backend, model) candidates and a latency budget. A call goes to the first
+candidate that is configured, whose circuit is closed and whose recent
+latency for that task (EWMA) is within the budget; if none is within budget,
+the fastest healthy candidate is used. A failed call is recorded and retried
+on the next candidate, and a backend/model that fails CIRCUIT_FAILURES times
+in a row is skipped for CIRCUIT_COOLDOWN_S seconds before one trial call is
+let through again.
+
+Backends:
+    openai     chat completions (gpt-4-0613, gpt-4o-mini), supports functions
+    deepseek   text completions (deepseek-chat)
+    local      an in-process generate(prompt, max_tokens) callable, when registered
+
+Credentials and endpoints are passed per call, so several backends can be used
+from one process, and every attempt holds a generation_pool slot. The policy
+can be overridden with a JSON file in the same shape as DEFAULT_POLICY, named
+by MODEL_ROUTER_POLICY.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import openai
+import streamlit as st
+
+import generation_pool
+import note_metrics
+
+CIRCUIT_FAILURES = 3
+CIRCUIT_COOLDOWN_S = 30.0
+EWMA_ALPHA = 0.3
+
+DEFAULT_POLICY = {
+    # Small deterministic structured output: a fast function-calling model first
+    "extraction": {"candidates": [["openai", "gpt-4o-mini"], ["openai", "gpt-4-0613"]],
+                   "latency_budget_s": 8},
+    "hpi": {"candidates": [["openai", "gpt-4-0613"], ["deepseek", "deepseek-chat"], ["local", "gpt2"]],
+            "latency_budget_s": 20},
+    "full_note": {"candidates": [["openai", "gpt-4-0613"], ["deepseek", "deepseek-chat"], ["local", "gpt2"]],
+                  "latency_budget_s": 45},
+    # app_phase1 consult notes: DeepSeek first, as the app was built around it
+    "consult": {"candidates": [["deepseek", "deepseek-chat"], ["openai", "gpt-4-0613"], ["local", "gpt2"]],
+                "latency_budget_s": 45},
+    "follow_up": {"candidates": [["deepseek", "deepseek-chat"], ["openai", "gpt-4-0613"], ["local", "gpt2"]],
+                  "latency_budget_s": 30},
+}
+
+
+class RoutingError(RuntimeError):
+    """Every candidate for a task failed or is unavailable."""
+
+
+class Backend:
+    def __init__(self, name, style, api_base=None, api_key=None, generate=None, functions=False):
+        self.name = name
+        self.style = style  # "chat", "completion" or "local"
+        self.api_base = api_base
+        self.api_key = api_key
+        self.generate = generate
+        self.functions = functions
+
+    @property
+    def available(self):
+        return bool(self.generate) if self.style == "local" else bool(self.api_key)
+
+
+def messages_to_prompt(messages):
+    return "\n\n".join(m["content"] for m in messages if m.get("content")) + "\n"
+
+
+class _Health:
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.error_rate = 0.0  # EWMA
+
+    def is_open(self, now):
+        return self.failures >= CIRCUIT_FAILURES and now < self.open_until
+
+
+class ModelRouter:
+    def __init__(self, backends, policy=None):
+        self.backends = {b.name: b for b in backends}
+        self.policy = policy or DEFAULT_POLICY
+        self._health = collections.defaultdict(_Health)  # (backend, model)
+        self._latency = {}  # (task, backend, model) -> EWMA seconds
+        self._recent = collections.defaultdict(lambda: collections.deque(maxlen=200))
+        self._lock = threading.Lock()
+
+    def register_local(self, generate, name="local"):
+        self.backends[name] = Backend(name, "local", generate=generate)
+
+    # ---- selection ----
+
+    def candidates(self, task, needs_functions=False):
+        """Candidates for a task in the order they will be tried."""
+        policy = self.policy[task]
+        budget = policy.get("latency_budget_s")
+        now = time.time()
+        usable, trials = [], []
+        with self._lock:
+            for backend_name, model in policy["candidates"]:
+                backend = self.backends.get(backend_name)
+                if backend is None or not backend.available or (needs_functions and not backend.functions):
+                    continue
+                health = self._health[(backend_name, model)]
+                if health.is_open(now):
+                    trials.append((health.open_until, backend, model))
+                    continue
+                usable.append((self._latency.get((task, backend_name, model)), backend, model))
+        within, over = [], []
+        for latency, backend, model in usable:
+            if budget is not None and latency is not None and latency > budget:
+                over.append((latency, backend, model))
+            else:
+                within.append((backend, model))
+        # Over budget: still usable, fastest first; open circuits last, the one that reopens soonest first
+        over.sort(key=lambda c: c[0])
+        trials.sort(key=lambda c: c[0])
+        return within + [(b, m) for _, b, m in over] + [(b, m) for _, b, m in trials]
+
+    # ---- bookkeeping ----
+
+    def _record(self, task, backend, model, elapsed, ok):
+        with self._lock:
+            health = self._health[(backend.name, model)]
+            health.calls += 1
+            health.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * health.error_rate
+            if ok:
+                health.failures = 0
+                key = (task, backend.name, model)
+                previous = self._latency.get(key)
+                self._latency[key] = elapsed if previous is None else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * previous
+                self._recent[key].append(elapsed)
+            else:
+                health.errors += 1
+                health.failures += 1
+                if health.failures >= CIRCUIT_FAILURES:
+                    health.open_until = time.time() + CIRCUIT_COOLDOWN_S
+
+    def snapshot(self):
+        """One row per task/backend/model seen so far, for display."""
+        rows = []
+        with self._lock:
+            for (task, backend, model), latency in sorted(self._latency.items()):
+                health = self._health[(backend, model)]
+                recent = sorted(self._recent[(task, backend, model)])
+                rows.append({
+                    "task": task, "backend": backend, "model": model,
+                    "ewma_s": round(latency, 3),
+                    "p95_s": round(recent[int(0.95 * (len(recent) - 1))], 3) if recent else None,
+                    "error_rate": round(health.error_rate, 3),
+                    "circuit": "open" if health.is_open(time.time()) else "closed",
+                })
+            # Backends that have only ever failed have no latency yet
+            served = {(r["backend"], r["model"]) for r in rows}
+            for (backend, model), health in sorted(self._health.items()):
+                if (backend, model) not in served and health.calls:
+                    rows.append({"task": "", "backend": backend, "model": model, "ewma_s": None, "p95_s": None,
+                                 "error_rate": round(health.error_rate, 3),
+                                 "circuit": "open" if health.is_open(time.time()) else "closed"})
+        return rows
+
+    # ---- calls ----
+
+    def _timer(self, app, stage, backend, model, attempts, timer):
+        # The caller's timer (which has seen the prompt being built) covers the first attempt
+        if timer is None or attempts:
+            timer = note_metrics.StageTimer(app, stage, model=model)
+        timer.model = model
+        timer.annotate(backend=backend.name, attempt=len(attempts) + 1)
+        timer.dispatched()
+        return timer
+
+    def _request(self, backend, model, messages, stream, params):
+        if backend.style == "local":
+            return backend.generate(messages_to_prompt(messages), params.get("max_tokens"))
+        kwargs = dict(params, model=model, api_key=backend.api_key, api_base=backend.api_base, stream=stream)
+        if backend.style == "chat":
+            return openai.ChatCompletion.create(messages=messages, **kwargs)
+        kwargs.pop("functions", None)
+        kwargs.pop("function_call", None)
+        return openai.Completion.create(prompt=messages_to_prompt(messages), **kwargs)
+
+    def complete(self, task, messages, app, stage=None, timer=None, **params):
+        """
+        Route one non-streaming call. Returns a dict with text, function_arguments (when functions were
+        requested), backend, model, attempts and the raw response.
+        """
+        attempts = []
+        for backend, model in self.candidates(task, needs_functions="functions" in params):
+            with generation_pool.slot():
+                attempt_timer = self._timer(app, stage or task, backend, model, attempts, timer)
+                started = time.perf_counter()
+                try:
+                    response = self._request(backend, model, messages, False, params)
+                except Exception as e:
+                    attempt_timer.failed(e)
+                    self._record(task, backend, model, time.perf_counter() - started, ok=False)
+                    attempts.append(f"{backend.name}/{model}: {e}")
+                    continue
+            self._record(task, backend, model, time.perf_counter() - started, ok=True)
+            result = {"backend": backend.name, "model": model, "attempts": attempts, "response": response,
+                      "function_arguments": None}
+            if backend.style == "local":
+                attempt_timer.finished()
+                result["text"] = response.strip()
+                return result
+            attempt_timer.finished(response)
+            choice = response.choices[0]
+            if backend.style == "chat":
+                message = choice.message
+                result["text"] = (message.get("content") or "").strip()
+                if message.get("function_call"):
+                    result["function_arguments"] = message.function_call.arguments
+            else:
+                result["text"] = choice.text.strip()
+            return result
+        raise RoutingError(f"No backend could serve '{task}': " + ("; ".join(attempts) or "none configured"))
+
+    def stream(self, task, messages, app, stage=None, timer=None, **params):
+        """
+        Route one streaming call; returns (pieces, route). Nothing is sent until pieces is iterated: the
+        generation slot is taken then and released when the stream ends, fails or pieces is closed, so a
+        generator that is dropped unused holds nothing. Fails over while opening the stream; route (backend,
+        model, attempts, timer) is filled in once a stream is open and latency and health are recorded when
+        it is exhausted.
+        """
+        route = {"backend": None, "model": None, "attempts": [], "timer": None}
+        return self._stream(task, messages, app, stage, timer, route, params), route
+
+    def _stream(self, task, messages, app, stage, timer, route, params):
+        attempts = route["attempts"]
+        for backend, model in self.candidates(task):
+            with generation_pool.slot():
+                attempt_timer = self._timer(app, stage or task, backend, model, attempts, timer)
+                started = time.perf_counter()
+                try:
+                    response = self._request(backend, model, messages, True, params)
+                except Exception as e:
+                    attempt_timer.failed(e)
+                    self._record(task, backend, model, time.perf_counter() - started, ok=False)
+                    attempts.append(f"{backend.name}/{model}: {e}")
+                    continue
+                route.update(backend=backend.name, model=model, timer=attempt_timer)
+                yield from self._pieces(task, backend, model, response, attempt_timer, started)
+                return
+        raise RoutingError(f"No backend could serve '{task}': " + ("; ".join(attempts) or "none configured"))
+
+    def _pieces(self, task, backend, model, response, timer, started):
+        try:
+            if backend.style == "local":
+                timer.first_token()
+                yield response
+            else:
+                for chunk in response:
+                    timer.first_token()
+                    choice = chunk.choices[0]
+                    piece = choice.delta.get("content", "") if backend.style == "chat" else choice.text
+                    if piece:
+                        yield piece
+        except Exception:
+            self._record(task, backend, model, time.perf_counter() - started, ok=False)
+            raise
+        self._record(task, backend, model, time.perf_counter() - started, ok=True)
+
+
+def load_policy():
+    path = os.environ.get("MODEL_ROUTER_POLICY")
+    if not path:
+        return DEFAULT_POLICY
+    with open(path) as f:
+        return {**DEFAULT_POLICY, **json.load(f)}
+
+
+_ROUTER = None
+_ROUTER_LOCK = threading.Lock()
+
+
+def get_router(secrets):
+    """Process-wide router, so latency and health statistics are shared by every session."""
+    global _ROUTER
+    with _ROUTER_LOCK:
+        if _ROUTER is None:
+            _ROUTER = ModelRouter([
+                Backend("openai", "chat", os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1"),
+                        os.environ.get("OPENAI_API_KEY") or secrets.get("OPENAI_API_KEY"), functions=True),
+                Backend("deepseek", "completion", os.environ.get("DEEPSEEK_API_BASE", "https://api.deepseek.com/beta"),
+                        os.environ.get("DEEPSEEK_API_KEY") or secrets.get("DEEPSEEK_API_KEY")),
+            ], load_policy())
+        return _ROUTER
+
+
+def render_panel(router):
+    """Optional sidebar table of per-task latency and backend health."""
+    if not st.sidebar.checkbox("Show model routing", key="show_model_routing"):
+        return
+    rows = router.snapshot()
+    if rows:
+        st.sidebar.dataframe(rows)
+    else:
+        st.sidebar.caption("No routed calls in this process yet.")
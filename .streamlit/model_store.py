@@ -0,0 +1,154 @@
+"""
+Local model store with memory-mapped safetensors loading.
+
+Weights are exported once into MODEL_STORE_DIR/<model name>/ as safetensors and
+then loaded by mapping the files copy-on-write instead of reading them into
+private memory. Every Streamlit worker process that loads the same model shares
+those pages through the OS page cache, so N workers cost roughly one copy of
+the weights (they show up as RssFile rather than RssAnon).
+
+    python .streamlit/model_store.py export gpt2     # one-off, needs network
+    python .streamlit/model_store.py check gpt2      # load and print memory use
+"""
+
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import struct
+
+MODEL_STORE_DIR = os.environ.get(
+    "MODEL_STORE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "nephrology-note-models")
+)
+
+_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def model_dir(name):
+    return os.path.join(MODEL_STORE_DIR, name.replace("/", "--"))
+
+
+def weight_files(name):
+    directory = model_dir(name)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".safetensors"))
+
+
+def has_model(name):
+    return bool(weight_files(name)) and os.path.exists(os.path.join(model_dir(name), "config.json"))
+
+
+def export_model(name):
+    """Download a model and save it into the store as safetensors."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    directory = model_dir(name)
+    os.makedirs(directory, exist_ok=True)
+    AutoTokenizer.from_pretrained(name).save_pretrained(directory)
+    AutoModelForCausalLM.from_pretrained(name).save_pretrained(directory, safe_serialization=True)
+    return directory
+
+
+def rss_report():
+    """Resident memory of this process in MB, split into anonymous and file-backed pages (Linux)."""
+    report = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    report[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS; good enough as a fallback
+        report["VmRSS"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+def read_header(path):
+    """Return (tensor index, byte offset of the data section) for a safetensors file."""
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    header.pop("__metadata__", None)
+    return header, 8 + header_len
+
+
+def mmap_state_dict(paths):
+    """Map safetensors files copy-on-write and return (state_dict, mmap handles)."""
+    import torch
+
+    state, handles = {}, []
+    for path in paths:
+        header, data_start = read_header(path)
+        with open(path, "rb") as f:
+            # ACCESS_COPY: reads come straight from the page cache, writes stay private
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        handles.append(mapped)
+        for name, info in header.items():
+            dtype = getattr(torch, _DTYPES[info["dtype"]])
+            start, end = info["data_offsets"]
+            shape = info["shape"]
+            if end == start:
+                state[name] = torch.empty(shape, dtype=dtype)
+                continue
+            itemsize = torch.empty((), dtype=dtype).element_size()
+            tensor = torch.frombuffer(mapped, dtype=dtype, count=(end - start) // itemsize,
+                                      offset=data_start + start)
+            state[name] = tensor.view(shape)
+    return state, handles
+
+
+def _no_init_weights():
+    try:
+        from transformers.modeling_utils import no_init_weights
+        return no_init_weights()
+    except ImportError:
+        return contextlib.nullcontext()
+
+
+def load_model(name):
+    """Build the model from its stored config and point its weights at the mapped files."""
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+    directory = model_dir(name)
+    config = AutoConfig.from_pretrained(directory)
+    with _no_init_weights():
+        model = AutoModelForCausalLM.from_config(config)
+    state, handles = mmap_state_dict(weight_files(name))
+    # assign=True swaps the parameters for the mapped tensors instead of copying into them
+    result = model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    tied = set(getattr(model, "_tied_weights_keys", None) or [])
+    missing = set(result.missing_keys) - tied
+    if missing:
+        raise ValueError(f"Stored weights for {name} are missing: {sorted(missing)}")
+    model.eval()
+    model._mapped_weight_files = handles  # keep the mappings alive as long as the model
+    tokenizer = AutoTokenizer.from_pretrained(directory)
+    return model, tokenizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local safetensors model store")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("model", nargs="?", default="gpt2")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Exported {args.model} to {export_model(args.model)}")
+        return
+    if not has_model(args.model):
+        raise SystemExit(f"{args.model} is not in {MODEL_STORE_DIR}; run the export command first")
+    print("before load:", rss_report())
+    load_model(args.model)
+    print("after load: ", rss_report())
+
+
+if __name__ == "__main__":
+    main()
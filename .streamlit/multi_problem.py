@@ -0,0 +1,159 @@
+"""
+Multi-condition visits: one note, one request per problem.
+
+The shared subjective data (reason, history, medications, labs) is entered
+once. The Subjective section and each selected condition's Assessment & Plan
+entry are then requested concurrently as small focused completions that all
+share that context, and stitched into one note under a shared header. Wall
+time is that of the slowest request rather than the sum, and no request is
+asked to restate the shared history. Each request still takes its own
+generation_pool slot, so a large visit cannot crowd out other sessions.
+Every request starts with the same static system message and the same shared
+context, so after the first one the provider can serve that prefix from its
+cache.
+"""
+
+import asyncio
+import re
+import time
+
+import openai
+import streamlit as st
+
+import generation_pool
+import lab_trends
+import note_metrics
+import prompt_compress
+
+# Condition -> ICD-10 hint for the problem heading
+CONDITIONS = {
+    "CKD": "N18.x by stage",
+    "Hypertension": "I10, or I12.9 with CKD",
+    "Glomerulonephritis": "N05.x",
+    "Hyponatremia": "E87.1",
+    "Hypokalemia": "E87.6",
+    "Proteinuria & Hematuria": "R80.9 / R31.9",
+    "Renal Cyst": "N28.1",
+}
+
+# One static system prefix for every request of every visit, so the provider prefix cache can serve it
+MULTI_SYSTEM = (
+    "You are a seasoned nephrologist writing one section of a multi-problem clinic note. The user message gives "
+    "the shared visit context, then names the one section to write.\n"
+    "- Subjective: one concise paragraph summarizing the patient's history and current status from the shared "
+    "visit context. Do not write an assessment or plan.\n"
+    "- A problem: one item of the Assessment & Plan problem list. Start with the problem name and its ICD-10 code, "
+    "then a brief evidence-based assessment and the plan as short imperative statements. Use the shared visit "
+    "context but do not restate it, and do not address other problems."
+)
+
+
+def _slug(condition):
+    return re.sub(r"\W+", "_", condition.lower()).strip("_")
+
+
+def shared_context(visit_date, visit_type, reason, history, medications, labs):
+    return (f"Visit Date: {visit_date}\n"
+            f"Visit Type: {visit_type}\n"
+            f"Reason for Visit: {reason}\n\n"
+            f"Subjective / Interval History:\n{history}\n\n"
+            f"Medications:\n{medications}\n\n"
+            f"Lab Data:\n{lab_trends.compact_labs(labs)}\n")
+
+
+def subjective_prompt(context):
+    return f"{context}\nSection to write: Subjective\n"
+
+
+def problem_prompt(context, problem):
+    return (f"{context}\n"
+            f"Section to write: {problem['condition']} (ICD-10: {CONDITIONS.get(problem['condition'], 'as applicable')})\n"
+            f"Problem Details:\n{problem['details']}\n\n"
+            f"Clinician's Assessment & Plan Notes:\n{problem['plan']}\n")
+
+
+async def _complete(app, stage, prompt, credentials, model, max_tokens, temperature):
+    prompt, savings = prompt_compress.compress_with_stats(prompt)
+    timer = note_metrics.StageTimer(app, stage, model=model)
+    timer.annotate(**savings)
+    timer.prompt_built()
+    result = {"stage": stage, "text": "", "error": ""}
+    started = time.perf_counter()
+    try:
+        async with generation_pool.slot():
+            timer.dispatched()
+            response = await openai.ChatCompletion.acreate(
+                model=model,
+                messages=[{"role": "system", "content": MULTI_SYSTEM}, {"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **credentials,
+            )
+        timer.finished(response)
+        result["text"] = response.choices[0].message.content.strip()
+    except Exception as e:
+        timer.failed(e)
+        result["error"] = str(e)
+    result["elapsed_s"] = time.perf_counter() - started
+    return result
+
+
+async def generate_visit(context, problems, app, credentials, model="deepseek-chat", max_tokens=350, temperature=0.4):
+    """
+    Subjective and every problem concurrently; returns (subjective result, [problem results]). credentials
+    holds the api_base and api_key for the requests.
+    """
+    tasks = [_complete(app, "multi: Subjective", subjective_prompt(context), credentials, model, max_tokens,
+                       temperature)]
+    tasks += [_complete(app, f"multi: {p['condition']}", problem_prompt(context, p), credentials, model, max_tokens,
+                        temperature)
+              for p in problems]
+    results = await asyncio.gather(*tasks)
+    for problem, result in zip(problems, results[1:]):
+        result["condition"] = problem["condition"]
+    return results[0], list(results[1:])
+
+
+def generate(context, problems, app, credentials, **kwargs):
+    return asyncio.run(generate_visit(context, problems, app, credentials, **kwargs))
+
+
+def stitch(context, subjective, problems):
+    """One note: the shared header, the Subjective section and the numbered problem list."""
+    header = "\n".join(context.splitlines()[:3])
+    lines = [header, "", "Subjective:", subjective["text"] or f"[Not generated: {subjective['error']}]", "",
+             "Assessment & Plan:"]
+    for i, result in enumerate(problems, 1):
+        text = result["text"] or f"{result['condition']}: [Not generated: {result['error']}]"
+        lines.append(f"{i}. {text}")
+    return "\n".join(lines)
+
+
+def describe_timing(subjective, problems, wall_s):
+    results = [subjective] + problems
+    total = sum(r["elapsed_s"] for r in results)
+    return (f"{len(results)} requests in {wall_s:.1f}s wall time "
+            f"(slowest {max(r['elapsed_s'] for r in results):.1f}s, {total:.1f}s if run one after another)")
+
+
+def render_form(prefix, visit_type, visit_date):
+    """Shared fields once, then one expander per selected condition. Returns (context, problems)."""
+    selected = st.multiselect("Conditions addressed at this visit", list(CONDITIONS),
+                              default=["CKD", "Hypertension"], key=f"{prefix}_conditions")
+    reason = st.text_input("Reason for Visit", key=f"{prefix}_reason",
+                           placeholder="Defaults to the selected conditions")
+    history = st.text_area("Subjective / Interval History", key=f"{prefix}_history",
+                           placeholder="Symptoms, changes since last visit, relevant history")
+    medications = st.text_area("Medications", key=f"{prefix}_medications")
+    labs = st.text_area("Lab Data", key=f"{prefix}_labs", placeholder="e.g. Cr 1.8 -> 2.1 over 6 months, Na 129, K 3.2")
+    problems = []
+    for condition in selected:
+        with st.expander(condition, expanded=True):
+            details = st.text_area(f"{condition} Details", key=f"{prefix}_{_slug(condition)}_details",
+                                   placeholder="Problem-specific findings (stage, BP readings, imaging...)")
+            plan = st.text_area(f"{condition} Assessment & Plan", key=f"{prefix}_{_slug(condition)}_plan",
+                                placeholder="Your assessment and plan for this problem")
+        problems.append({"condition": condition, "details": details, "plan": plan})
+    suffix = "Evaluation" if visit_type == "New Patient" else "Follow-Up"
+    reason = reason or f"{', '.join(selected)} {suffix}"
+    return shared_context(visit_date, visit_type, reason, history, medications, labs), problems
@@ -0,0 +1,372 @@
+"""
+Version history for patient records: periodic full snapshots plus line deltas.
+
+Daily SOAP notes are mostly the previous day's note with a few lines changed,
+so storing every save as a full record wastes storage and transfer. Each save
+here becomes a new version of the patient's history:
+
+    history/<patient>/index.json             versions, kinds, sizes, times
+    history/<patient>/000001.snap.g0.json.gz full record (gzip)
+    history/<patient>/000002.delta.g0.json.gz changes against version 1
+
+A delta holds, per changed field, the line-level edit script against the
+previous version (text fields, and dict/list fields as canonical JSON) or the
+new value (scalars). A full snapshot is written every SNAPSHOT_EVERY versions,
+or sooner once the deltas since the last one outgrow it, so any version is
+rebuilt from one snapshot and at most SNAPSHOT_EVERY - 1 deltas; recently
+used versions are cached. compact() thins old history to the last version per
+day and rewrites the chain.
+
+Stores: S3Store(client, bucket) or LocalStore(directory).
+
+    python .streamlit/note_history.py show AB --dir ./history_store
+    python .streamlit/note_history.py compact --all --keep-days 7 --dir ./history_store
+    python .streamlit/note_history.py import-legacy --dir ./history_store --legacy-dir ./patients
+"""
+
+import argparse
+import collections
+import datetime
+import difflib
+import gzip
+import json
+import os
+import threading
+
+SNAPSHOT_EVERY = int(os.environ.get("NOTE_HISTORY_SNAPSHOT_EVERY", "10"))
+PREFIX = "history/"
+
+_CACHE = collections.OrderedDict()  # (store, patient, version) -> record
+_CACHE_SIZE = 64
+_LOCKS = collections.defaultdict(threading.Lock)
+
+
+# ---- storage ----
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        base = self._path(prefix.rstrip("/"))
+        if not os.path.isdir(base):
+            return []
+        keys = []
+        for directory, _, files in os.walk(base):
+            rel = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            keys.extend(f"{rel}/{name}" for name in files if not name.endswith(".tmp"))
+        return sorted(keys)
+
+
+class S3Store:
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key, data):
+        self.client.put_object(Body=data, Bucket=self.bucket, Key=key)
+
+    def get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        keys = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return keys
+
+
+# ---- deltas ----
+
+def _lines(value):
+    return value.splitlines(keepends=True)
+
+
+def line_delta(old, new):
+    """Edit script from old to new text: n>0 copies n lines, n<0 skips n lines, a string inserts it."""
+    a, b = _lines(old), _lines(new)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+        else:
+            if i2 > i1:
+                ops.append(i1 - i2)
+            ops.extend(b[j1:j2])
+    return ops
+
+
+def apply_line_delta(old, ops):
+    a, out, i = _lines(old), [], 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(a[i:i + op])
+            i += op
+        else:
+            i -= op
+    return "".join(out)
+
+
+def _canonical(value):
+    return json.dumps(value, indent=1, sort_keys=True)
+
+
+def record_delta(old, new):
+    delta = {"text": {}, "json": {}, "set": {}, "unset": [k for k in old if k not in new]}
+    for key, value in new.items():
+        before = old.get(key)
+        if key in old and before == value:
+            continue
+        if isinstance(value, str) and isinstance(before, str):
+            delta["text"][key] = line_delta(before, value)
+        elif isinstance(value, (dict, list)) and isinstance(before, (dict, list)):
+            delta["json"][key] = line_delta(_canonical(before), _canonical(value))
+        else:
+            delta["set"][key] = value
+    return delta
+
+
+def apply_record_delta(old, delta):
+    record = {k: v for k, v in old.items() if k not in delta["unset"]}
+    for key, ops in delta["text"].items():
+        record[key] = apply_line_delta(old[key], ops)
+    for key, ops in delta["json"].items():
+        record[key] = json.loads(apply_line_delta(_canonical(old[key]), ops))
+    record.update(delta["set"])
+    return record
+
+
+def _encode(obj):
+    return gzip.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"), mtime=0)
+
+
+def _decode(data):
+    return json.loads(gzip.decompress(data))
+
+
+# ---- history ----
+
+def _index_key(patient_id):
+    return f"{PREFIX}{patient_id}/index.json"
+
+
+def read_index(store, patient_id):
+    data = store.get(_index_key(patient_id))
+    return json.loads(data) if data else {"patient": patient_id, "generation": 0, "versions": []}
+
+
+def _write_index(store, index):
+    store.put(_index_key(index["patient"]), json.dumps(index, indent=1).encode("utf-8"))
+
+
+def _cache_put(store, patient_id, version, record):
+    _CACHE[(id(store), patient_id, version)] = record
+    _CACHE.move_to_end((id(store), patient_id, version))
+    while len(_CACHE) > _CACHE_SIZE:
+        _CACHE.popitem(last=False)
+
+
+def _rebuild(store, patient_id, entries, position):
+    """Record at entries[position]: from the nearest cached version or snapshot at or before it."""
+    start = position
+    while True:
+        cached = _CACHE.get((id(store), patient_id, entries[start]["v"]))
+        if cached is not None or entries[start]["kind"] == "snap":
+            break
+        start -= 1
+    record = cached if cached is not None else _decode(store.get(entries[start]["key"]))
+    for entry in entries[start + 1:position + 1]:
+        record = apply_record_delta(record, _decode(store.get(entry["key"])))
+    _cache_put(store, patient_id, entries[position]["v"], record)
+    return record
+
+
+def load(store, patient_id, version=None):
+    """The record as of a version (default: the latest), or None when the patient has no history."""
+    entries = read_index(store, patient_id)["versions"]
+    if not entries:
+        return None
+    if version is None:
+        position = len(entries) - 1
+    else:
+        position = next((i for i, e in enumerate(entries) if e["v"] == version), None)
+        if position is None:
+            raise KeyError(f"{patient_id} has no version {version}")
+    return dict(_rebuild(store, patient_id, entries, position))
+
+
+def _object_key(patient_id, version, kind, generation):
+    return f"{PREFIX}{patient_id}/{version:06d}.{kind}.g{generation}.json.gz"
+
+
+def _append(store, index, record, previous, saved_at, snapshot_every, version=None):
+    """Write record as the next version after previous (None for the first); returns the new index entry."""
+    entries = index["versions"]
+    version = version or (entries[-1]["v"] + 1 if entries else 1)
+    kind, payload = "snap", record
+    if previous is not None:
+        last_snap = max(i for i, e in enumerate(entries) if e["kind"] == "snap")
+        chain = sum(e["size"] for e in entries[last_snap + 1:])
+        delta = _encode(record_delta(previous, record))
+        if len(entries) - last_snap < snapshot_every and chain + len(delta) < entries[last_snap]["size"]:
+            kind, payload = "delta", None
+    data = delta if kind == "delta" else _encode(payload)
+    key = _object_key(index["patient"], version, kind, index["generation"])
+    store.put(key, data)
+    entry = {"v": version, "kind": kind, "key": key, "size": len(data), "saved_at": saved_at,
+             "note_type": record.get("note_type"), "last_updated": record.get("last_updated")}
+    entries.append(entry)
+    _cache_put(store, index["patient"], version, record)
+    return entry
+
+
+def save(store, record, snapshot_every=SNAPSHOT_EVERY, saved_at=None):
+    """
+    Save a record as a new version of its patient's history. Returns the index entry, or None when nothing
+    changed since the latest version.
+    """
+    patient_id = record["id"]
+    record = json.loads(json.dumps(record))  # a private, JSON-shaped copy
+    with _LOCKS[patient_id]:
+        index = read_index(store, patient_id)
+        previous = load(store, patient_id) if index["versions"] else None
+        if previous == record:
+            return None
+        saved_at = saved_at or datetime.datetime.now().isoformat(timespec="seconds")
+        entry = _append(store, index, record, previous, saved_at, snapshot_every)
+        _write_index(store, index)
+        return entry
+
+
+def versions(store, patient_id):
+    """Index entries of a patient's history, oldest first, for browsing."""
+    return read_index(store, patient_id)["versions"]
+
+
+def compact(store, patient_id, keep_days=7, snapshot_every=SNAPSHOT_EVERY, today=None):
+    """
+    Keep every version from the last keep_days days and the last version of each earlier day, and rewrite
+    the chain (fresh snapshots and deltas). Returns (versions before, versions after, bytes before, bytes after).
+    """
+    with _LOCKS[patient_id]:
+        index = read_index(store, patient_id)
+        entries = index["versions"]
+        if not entries:
+            return 0, 0, 0, 0
+        cutoff = ((today or datetime.date.today()) - datetime.timedelta(days=keep_days)).isoformat()
+        keep = []
+        for i, entry in enumerate(entries):
+            day = entry["saved_at"][:10]
+            last_of_day = i + 1 == len(entries) or entries[i + 1]["saved_at"][:10] != day
+            if day >= cutoff or last_of_day:
+                keep.append(i)
+        records = [(entries[i], _rebuild(store, patient_id, entries, i)) for i in keep]
+        rewritten = {"patient": patient_id, "generation": index["generation"] + 1, "versions": []}
+        previous = None
+        for entry, record in records:
+            # Kept versions keep their number and save time, so references to them stay valid
+            _append(store, rewritten, record, previous, entry["saved_at"], snapshot_every, version=entry["v"])
+            previous = record
+        _write_index(store, rewritten)  # the new chain is complete before the old one goes
+        for entry in entries:
+            store.delete(entry["key"])
+        _drop_cached(store, patient_id)
+        before = sum(e["size"] for e in entries)
+        after = sum(e["size"] for e in rewritten["versions"])
+        return len(entries), len(rewritten["versions"]), before, after
+
+
+def _drop_cached(store, patient_id):
+    for key in [k for k in _CACHE if k[0] == id(store) and k[1] == patient_id]:
+        del _CACHE[key]
+
+
+def patients(store):
+    return sorted({key[len(PREFIX):].split("/")[0] for key in store.list(PREFIX) if key.endswith("/index.json")})
+
+
+def import_legacy(store, records):
+    """Add (saved_at, record) pairs saved the old way (patients/<id>_<timestamp>.json) to the history."""
+    saved = [save(store, record, saved_at=saved_at) for saved_at, record in sorted(records, key=lambda r: r[0])]
+    return sum(entry is not None for entry in saved)
+
+
+def _legacy_time(name):
+    # patients/<id>_<%Y%m%dT%H%M%S>.json
+    stamp = name.rsplit("_", 1)[-1][:-len(".json")]
+    return datetime.datetime.strptime(stamp, "%Y%m%dT%H%M%S").isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browse and maintain patient note history")
+    parser.add_argument("command", choices=["show", "compact", "import-legacy"])
+    parser.add_argument("patient", nargs="?")
+    parser.add_argument("--all", action="store_true", help="every patient in the store")
+    parser.add_argument("--dir", help="local history directory (default: S3 bucket from BUCKET_NAME)")
+    parser.add_argument("--keep-days", type=int, default=7)
+    parser.add_argument("--legacy-dir", help="directory of legacy <id>_<timestamp>.json records")
+    args = parser.parse_args()
+
+    if args.dir:
+        store = LocalStore(args.dir)
+    else:
+        import boto3
+
+        store = S3Store(boto3.client("s3"), os.environ["BUCKET_NAME"])
+
+    if args.command == "import-legacy":
+        records = []
+        if args.legacy_dir:
+            for name in os.listdir(args.legacy_dir):
+                if name.endswith(".json"):
+                    with open(os.path.join(args.legacy_dir, name)) as f:
+                        records.append((_legacy_time(name), json.load(f)))
+        else:
+            for key in store.list("patients/"):
+                records.append((_legacy_time(key), json.loads(store.get(key))))
+        print(f"Imported {import_legacy(store, records)} versions")
+        return
+
+    targets = patients(store) if args.all else [args.patient]
+    for patient_id in targets:
+        if args.command == "show":
+            for e in versions(store, patient_id):
+                print(f"{patient_id} v{e['v']:<5} {e['kind']:5} {e['size']:>8} B  {e['saved_at']}  {e['note_type']}")
+        else:
+            n_before, n_after, before, after = compact(store, patient_id, keep_days=args.keep_days)
+            print(f"{patient_id}: {n_before} -> {n_after} versions, {before} -> {after} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Background generation jobs that survive Streamlit reruns.
+
+A button that calls the LLM inline loses the result as soon as any widget
+interaction reruns the script. Instead, generation is submitted as a job:
+
+    job = note_jobs.submit("AB: Consultation Note", run, on_done, patient="AB")
+
+run(job) executes on a process-wide worker thread (NOTE_JOB_WORKERS, default
+4) and returns the note; it may publish partial text as job.partial while it
+streams. on_done(job) runs on the same thread once the job has finished, so
+results are saved (e.g. into the patient record they were generated for) even
+if the user has moved on to another patient or tab. The job ids of a session
+are kept in st.session_state, and render_panel() lists them in a fragment
+that refreshes every NOTE_JOB_POLL seconds while any job is pending and reruns
+the page when one completes. Set NOTE_JOBS_JSONL to also append every
+finished job to a JSON lines file.
+
+Jobs act for the session that submitted them in the generation_pool queue.
+"""
+
+import collections
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+import generation_pool
+
+WORKERS = int(os.environ.get("NOTE_JOB_WORKERS", "4"))
+POLL_S = float(os.environ.get("NOTE_JOB_POLL", "1.0"))
+MAX_JOBS = 500
+
+SESSION_KEY = "note_jobs"
+SEEN_KEY = "note_jobs_seen"
+
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(WORKERS, thread_name_prefix="note-job")
+_JOBS = collections.OrderedDict()  # id -> Job, oldest first
+_IDLE = threading.Condition()
+_pending = 0
+
+
+class Job:
+    def __init__(self, label, session, meta):
+        self.id = uuid.uuid4().hex[:8]
+        self.label = label
+        self.session = session
+        self.meta = meta
+        self.status = "queued"  # queued, running, done, failed
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.caption = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def describe(self):
+        if self.status == "queued":
+            return "queued"
+        if self.status == "running":
+            return f"running {time.time() - self.started:.0f}s"
+        return f"{self.status} in {self.finished - self.started:.0f}s"
+
+    def as_record(self):
+        return {"id": self.id, "label": self.label, "status": self.status, "result": self.result,
+                "error": self.error, "created": self.created, "finished": self.finished, **self.meta}
+
+
+def submit(label, run, on_done=None, **meta):
+    """Queue run(job) in the background and remember the job in the calling session. Returns the Job."""
+    global _pending
+    job = Job(label, generation_pool.current_session(), meta)
+    with _IDLE:
+        _JOBS[job.id] = job
+        while len(_JOBS) > MAX_JOBS:
+            oldest = next(iter(_JOBS))
+            if not _JOBS[oldest].done:
+                break
+            del _JOBS[oldest]
+        _pending += 1
+    try:
+        st.session_state.setdefault(SESSION_KEY, []).append(job.id)
+    except Exception:
+        pass  # submitted outside a script run
+    _EXECUTOR.submit(_run, job, run, on_done)
+    return job
+
+
+def _run(job, run, on_done):
+    global _pending
+    job.status = "running"
+    job.started = time.time()
+    try:
+        with generation_pool.acting_for(job.session):
+            job.result = run(job)
+        if on_done:
+            on_done(job)
+        job.status = "done"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+    job.finished = time.time()
+    _persist(job)
+    with _IDLE:
+        _pending -= 1
+        _IDLE.notify_all()
+
+
+def _persist(job):
+    path = os.environ.get("NOTE_JOBS_JSONL")
+    if path:
+        with _IDLE, open(path, "a") as f:
+            f.write(json.dumps(job.as_record()) + "\n")
+
+
+def get(job_id):
+    return _JOBS.get(job_id)
+
+
+def session_jobs(state):
+    """This session's jobs that are still known to the process, oldest first."""
+    return [_JOBS[i] for i in state.get(SESSION_KEY, []) if i in _JOBS]
+
+
+def wait_idle(timeout=None):
+    """Block until no job is queued or running (benchmarks and scripts); returns False on timeout."""
+    with _IDLE:
+        return _IDLE.wait_for(lambda: _pending == 0, timeout)
+
+
+def _panel(title):
+    state = st.session_state
+    jobs = session_jobs(state)
+    seen = state.setdefault(SEEN_KEY, set())
+    st.subheader(title)
+    for i, job in enumerate(reversed(jobs)):
+        with st.expander(f"{job.label} - {job.describe()}", expanded=i == 0 or not job.done):
+            if job.error:
+                st.error(f"Generation failed: {job.error}")
+            text = job.result or job.partial
+            if text:
+                # Hard line breaks so the note keeps its lines
+                st.markdown(text.replace("\n", "  \n"))
+            elif not job.done:
+                st.caption("Waiting for the first lines...")
+            if job.caption:
+                st.caption(job.caption)
+    finished = [job.id for job in jobs if job.done and job.id not in seen]
+    if finished:
+        seen.update(finished)
+        # Results were saved by on_done; rerun the whole page so it shows them
+        st.rerun()
+
+
+def render_panel(title="Notes in progress"):
+    """The session's jobs with their live text, polling while any of them is pending."""
+    jobs = session_jobs(st.session_state)
+    if not jobs:
+        return
+    pending = any(not job.done for job in jobs)
+    st.fragment(run_every=POLL_S if pending else None)(_panel)(title)
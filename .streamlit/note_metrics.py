@@ -0,0 +1,222 @@
+"""
+Per-stage timing and token instrumentation for the note generation calls.
+
+Every generation stage in the apps creates a StageTimer before it builds its
+prompt and marks the points of interest as it goes:
+
+    timer = note_metrics.StageTimer("app_phase1", "consult", model="deepseek-chat")
+    prompt = ...
+    timer.prompt_built()
+    timer.dispatched()
+    response = openai.Completion.create(...)
+    timer.finished(response)
+
+Finished stages are kept in a process-wide ring buffer (for export) and in the
+session that produced them (for the sidebar panel). Set NOTE_METRICS_JSONL to
+also append every record to a JSON lines file.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import streamlit as st
+
+_RECORDS = collections.deque(maxlen=2000)
+_LOCK = threading.Lock()
+
+SESSION_KEY = "note_metrics"
+
+# Timing fields exported as Prometheus summaries, with their help text
+_TIMINGS = {
+    "prompt_build_s": ("note_prompt_build_seconds", "Time spent building the prompt"),
+    "queue_wait_s": ("note_queue_wait_seconds", "Time between prompt ready and request dispatch"),
+    "ttft_s": ("note_time_to_first_token_seconds", "Time from dispatch to the first completion token"),
+    "latency_s": ("note_generation_latency_seconds", "Time from dispatch to the full completion"),
+}
+
+
+def _usage_value(usage, key):
+    if usage is None:
+        return None
+    value = usage.get(key) if hasattr(usage, "get") else getattr(usage, key, None)
+    return int(value) if value is not None else None
+
+
+def _cached_tokens(usage):
+    """Prompt tokens served from the provider's prefix cache (DeepSeek or OpenAI usage fields)."""
+    cached = _usage_value(usage, "prompt_cache_hit_tokens")
+    if cached is None and usage is not None:
+        details = usage.get("prompt_tokens_details") if hasattr(usage, "get") else None
+        cached = _usage_value(details, "cached_tokens")
+    return cached
+
+
+class StageTimer:
+    """Collects the timestamps and token counts of one generation stage."""
+
+    def __init__(self, app, stage, model=None):
+        self.app = app
+        self.stage = stage
+        self.model = model
+        self.started = time.perf_counter()
+        self.prompt_built_at = None
+        self.dispatched_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cached_prompt_tokens = None
+        self.error = None
+        self.extra = {}
+        try:
+            self._session_records = st.session_state.setdefault(SESSION_KEY, [])
+        except Exception:
+            # No script run context (background thread, plain python)
+            self._session_records = None
+
+    def annotate(self, **fields):
+        """Attach extra fields (e.g. prompt compression stats) to the record."""
+        self.extra.update(fields)
+
+    def prompt_built(self):
+        self.prompt_built_at = time.perf_counter()
+
+    def dispatched(self):
+        self.dispatched_at = time.perf_counter()
+        if self.prompt_built_at is None:
+            self.prompt_built_at = self.dispatched_at
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finished(self, response=None, prompt_tokens=None, completion_tokens=None):
+        """Close the stage; token counts come from response.usage when available."""
+        self.finished_at = time.perf_counter()
+        usage = response.get("usage") if hasattr(response, "get") else getattr(response, "usage", None)
+        self.prompt_tokens = prompt_tokens if prompt_tokens is not None else _usage_value(usage, "prompt_tokens")
+        self.completion_tokens = (completion_tokens if completion_tokens is not None
+                                  else _usage_value(usage, "completion_tokens"))
+        self.cached_prompt_tokens = _cached_tokens(usage)
+        self._record()
+
+    def failed(self, error):
+        self.finished_at = time.perf_counter()
+        self.error = str(error)
+        self._record()
+
+    def as_record(self):
+        dispatched = self.dispatched_at or self.prompt_built_at or self.started
+        prompt_built = self.prompt_built_at or dispatched
+        # Non-streaming calls deliver their first token together with the rest
+        first_token = self.first_token_at or self.finished_at
+        latency = self.finished_at - dispatched
+        tokens_per_s = None
+        if self.completion_tokens and latency > 0:
+            tokens_per_s = round(self.completion_tokens / latency, 2)
+        return {
+            "ts": time.time(),
+            "app": self.app,
+            "stage": self.stage,
+            "model": self.model,
+            "prompt_build_s": round(prompt_built - self.started, 6),
+            "queue_wait_s": round(dispatched - prompt_built, 6),
+            "ttft_s": round(first_token - dispatched, 6),
+            "latency_s": round(latency, 6),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "tokens_per_s": tokens_per_s,
+            "error": self.error,
+            **self.extra,
+        }
+
+    def _record(self):
+        record = self.as_record()
+        with _LOCK:
+            _RECORDS.append(record)
+        if self._session_records is not None:
+            self._session_records.append(record)
+        path = os.environ.get("NOTE_METRICS_JSONL")
+        if path:
+            with _LOCK, open(path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def all_records():
+    with _LOCK:
+        return list(_RECORDS)
+
+
+def to_jsonl(records):
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(record):
+    return f'app="{_label_value(record["app"])}",stage="{_label_value(record["stage"])}"'
+
+
+def to_prometheus(records):
+    """Render records in the Prometheus text exposition format."""
+    groups = collections.OrderedDict()
+    for r in records:
+        groups.setdefault(_labels(r), []).append(r)
+
+    lines = []
+    for field, (name, help_text) in _TIMINGS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+        for labels, rows in groups.items():
+            values = [r[field] for r in rows if r[field] is not None and not r["error"]]
+            lines.append(f"{name}_sum{{{labels}}} {sum(values):.6f}")
+            lines.append(f"{name}_count{{{labels}}} {len(values)}")
+
+    for field, name in (("prompt_tokens", "note_prompt_tokens_total"),
+                        ("completion_tokens", "note_completion_tokens_total"),
+                        ("cached_prompt_tokens", "note_prompt_cached_tokens_total"),
+                        ("tokens_saved", "note_prompt_tokens_saved_total")):
+        lines.append(f"# TYPE {name} counter")
+        for labels, rows in groups.items():
+            lines.append(f"{name}{{{labels}}} {sum(r.get(field) or 0 for r in rows)}")
+
+    lines.append("# TYPE note_stage_errors_total counter")
+    for labels, rows in groups.items():
+        lines.append(f"note_stage_errors_total{{{labels}}} {sum(1 for r in rows if r['error'])}")
+    return "\n".join(lines) + "\n"
+
+
+def cache_hit_rate(records):
+    """Share of prompt tokens served from the provider prefix cache, over records that report it."""
+    reported = [r for r in records if r.get("cached_prompt_tokens") is not None and r.get("prompt_tokens")]
+    total = sum(r["prompt_tokens"] for r in reported)
+    return sum(r["cached_prompt_tokens"] for r in reported) / total if total else None
+
+
+def render_metrics_panel():
+    """Optional sidebar panel with this session's stages and export buttons."""
+    if not st.sidebar.checkbox("Show generation metrics", key="show_note_metrics"):
+        return
+    records = st.session_state.get(SESSION_KEY, [])
+    st.sidebar.subheader("Generation Metrics")
+    if not records:
+        st.sidebar.caption("No generation stages recorded in this session yet.")
+    else:
+        columns = ["stage", "prompt_build_s", "model_wait_s", "queue_wait_s", "ttft_s", "latency_s",
+                   "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "tokens_per_s", "error"]
+        st.sidebar.dataframe([{c: r.get(c) for c in columns} for r in records[-20:]])
+        hit_rate = cache_hit_rate(records)
+        if hit_rate is not None:
+            st.sidebar.caption(f"Prefix cache: {hit_rate:.0%} of prompt tokens served from cache")
+    scope = st.sidebar.radio("Export scope", ["This session", "All sessions"], key="note_metrics_scope")
+    export = records if scope == "This session" else all_records()
+    st.sidebar.download_button("Export Prometheus", data=to_prometheus(export),
+                               file_name="note_metrics.prom", mime="text/plain")
+    st.sidebar.download_button("Export JSON Lines", data=to_jsonl(export),
+                               file_name="note_metrics.jsonl", mime="application/json")
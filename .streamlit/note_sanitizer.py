@@ -0,0 +1,195 @@
+"""
+Incremental cleanup of generated notes.
+
+NoteSanitizer takes the completion as it streams in (`feed(chunk)` per token
+or chunk, `close()` at the end) and releases cleaned text a line at a time,
+so the cleanup finishes with the last token instead of running over the whole
+note afterwards. Lookahead is bounded: one partial line, or at most the length
+of the prompt while checking whether the model is echoing it back (the HF
+pipeline returns prompt + completion in `generated_text`).
+
+Each line goes through the line rules (precompiled regexes) in order; a rule
+returns the new line or None to drop it. The sanitizer itself then normalizes
+section headers and drops repeated lines and runs of blank lines. A section
+header seen before holds its lines back only while they match the earlier
+section: a word-for-word restart of the whole section is dropped, anything
+else (a "Labs:" line inside the plan) is released as soon as it differs.
+
+    sanitizer = NoteSanitizer(prompt)
+    for piece in pieces:
+        sanitizer.feed(piece)
+    sanitizer.close()
+    note = sanitizer.result
+"""
+
+import re
+
+# Canonical section header -> spellings the models use
+SECTIONS = {
+    "Reason for Consultation": ["reason for consultation", "reason for consult", "reason for visit"],
+    "History of Present Illness (HPI)": ["history of present illness (hpi)", "history of present illness", "hpi"],
+    "Subjective": ["subjective"],
+    "Objective": ["objective"],
+    "Labs": ["labs", "lab data", "laboratory data"],
+    "Assessment and Plan": ["assessment and plan", "assessment & plan", "assessment/plan", "a&p", "a/p"],
+}
+_ALIASES = {alias: name for name, aliases in SECTIONS.items() for alias in aliases}
+_ALIAS_PATTERN = "|".join(re.escape(a) for a in sorted(_ALIASES, key=len, reverse=True))
+# "## HPI", "**Assessment & Plan:**", "2. History of Present Illness (HPI): text" (markdown already stripped)
+_HEADER = re.compile(rf"^\s*(?:\d+[.)]\s*)?({_ALIAS_PATTERN})\s*(?::\s*(.*)|$)", re.IGNORECASE)
+
+_HEADING_MARKS = re.compile(r"^\s*#{1,6}\s+")
+_BULLET = re.compile(r"^(\s*)[*•]\s+")
+_STRAY_ASTERISK = re.compile(r"^\s*\*+\s*(?=\S)")
+_EMPHASIS = re.compile(r"\*\*|__")
+_TRAILING_SPACE = re.compile(r"[ \t]+$")
+
+
+def strip_markdown(line):
+    """Markdown to plain text for the note fields: headings, bullets and bold markers."""
+    line = _HEADING_MARKS.sub("", line)
+    line = _EMPHASIS.sub("", line)
+    line = _BULLET.sub(r"\1- ", line)
+    return _STRAY_ASTERISK.sub("", line)
+
+
+def strip_trailing_space(line):
+    return _TRAILING_SPACE.sub("", line)
+
+
+DEFAULT_RULES = (strip_markdown, strip_trailing_space)
+
+
+def section_of(line):
+    """(canonical section name, text after the header) for a header line, else (None, None)."""
+    match = _HEADER.match(line)
+    if not match:
+        return None, None
+    return _ALIASES[match.group(1).lower()], (match.group(2) or "").strip()
+
+
+class NoteSanitizer:
+    def __init__(self, prompt="", rules=DEFAULT_RULES, dedupe_sections=True):
+        self.rules = rules
+        self.dedupe_sections = dedupe_sections
+        self.text = ""
+        self._echo = (prompt or "").strip()
+        self._echo_pending = bool(self._echo)
+        self._buffer = ""
+        self._blocks = {}  # section -> its non-blank lines, as first written
+        self._current = None
+        self._repeat = None  # (earlier block, lines held back) while a repeated section matches it
+        self._last_line = ""
+
+    def feed(self, chunk):
+        """Add streamed text; returns the cleaned text released by it (possibly "")."""
+        self._buffer += chunk
+        if self._echo_pending:
+            head = self._buffer.lstrip()
+            if len(head) < len(self._echo) and self._echo.startswith(head):
+                return ""  # may still turn out to be the prompt echoed back
+            if head.startswith(self._echo):
+                self._buffer = head[len(self._echo):]
+            self._echo_pending = False
+        *lines, self._buffer = self._buffer.split("\n")
+        return self._emit(lines)
+
+    def close(self):
+        """Flush the last partial line; returns the cleaned text released by it."""
+        self._echo_pending = False
+        lines = [self._buffer] if self._buffer else []
+        self._buffer = ""
+        return self._emit(lines, final=True)
+
+    @property
+    def result(self):
+        return self.text.strip()
+
+    def _emit(self, lines, final=False):
+        out = []
+        for line in lines:
+            for rule in self.rules:
+                line = rule(line)
+                if line is None:
+                    break
+            if line is None:
+                continue
+            section, rest = section_of(line)
+            if section:
+                line = f"{section}: {rest}" if rest else f"{section}:"
+                self._end_repeat(out)
+                if self.dedupe_sections and section in self._blocks:
+                    # Possibly the model starting the same section over: hold it while it matches the first one
+                    self._current = None
+                    self._repeat = (self._blocks[section], [])
+                else:
+                    self._blocks[section] = []
+                    self._current = section
+            if self._repeat is not None:
+                self._hold(line, out)
+            else:
+                self._write(line, out)
+        if final:
+            self._end_repeat(out)
+        text = "".join(out)
+        self.text += text
+        return text
+
+    def _hold(self, line, out):
+        earlier, held = self._repeat
+        held.append(line)
+        written = [l for l in held if l.strip()]
+        if written != earlier[:len(written)]:
+            self._repeat = None  # differs from the earlier section, so it is new content
+            for l in held:
+                self._write(l, out)
+
+    def _end_repeat(self, out):
+        """The held section is complete: drop it if it repeats the earlier one exactly, else release it."""
+        if self._repeat is None:
+            return
+        earlier, held = self._repeat
+        self._repeat = None
+        if [l for l in held if l.strip()] != earlier:
+            for l in held:
+                self._write(l, out)
+
+    def _write(self, line, out):
+        if line.strip() and line == self._last_line:
+            return
+        if not line.strip() and not self._last_line.strip():
+            return  # leading blank lines and blank runs
+        self._last_line = line
+        out.append(line + "\n")
+        if self._current is not None and line.strip():
+            self._blocks[self._current].append(line)
+
+
+def sanitize(text, prompt="", **kwargs):
+    """Whole-text convenience wrapper around NoteSanitizer."""
+    sanitizer = NoteSanitizer(prompt, **kwargs)
+    sanitizer.feed(text)
+    sanitizer.close()
+    return sanitizer.result
+
+
+def consume(pieces, prompt="", on_text=None, on_first_piece=None):
+    """
+    Sanitize an iterator of text pieces, calling on_text(cleaned text so far) each time a line is released.
+    Returns (raw completion, cleaned note).
+    """
+    sanitizer = NoteSanitizer(prompt)
+    raw = []
+    for piece in pieces:
+        if not raw and on_first_piece:
+            on_first_piece()
+        raw.append(piece)
+        if sanitizer.feed(piece) and on_text:
+            on_text(sanitizer.text)
+    sanitizer.close()
+    return "".join(raw), sanitizer.result
+
+
+def stream_to(placeholder, pieces, prompt="", on_first_piece=None):
+    """consume(), redrawing a st.empty() placeholder each time a line is released."""
+    return consume(pieces, prompt, lambda text: placeholder.markdown(text.replace("\n", "  \n")), on_first_piece)
@@ -0,0 +1,168 @@
+"""
+Local segmenter that turns a free-text visit note into the structured fields.
+
+Clinicians type "68M here for CKD f/u. Cr 1.8 -> 2.1 over 6 mo, K 5.2. On
+lisinopril 20 mg daily. Plan: continue lisinopril, recheck BMP in 3 mo." into
+one box. segment() splits that into reason, history, labs, meds, assessment &
+plan and other, so Free Text mode can send the same compact prompt as
+Structured Input (structured_prompt) instead of leaving all structure to the
+model. Explicit headers ("HPI:", "A/P:", "Meds -" on its own line) are found
+with one compiled pattern built from the alias lexicon below and apply until
+the next header; unlabeled sentences are classified locally: lab lines by the
+lab_trends parser, medication lines by the drug term file and dose patterns,
+plan lines by numbered problems, problem abbreviations and plan verbs, and the
+first "here for"/"f/u" sentence as the reason. No model call is involved.
+
+    python .streamlit/note_segmenter.py "68M here for CKD f/u. Cr 1.8 -> 2.1. Plan: recheck BMP in 3 mo."
+"""
+
+import re
+import sys
+
+import drug_names
+import lab_trends
+
+SECTIONS = ("reason", "history", "labs", "meds", "assessment_plan", "other")
+
+# Header aliases per section; matched case-insensitively, longest first
+HEADERS = {
+    "reason": ["reason for visit", "reason for consultation", "reason for consult", "reason for referral", "reason",
+               "chief complaint", "cc", "rfv"],
+    "history": ["history of present illness", "interval history", "interval hx", "since last visit", "hpi",
+                "subjective", "history", "hx", "s"],
+    "labs": ["laboratory data", "lab results", "lab data", "laboratory", "labs", "lab", "data", "results"],
+    "meds": ["current medications", "home medications", "medications", "current meds", "home meds", "med list",
+             "meds", "rx"],
+    "assessment_plan": ["assessment and plan", "assessment & plan", "impression and plan", "impression/plan",
+                        "assessment/plan", "assessment", "impression", "a&p", "a/p", "plan", "a", "p"],
+    "other": ["past medical history", "social history", "family history", "physical exam", "review of systems",
+              "allergies", "vitals", "comments", "exam", "pmh", "psh", "ros", "sh", "fh", "pe"],
+}
+# Problem abbreviations that open an assessment & plan line ("CKD 3b - continue ...")
+PROBLEMS = ["ckd", "aki", "esrd", "eskd", "htn", "dm", "dm2", "t2dm", "gn", "iga", "fsgs", "ras", "pkd", "adpkd",
+            "hyponatremia", "hypernatremia", "hypokalemia", "hyperkalemia", "proteinuria", "hematuria", "anemia",
+            "acidosis", "nephrolithiasis", "renal cyst", "hypertension", "diabetes", "glomerulonephritis",
+            "volume overload", "edema", "bmd", "ckd-mbd", "shpt"]
+PLAN_VERBS = ["continue", "cont", "start", "begin", "increase", "incr", "decrease", "decr", "reduce",
+              "hold", "stop", "d/c", "discontinue", "recheck", "repeat", "check", "monitor", "order", "obtain",
+              "refer", "referral", "consider", "plan", "f/u", "follow up", "follow-up", "rtc", "return", "titrate",
+              "avoid", "counsel", "counseled", "discussed", "goal", "target"]
+MED_CUES = ["on", "taking", "takes", "meds", "medications", "current meds"]
+REASON_RE = re.compile(
+    r"\b(?:here|presents?|presenting|seen|referred|returns?|comes?|coming in)\s+(?:today\s+)?(?:for|with|to)\b"
+    r"|\bf/u\b|\bfollow[- ]?up\s+(?:for|of|on)\b|\b(?:eval|evaluation)\s+(?:of|for)\b|\bconsult(?:ed)?\s+for\b",
+    re.IGNORECASE,
+)
+
+_aliases = sorted(((a, s) for s, names in HEADERS.items() for a in names), key=lambda x: len(x[0]), reverse=True)
+_ALIAS_SECTION = {a: s for a, s in _aliases}
+_alias_re = "|".join(re.escape(a) for a, _ in _aliases)
+# "HPI: ...", "**A/P:** ...", "## Labs" / "Plan" alone on a line; single letters need the colon ("S:", "A:")
+HEADER_RE = re.compile(
+    rf"(?:^|(?<=[.;!?])\s+)[#*\s]*(?P<header>{_alias_re})[*]*\s*(?::|\s-\s|$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+SENTENCE_RE = re.compile(r"(?<=[.;!?])\s+(?=[A-Z0-9#(])|\n+")
+PROBLEM_RE = re.compile(rf"^\s*(?:#\s*|\d+[.)]\s*|-\s*)?(?:{'|'.join(map(re.escape, PROBLEMS))})\b[^:\n]{{0,40}}[:\-–]",
+                        re.IGNORECASE)
+NUMBERED_RE = re.compile(r"^\s*(?:#\s*\w|\d+[.)]\s+\w)")
+PLAN_RE = re.compile(rf"^\s*(?:-\s*)?(?:{'|'.join(map(re.escape, PLAN_VERBS))})\b", re.IGNORECASE)
+MED_CUE_RE = re.compile(rf"^\s*(?:{'|'.join(map(re.escape, MED_CUES))})\b[:\s]*", re.IGNORECASE)
+FREQUENCY_RE = re.compile(r"\b(?:daily|qd|bid|tid|qid|qhs|prn|weekly|q\d+h|once|twice)\b", re.IGNORECASE)
+
+
+def _is_header(match, text):
+    alias = match.group("header").lower()
+    # A bare word without a colon is only a header when it is the whole line ("Plan"), not prose ("plan to ...")
+    if not match.group(0).rstrip().endswith((":", "-")):
+        line_end = text.find("\n", match.end())
+        rest = text[match.end():line_end if line_end >= 0 else len(text)]
+        return not rest.strip() and len(alias) > 2
+    return len(alias) > 1 or match.group(0).rstrip().endswith(":")
+
+
+def _chunks(text):
+    """(section or None, text) pieces of the note, split at headers."""
+    chunks, section, last = [], None, 0
+    for match in HEADER_RE.finditer(text):
+        if not _is_header(match, text):
+            continue
+        chunks.append((section, text[last:match.start()]))
+        section, last = _ALIAS_SECTION[match.group("header").lower()], match.end()
+    chunks.append((section, text[last:]))
+    return [(s, t.strip()) for s, t in chunks if t.strip()]
+
+
+def _is_lab(sentence):
+    series, rest = lab_trends.parse_labs(sentence)
+    return bool(series) and len(rest) <= len(sentence) / 2
+
+
+def _is_med(sentence):
+    if PLAN_RE.match(sentence):
+        return False  # "Start amlodipine 5 mg" is a plan
+    items = [item.strip(" .") for item in re.split(r"[,;]|\band\b", MED_CUE_RE.sub("", sentence)) if item.strip(" .")]
+    # A known drug name (exact term, a fuzzy match would take prose words for drugs) or a dose with a frequency
+    meds = sum(drug_names.normalize(item)["distance"] == 0
+               or bool(drug_names.STRENGTH_RE.search(item) and FREQUENCY_RE.search(item)) for item in items)
+    return meds > 0 and meds * 2 >= len(items)
+
+
+def classify(sentence, reason_found=False):
+    """Section of an unlabeled sentence."""
+    if not reason_found and REASON_RE.search(sentence):
+        return "reason"
+    if PROBLEM_RE.match(sentence) or NUMBERED_RE.match(sentence) or PLAN_RE.match(sentence):
+        return "assessment_plan"
+    if _is_lab(sentence):
+        return "labs"
+    if _is_med(sentence):
+        return "meds"
+    return "history"
+
+
+def segment(text):
+    """Split free text into {section: text} for every section in SECTIONS (empty string when absent)."""
+    found = {s: [] for s in SECTIONS}
+    for section, chunk in _chunks(text or ""):
+        if section == "assessment_plan":
+            found[section].append(chunk)  # keeps one problem per line
+            continue
+        if section is not None:
+            found[section].append(re.sub(r"\s*\n\s*", "; " if section in ("labs", "meds", "other") else " ", chunk))
+            continue
+        for sentence in SENTENCE_RE.split(chunk):
+            sentence = sentence.strip()
+            if sentence:
+                found[classify(sentence, bool(found["reason"]))].append(sentence)
+    return {s: ("\n" if s == "assessment_plan" else " ").join(parts) for s, parts in found.items()}
+
+
+def structured_prompt(segments, condition, visit_type, visit_date):
+    """The Structured Input prompt for the segmented fields; the reason defaults from condition and visit type."""
+    segments = {name: value.rstrip(" .;") for name, value in segments.items()}  # the template adds its own "."
+    new_patient = visit_type == "New Patient"
+    reason = segments["reason"] or f"{condition} {'Evaluation' if new_patient else 'Follow-Up'}"
+    history = f"Subjective:\nHPI: {segments['history']}." if new_patient else \
+        f"Interval History: {segments['history']}"
+    return f"""
+Visit Date: {visit_date}
+Reason for Visit: {reason}
+
+{history}
+Medications: {segments['meds']}.
+Lab Data: {lab_trends.compact_labs(segments['labs'])}.
+Additional Comments: {segments['other']}.
+
+Assessment & Plan:
+{segments['assessment_plan']}
+            """
+
+
+def main():
+    for name, value in segment(" ".join(sys.argv[1:]) or sys.stdin.read()).items():
+        print(f"{name:16} {value}")
+
+
+if __name__ == "__main__":
+    main()
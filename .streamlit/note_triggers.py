@@ -0,0 +1,73 @@
+"""
+Nephrology order-set triggers: a trigger name and the orders it stands for.
+
+appopenAi.py maps note sections onto these triggers and expands them in the
+generated note. mentioned() and coverage() let offline tools check whether
+the orders behind the triggers named in the input made it into a note.
+"""
+
+import re
+
+# Define trigger descriptions
+TRIGGERS = {
+    "AKI workup": "Renal ultrasound, urine electrolytes (Na, Cl, Cr), quantify proteinuria",
+    "AIN workup": "Urine eosinophils",
+    "Proteinuria workup": "ANA, ANCA, SPEP, free light chain ratio, PLA2R",
+    "Screen for monoclonal gammopathy": "SPEP, free light chain ratio",
+    "Evaluate for infection-related GN": "C3, C4, quantify proteinuria, AIN workup (urine eosinophils)",
+    "Post renal AKI": "Bladder scan",
+    "Anemia of chronic disease workup": "Iron saturation, ferritin, transferrin saturation",
+    "Hypercalcemia workup": "PTH, vitamin D, calcitriol, SPEP, free light chain ratio, PTHrP, ACE level",
+    "Bone mineral disease": "Phosphorus, PTH",
+    "Hyponatremia workup": "Urine sodium, urine osmolality, TSH, cortisol (skip if already ordered)",
+    "HRS workup": "Urine sodium and creatinine to calculate FeNa",
+    "Start isotonic bicarbonate fluid": "D5W + 150 mEq sodium bicarbonate",
+    "Low chloride fluid": "Lactated Ringer's",
+    "Lokelma": "10 g daily",
+    "Start Bumex": "2 mg IV twice daily",
+    "Hyponatremia": "Target sodium correction 6-8 mEq/L, D5W ± DDAVP if rapid correction, serial sodium monitoring",
+    "Samsca protocol": "Tolvaptan 7.5 mg daily, serial sodium monitoring, liberalize water intake, monitor neurological status",
+    "Initiate CRRT": "CVVHDF @ 25 cc/kg/hr, UF 0-100 cc/hr, BMP q8h, daily phosphorus, dose meds to eGFR 25 mL/min",
+    "Start HD": "Discuss side effects: hypotension, cramps, chills, arrhythmias, death",
+    "Septic shock": "On antibiotics, pressor support",
+    "Hypoxic respiratory failure": "Intubated on mechanical ventilation",
+    "HRS management": "Albumin 25% 1 g/kg/day x48 h, Midodrine 10 mg TID, Octreotide 100 mcg BID, target SBP >= 110 mmHg"
+}
+
+# Create the trigger list once
+TRIGGER_LIST = list(TRIGGERS.keys())
+
+# Longest first, so "Hyponatremia workup" is not also counted as "Hyponatremia"
+_NAMES = {name: re.compile(rf"(?<!\w){re.escape(name)}(?!\w)", re.IGNORECASE)
+          for name in sorted(TRIGGER_LIST, key=len, reverse=True)}
+
+
+def orders(name):
+    """The individual orders behind a trigger, without parenthetical detail."""
+    return [item.strip().lower() for item in re.sub(r"\s*\(.*?\)", "", TRIGGERS[name]).split(",") if item.strip()]
+
+
+def mentioned(text):
+    """Trigger names that appear in the text."""
+    found = []
+    text = text or ""
+    for name, pattern in _NAMES.items():
+        if pattern.search(text):
+            found.append(name)
+            text = pattern.sub(" ", text)
+    return found
+
+
+def coverage(source, note):
+    """
+    (covered, requested): of the triggers named in the source text, how many have at least half of their
+    orders spelled out in the note.
+    """
+    note = (note or "").lower()
+    requested = mentioned(source)
+    covered = 0
+    for name in requested:
+        items = orders(name)
+        if sum(item in note for item in items) * 2 >= len(items):
+            covered += 1
+    return covered, len(requested)
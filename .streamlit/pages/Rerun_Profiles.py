@@ -0,0 +1,40 @@
+import streamlit as st
+import rerun_profiler
+
+st.title("Rerun Profiles")
+
+st.write("""
+Slowest Streamlit reruns recorded by the rerun profiler. Start any app with `NOTE_PROFILE=1`
+to record one cProfile file per rerun (set `NOTE_PROFILE_DIR` to change where they go).
+""")
+
+summaries = rerun_profiler.load_summaries()
+if not summaries:
+    st.info(f"No profiles found in `{rerun_profiler.PROFILE_DIR}`. Run an app with NOTE_PROFILE=1 first.")
+    st.stop()
+
+scripts = sorted({s["script"] for s in summaries})
+selected_scripts = st.multiselect("Scripts", scripts, default=scripts)
+top_n = st.slider("Show slowest", min_value=5, max_value=100, value=20, step=5)
+
+rows = [s for s in summaries if s["script"] in selected_scripts]
+rows.sort(key=lambda s: s["wall_s"], reverse=True)
+
+columns = ["ts", "script", "session", "wall_s", "imports", "widgets", "io", "generation",
+           "prompt_and_script", "other", "profile"]
+st.subheader(f"Slowest {min(top_n, len(rows))} of {len(rows)} reruns")
+st.dataframe([{c: r.get(c) for c in columns} for r in rows[:top_n]])
+
+st.subheader("Average per script (seconds)")
+averages = []
+for script in selected_scripts:
+    script_rows = [r for r in rows if r["script"] == script]
+    if not script_rows:
+        continue
+    average = {"script": script, "reruns": len(script_rows)}
+    for c in ["wall_s", "imports", "widgets", "io", "generation", "prompt_and_script", "other"]:
+        average[c] = round(sum(r.get(c, 0.0) for r in script_rows) / len(script_rows), 4)
+    averages.append(average)
+st.dataframe(averages)
+
+st.caption("Open a profile with `snakeviz <file>` or `flameprof <file> > rerun.svg` for the full call tree.")
@@ -0,0 +1,50 @@
+import datetime
+
+import streamlit as st
+import throughput_store
+
+st.title("Documentation Throughput")
+
+st.write("""
+Time per note from the app.py progress note generator: input time (since "Start Timer"), generation
+latency and edit time in "Final Note (Editable)" until the last edit or download. Recorded in
+`THROUGHPUT_DB` (default `throughput.sqlite3`).
+""")
+
+days = st.slider("Last days", min_value=1, max_value=90, value=14)
+since = (datetime.datetime.now() - datetime.timedelta(days=days)).timestamp()
+notes = throughput_store.load(since)
+if not notes:
+    st.info(f"No notes recorded in `{throughput_store.DB_PATH}` in the last {days} days. Generate a note in app.py first.")
+    st.stop()
+
+visit_types = sorted({n["visit_type"] or "unknown" for n in notes})
+selected_visit_types = st.multiselect("Visit types", visit_types, default=visit_types)
+notes = [n for n in notes if (n["visit_type"] or "unknown") in selected_visit_types]
+
+ok = [n for n in notes if not n["error"]]
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Notes", len(ok))
+col2.metric("Failed generations", len(notes) - len(ok))
+if ok:
+    median_total = throughput_store.percentile([n["total_s"] for n in ok], 50)
+    col3.metric("Median time per note", f"{median_total:.0f} s")
+    col4.metric("Notes per hour", f"{3600 / median_total:.1f}" if median_total else "n/a")
+
+st.subheader("Per condition (seconds)")
+st.dataframe(throughput_store.summarize(notes, "condition"))
+
+st.subheader("Per input mode (seconds)")
+st.dataframe(throughput_store.summarize(notes, "input_mode"))
+
+st.subheader("Per day")
+per_day = {}
+for note in ok:
+    day = datetime.date.fromtimestamp(note["ts"]).isoformat()
+    per_day.setdefault(day, []).append(note["total_s"])
+st.bar_chart({"notes": {day: len(totals) for day, totals in sorted(per_day.items())}})
+
+with st.expander("Recent notes"):
+    columns = ["ts", "condition", "visit_type", "input_mode", "input_s", "latency_s", "edit_s", "total_s",
+               "edit_events", "downloads", "note_chars", "error"]
+    st.dataframe([{c: n.get(c) for c in columns} for n in reversed(notes[-200:])])
@@ -0,0 +1,175 @@
+"""
+Async batch Part D plan recommendations for a whole patient panel.
+
+Reads a CSV with patient, zip and medications columns (medications separated
+by ";" or ","), runs plan lookups and LLM summaries concurrently with asyncio
+under a concurrency limit, and streams one output row per patient as soon as
+it finishes, with a per-row status.
+
+    python .streamlit/partd_batch.py panel.csv results.csv --concurrency 16
+    python .streamlit/partd_batch.py panel.csv results.csv --source local --no-summary
+
+API keys come from CMS_PLAN_FINDER_KEY / OPENAI_API_KEY in the environment or
+from .streamlit/secrets.toml.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import time
+
+import openai
+
+import drug_names
+import generation_pool
+from partd_client import PartDClient, make_prompt, SUMMARY_SYSTEM_PROMPT
+
+OUTPUT_FIELDS = ["patient", "zip", "medications", "status", "plans", "summary", "error", "elapsed_s"]
+
+
+def split_meds(text):
+    return [m.strip() for m in re.split(r"[;,]", text or "") if m.strip()]
+
+
+def read_panel(path_or_file):
+    """Rows of {"patient", "zip", "medications": [...]} from a CSV path or text file object."""
+    f = open(path_or_file, newline="") if isinstance(path_or_file, str) else path_or_file
+    try:
+        rows = []
+        for r in csv.DictReader(f):
+            rows.append({
+                "patient": (r.get("patient") or "").strip(),
+                "zip": (r.get("zip") or "").strip(),
+                "medications": split_meds(r.get("medications")),
+            })
+        return rows
+    finally:
+        if isinstance(path_or_file, str):
+            f.close()
+
+
+def api_lookup(client):
+    def lookup(zip_code, meds_list):
+        return client.lookup(zip_code, meds_list)[0]
+    return lookup
+
+
+def local_lookup(index, top_n=3):
+    def lookup(zip_code, meds_list):
+        region = index.region_for_zip(zip_code)
+        if region is None:
+            raise LookupError(f"ZIP {zip_code} is not covered by the local formulary index")
+        return index.rank_plans(region, meds_list, top_n)[0]
+    return lookup
+
+
+async def summarize(zip_code, meds_list, plans, model, credentials):
+    async with generation_pool.slot():
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": make_prompt(zip_code, meds_list, plans)}
+            ],
+            max_tokens=200,
+            **credentials,
+        )
+    return response.choices[0].message.content
+
+
+async def process_row(row, lookup, semaphore, summary_model, credentials, summary_limit):
+    result = {"patient": row["patient"], "zip": row["zip"], "medications": "; ".join(row["medications"]),
+              "status": "ok", "plans": "[]", "summary": "", "error": ""}
+    started = time.perf_counter()
+    async with semaphore:
+        try:
+            if not row["zip"] or not row["medications"]:
+                raise ValueError("missing ZIP or medications")
+            # The lookup clients are synchronous; run them on the default thread pool
+            meds = drug_names.canonical_list(row["medications"])
+            plans = await asyncio.to_thread(lookup, row["zip"], meds)
+            result["plans"] = json.dumps(plans)
+            if not plans:
+                result["status"] = "no_plans"
+            elif summary_model:
+                async with summary_limit:
+                    result["summary"] = await summarize(row["zip"], meds, plans, summary_model, credentials)
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(rows, out_file, lookup, concurrency=8, summary_model="gpt-4", on_result=None, credentials=None):
+    """
+    Process rows concurrently and write each result to out_file as it completes. credentials holds the
+    api_base and api_key for the summary requests.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # Summaries queue for generation slots as one session, so no more may wait at once than it is allowed
+    summary_limit = asyncio.Semaphore(min(concurrency, generation_pool.get_pool().session_queue))
+    writer = csv.DictWriter(out_file, fieldnames=OUTPUT_FIELDS)
+    writer.writeheader()
+    counts = {}
+    tasks = [asyncio.create_task(process_row(row, lookup, semaphore, summary_model, credentials or {}, summary_limit))
+             for row in rows]
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        result = await task
+        writer.writerow(result)
+        out_file.flush()
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        if on_result:
+            on_result(result, done, len(tasks))
+    return counts
+
+
+def _secret(name):
+    if os.environ.get(name):
+        return os.environ[name]
+    import tomllib
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "secrets.toml")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return tomllib.load(f).get(name)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch Part D plan recommendations for a patient panel")
+    parser.add_argument("input_csv", help="CSV with patient, zip, medications columns")
+    parser.add_argument("output_csv")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--source", choices=["api", "local"], default="api")
+    parser.add_argument("--index-dir", default=os.environ.get("FORMULARY_INDEX_DIR", "formulary_index"))
+    parser.add_argument("--top", type=int, default=3)
+    parser.add_argument("--model", default="gpt-4")
+    parser.add_argument("--no-summary", action="store_true")
+    args = parser.parse_args()
+
+    if args.source == "local":
+        import formulary_index
+        lookup = local_lookup(formulary_index.FormularyIndex(args.index_dir), args.top)
+    else:
+        lookup = api_lookup(PartDClient(_secret("CMS_PLAN_FINDER_KEY"), top_n=args.top))
+    summary_model = None if args.no_summary else args.model
+    credentials = {"api_base": os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1"),
+                   "api_key": _secret("OPENAI_API_KEY")}
+
+    rows = read_panel(args.input_csv)
+    started = time.perf_counter()
+
+    def progress(result, done, total):
+        print(f"[{done}/{total}] {result['patient']}: {result['status']}", flush=True)
+
+    with open(args.output_csv, "w", newline="") as out:
+        counts = asyncio.run(run_batch(rows, out, lookup, args.concurrency, summary_model, progress, credentials))
+    print(f"{len(rows)} patients in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Pooled, cached and time-bounded client for CMS Plan Finder Part D lookups.
+
+One PartDClient is shared by the whole process (the app keeps it in
+st.cache_resource). It reuses TCP/TLS connections through a pooled
+requests.Session, bounds every call with connect/read timeouts and caches
+results per (ZIP, normalized medication set):
+
+    fresh   younger than fresh_seconds   -> served from memory
+    stale   younger than stale_seconds   -> served from memory, refreshed in the background
+    expired                              -> fetched before returning
+"""
+
+import collections
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import drug_names
+
+ENDPOINT = "https://api.cms.gov/plan-finder/v1/part-d"  # placeholder
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 15
+# Plan data changes at most daily
+FRESH_SECONDS = 12 * 3600
+STALE_SECONDS = 48 * 3600
+
+SUMMARY_SYSTEM_PROMPT = "You are a friendly Medicare advisor."
+
+
+def normalize_meds(meds_list):
+    """Order-independent set of canonical ingredient names, so "Lisinopril 10mg" and "lisinopril" share an entry."""
+    return tuple(sorted(drug_names.canonical_list(m for m in meds_list if m and m.strip())))
+
+
+def cache_key(zip_code, meds_list):
+    return zip_code.strip()[:5], normalize_meds(meds_list)
+
+
+def parse_plans(data):
+    plans = []
+    for p in data.get("plans", []):
+        plans.append({
+            "plan_name": p.get("planDisplayName"),
+            "premium": p.get("monthlyPremium"),
+            "tier_info": ", ".join([f"{d['drugName']}: Tier {d['tier']}" for d in p.get("drugList", [])])
+        })
+    return plans
+
+
+def make_prompt(zip_code, meds_list, plans):
+    header = f"User in {zip_code} takes: {', '.join(meds_list)}.\nHere are {len(plans)} Part D plans:\n"
+    body_lines = [
+        f"- {p['plan_name']}: ${p['premium']} premium, {p['tier_info']}"
+        + (f", estimated ${p['annual_cost']:,.2f} per year" if p.get("annual_cost") is not None else "")
+        for p in plans
+    ]
+    tail = "\nPlease summarize in plain language which plan is best for this user and why."  
+    return header + "\n".join(body_lines) + tail
+
+
+class PartDClient:
+    def __init__(self, api_key, endpoint=ENDPOINT, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 fresh_seconds=FRESH_SECONDS, stale_seconds=STALE_SECONDS, pool_size=10, max_entries=2048,
+                 top_n=3):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.top_n = top_n
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self._cache = collections.OrderedDict()  # key -> (fetched_at, plans)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, zip_code, meds_list):
+        """Return (plans, source) where source is "fresh", "stale" or "network"."""
+        key = cache_key(zip_code, meds_list)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+        if entry is not None:
+            age = now - entry[0]
+            if age < self.fresh_seconds:
+                return entry[1], "fresh"
+            if age < self.stale_seconds:
+                self._revalidate(key)
+                return entry[1], "stale"
+        return self._fetch_and_store(key), "network"
+
+    def _fetch(self, key):
+        zip_code, meds = key
+        payload = {
+            "zipCode": zip_code,
+            "medications": list(meds),
+            "topN": self.top_n
+        }
+        resp = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return parse_plans(resp.json())
+
+    def _fetch_and_store(self, key):
+        plans = self._fetch(key)
+        with self._lock:
+            self._cache[key] = (time.monotonic(), plans)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return plans
+
+    def _revalidate(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_and_store(key)
+            except Exception:
+                pass  # keep serving the stale entry; the next lookup retries
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="partd-revalidate", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,165 @@
+"""
+Prompt normalization before a note request is sent.
+
+Form fields left at their placeholder defaults ("Enter patient's symptoms...",
+"Present/Absent", "Type your note here...") reach the prompt as if they were
+patient data. `compress` drops those values, the labels and sections left
+empty by that, repeated instruction lines and redundant whitespace. Only the
+exact widget defaults count as placeholders and only instruction blocks are
+deduplicated, so typed text ("Plan: Enter hospice referral") and repeated
+clinical data always reach the model.
+`compress_with_stats` also reports the token saving, counted with tiktoken
+when it is installed and a regex word/punctuation split otherwise.
+"""
+
+import functools
+import re
+
+# Default values of the apps' text widgets; a value is only a placeholder when it is one of these verbatim
+PLACEHOLDERS = (
+    "Enter a combined list of problem headings and corresponding treatment options.",
+    "Enter a comprehensive update on the case",
+    "Enter any history of kidney disease, infections, trauma, etc.",
+    "Enter any lab data if available (e.g., renal function tests)...",
+    "Enter assessment and plan (integrate any medication changes)...",
+    "Enter assessment and plan for HTN management...",
+    "Enter assessment and plan for glomerulonephritis...",
+    "Enter assessment and plan for hypokalemia management...",
+    "Enter assessment and plan for managing hyponatremia...",
+    "Enter assessment and plan for proteinuria/hematuria management...",
+    "Enter assessment and plan for renal cyst management...",
+    "Enter assessment and plan...",
+    "Enter changes since last visit...",
+    "Enter current antihypertensive medications and adherence info...",
+    "Enter current symptoms...",
+    "Enter details from imaging (size, location, complexity)...",
+    "Enter interval history (changes since last visit)...",
+    "Enter lab data, if any...",
+    "Enter medications (e.g., diuretics) or history causing hypokalemia...",
+    "Enter medications and history contributing to hyponatremia...",
+    "Enter patient's HPI (symptoms, onset, etc.)",
+    "Enter patient's symptoms...",
+    "Enter recent infections, family history, systemic symptoms...",
+    "Enter relevant lab data...",
+    "Enter relevant risk factors (family history, lifestyle, etc.)",
+    "Enter risk factors (e.g., NSAIDs, DM, HTN, nephrotoxins)...",
+    "Enter risk factors...",
+    "Enter serum potassium, magnesium levels, ECG changes, etc.",
+    "Enter serum sodium, osmolality, etc.",
+    "Enter symptoms (e.g., visible hematuria, flank pain) or note if asymptomatic...",
+    "Enter symptoms (if any, or note if incidental finding)...",
+    "Enter symptoms such as confusion, headache, nausea...",
+    "Enter symptoms such as headaches, dizziness, palpitations...",
+    "Enter symptoms such as hematuria, edema, fatigue...",
+    "Enter symptoms such as muscle weakness, cramps, fatigue...",
+    "Enter updated lab data...",
+    "Enter urinalysis details, quantitative proteinuria, etc.",
+    "Enter urinalysis results, serum creatinine, complement levels, etc.",
+    "Provide a one-liner update...",
+    "Type your note here...",
+    "e.g., 140/90 mmHg",
+)
+# Placeholder values that fill the rest of the line (the template may add its own "." after them)
+LONG_PLACEHOLDER = rf"(?:{'|'.join(re.escape(p) for p in sorted(PLACEHOLDERS, key=len, reverse=True))})[.,;]?"
+# Short either/or placeholders that can sit inside a "A: x, B: y" line
+SHORT_PLACEHOLDER = r"(?:Present/Absent|Controlled/Uncontrolled|Yes/No)"
+
+_WHOLE_LINE = re.compile(rf"^\s*(?:{LONG_PLACEHOLDER}|{SHORT_PLACEHOLDER}\.?)\s*$", re.IGNORECASE)
+_SHORT_FIELD = re.compile(rf"(^|,\s*|:\s*)([^:,\n]+):\s*{SHORT_PLACEHOLDER}\.?(?=\s*(?:,|$))", re.IGNORECASE)
+_LONG_FIELD = re.compile(rf"^(\s*)([^:\n]+?):\s*{LONG_PLACEHOLDER}$", re.IGNORECASE)
+# An inline field whose value is empty: "Lab Data: ." / "Additional Info:" once its fields are gone
+_EMPTY_FIELD = re.compile(r"^\s*[^:\n]+:\s*[.,;]?\s*$")
+# A section heading: "Assessment & Plan:" / "**Labs:**" alone on its line
+_HEADING = re.compile(r"^\s*\**[^:\n]{1,80}:\**\s*$")
+# An instruction block opens with one of these and runs to the next blank line; only its lines are deduplicated
+_INSTRUCTION = re.compile(
+    r"^\s*(?:generate|write|ensure|based on the above|do not|don't|please|format|the (?:final )?note should)\b",
+    re.IGNORECASE,
+)
+# Lines shorter than this are headings or list labels, not instructions worth deduplicating
+_MIN_DEDUPE_LENGTH = 40
+
+
+def is_placeholder(value):
+    """True for an untouched placeholder default or an empty value."""
+    return not (value or "").strip() or bool(_WHOLE_LINE.match(value))
+
+
+def _strip_placeholders(line):
+    if _WHOLE_LINE.match(line):
+        return ""
+    stripped = _LONG_FIELD.sub(r"\1\2:", line)
+    stripped = _SHORT_FIELD.sub(lambda m: m.group(1) if ":" in m.group(1) else "", stripped)
+    # Separators left behind by a removed field: "A: , B: x" / ", B: x"
+    stripped = re.sub(r"(^\s*|:\s*),\s*", r"\1", stripped).rstrip(" ,")
+    if stripped != line.rstrip() and _EMPTY_FIELD.match(stripped):
+        return ""  # every value on this line was a placeholder
+    if _EMPTY_FIELD.match(stripped) and not _HEADING.match(stripped):
+        return ""  # "Label: ." left by an empty field
+    return stripped
+
+
+def _drop_empty_sections(lines):
+    """Drop heading lines whose section (up to the next blank line or heading) has no content."""
+    kept = []
+    for i, line in enumerate(lines):
+        if _HEADING.match(line):
+            following = lines[i + 1] if i + 1 < len(lines) else ""
+            if not following.strip() or _HEADING.match(following):
+                continue
+        kept.append(line)
+    return kept
+
+
+def compress(prompt):
+    # A line emptied by placeholder removal goes away entirely rather than ending its section as a blank line
+    stripped = [(line, _strip_placeholders(line)) for line in prompt.splitlines()]
+    lines = _drop_empty_sections([new for line, new in stripped if new or not line.strip()])
+    seen, out, in_instructions = set(), [], False
+    for line in lines:
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        in_instructions = bool(line) and (in_instructions or bool(_INSTRUCTION.match(line)))
+        key = line.lower()
+        if in_instructions and len(key) >= _MIN_DEDUPE_LENGTH:
+            if key in seen:
+                continue
+            seen.add(key)
+        if not line and (not out or not out[-1]):
+            continue  # collapse runs of blank lines
+        out.append(line)
+    return "\n".join(out).strip()
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """Return (token count, tokenizer name)."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text)), "cl100k_base"
+    return len(re.findall(r"\w+|[^\w\s]", text)), "regex"
+
+
+def compress_with_stats(prompt):
+    compressed = compress(prompt)
+    before, tokenizer = count_tokens(prompt)
+    after, _ = count_tokens(compressed)
+    return compressed, {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+        "saved_pct": round(100 * (before - after) / before, 1) if before else 0.0,
+        "tokenizer": tokenizer,
+    }
+
+
+def describe(stats):
+    return (f"Prompt trimmed by {stats['tokens_saved']} tokens ({stats['saved_pct']}%, "
+            f"{stats['tokens_before']} -> {stats['tokens_after']}, {stats['tokenizer']} count)")
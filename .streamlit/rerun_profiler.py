@@ -0,0 +1,140 @@
+"""
+Opt-in rerun profiler for the Streamlit scripts.
+
+Add to the top of a script, right after importing streamlit:
+
+    import rerun_profiler
+    rerun_profiler.profile_rerun(__file__)
+
+With NOTE_PROFILE=1 in the environment the call re-executes the script under
+cProfile, writes one .prof file per rerun (loadable by snakeviz, flameprof or
+pstats) into NOTE_PROFILE_DIR/<session id>/ and appends a summary line to
+NOTE_PROFILE_DIR/summary.jsonl. The outer run then stops, so the page renders
+exactly once. Without the flag the call returns immediately.
+
+The summary splits each rerun's wall time by what the script called directly:
+imports, widget construction (streamlit), I/O (openai, requests, boto3, files),
+local model generation (transformers, torch) and everything else the script
+does itself, which is mostly prompt construction.
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import runpy
+import threading
+import time
+
+import streamlit as st
+
+ENV_FLAG = "NOTE_PROFILE"
+PROFILE_DIR = os.environ.get("NOTE_PROFILE_DIR", "profiles")
+SUMMARY_FILE = "summary.jsonl"
+
+_state = threading.local()
+_write_lock = threading.Lock()
+
+
+def _pkg(name):
+    return f"{os.sep}{name}{os.sep}"
+
+
+# Checked in order; the first matching fragment of the callee's filename wins.
+# Package fragments include the separators so our own .streamlit/ helpers don't
+# count as streamlit widgets.
+_CATEGORIES = [
+    ("imports", ("importlib._bootstrap",)),
+    ("widgets", (_pkg("streamlit"),)),
+    ("io", (_pkg("openai"), _pkg("requests"), _pkg("urllib3"), _pkg("boto3"), _pkg("botocore"),
+            _pkg("http"), _pkg("json"), "socket.py", "ssl.py", "io.open", "builtins.open")),
+    ("generation", (_pkg("transformers"), _pkg("torch"))),
+]
+
+
+def enabled():
+    return os.environ.get(ENV_FLAG) == "1"
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else "no-session"
+    except ImportError:
+        return "no-session"
+
+
+def _category(func):
+    filename, _, name = func
+    where = f"{filename} {name}"
+    for category, fragments in _CATEGORIES:
+        if any(fragment in where for fragment in fragments):
+            return category
+    return "prompt_and_script"
+
+
+def breakdown(stats, script_path, wall_s):
+    """Attribute time to categories using the script's direct calls only."""
+    script_path = os.path.abspath(script_path)
+    totals = {"imports": 0.0, "widgets": 0.0, "io": 0.0, "generation": 0.0, "prompt_and_script": 0.0}
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        if os.path.abspath(func[0]) == script_path:
+            # Code executing in the script itself (f-strings, loops, comprehensions)
+            totals["prompt_and_script"] += tottime
+            continue
+        for caller, edge in callers.items():
+            if os.path.abspath(caller[0]) == script_path:
+                totals[_category(func)] += edge[3]
+    totals = {k: round(v, 6) for k, v in totals.items()}
+    totals["other"] = round(max(wall_s - sum(totals.values()), 0.0), 6)
+    return totals
+
+
+def _write_profile(script_path, profiler, wall_s, run_started):
+    session = _session_id()
+    session_dir = os.path.join(PROFILE_DIR, session)
+    os.makedirs(session_dir, exist_ok=True)
+    script_name = os.path.splitext(os.path.basename(script_path))[0].replace(" ", "_")
+    stamp = run_started.strftime("%Y%m%dT%H%M%S%f")
+    prof_path = os.path.join(session_dir, f"{script_name}_{stamp}.prof")
+    profiler.dump_stats(prof_path)
+
+    summary = {
+        "ts": run_started.isoformat(),
+        "session": session,
+        "script": os.path.basename(script_path),
+        "wall_s": round(wall_s, 6),
+        "profile": prof_path,
+    }
+    summary.update(breakdown(pstats.Stats(profiler), script_path, wall_s))
+    with _write_lock, open(os.path.join(PROFILE_DIR, SUMMARY_FILE), "a") as f:
+        f.write(json.dumps(summary) + "\n")
+
+
+def profile_rerun(script_path):
+    """Run the calling script once under cProfile when NOTE_PROFILE=1."""
+    if not enabled() or getattr(_state, "active", False):
+        return
+    _state.active = True
+    profiler = cProfile.Profile()
+    run_started = datetime.datetime.now()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        runpy.run_path(script_path, run_name="__main__")
+    finally:
+        # st.stop() and reruns raise through here too; their partial runs are still recorded
+        profiler.disable()
+        _state.active = False
+        _write_profile(script_path, profiler, time.perf_counter() - started, run_started)
+    st.stop()
+
+
+def load_summaries(profile_dir=None):
+    path = os.path.join(profile_dir or PROFILE_DIR, SUMMARY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
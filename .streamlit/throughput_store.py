@@ -0,0 +1,134 @@
+"""
+Append-only store of documentation throughput, behind the app.py timer.
+
+Every generated note adds a row to `notes` (input time since "Start Timer",
+generation latency, condition, visit type, input mode, sizes) and every later
+change to "Final Note (Editable)" or download of it adds a row to `edits`
+with the seconds since the note was generated. Rows are never updated, so the
+edit time of a note is its last edit event. The pages/Throughput_Dashboard.py
+page aggregates them into percentiles per condition and input mode.
+
+The store is a SQLite file (THROUGHPUT_DB, default throughput.sqlite3) in WAL
+mode, so the dashboard can read while sessions write.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DB_PATH = os.environ.get("THROUGHPUT_DB", "throughput.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    note_id TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    session TEXT,
+    app TEXT,
+    condition TEXT,
+    visit_type TEXT,
+    input_mode TEXT,
+    input_s REAL,
+    latency_s REAL,
+    note_chars INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS edits (
+    note_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    edit_s REAL NOT NULL,
+    note_chars INTEGER
+);
+CREATE INDEX IF NOT EXISTS notes_ts ON notes (ts);
+CREATE INDEX IF NOT EXISTS edits_note ON edits (note_id);
+"""
+
+_LOCK = threading.Lock()
+_READY = set()
+
+
+def _connect(path=None):
+    path = path or DB_PATH
+    conn = sqlite3.connect(path, timeout=10)
+    if path not in _READY:
+        with _LOCK:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _READY.add(path)
+    return conn
+
+
+def record_generation(app, condition, visit_type, input_mode, input_s, latency_s, note_chars, session=None,
+                      error=None, path=None):
+    """Add a generated note; returns its note_id for the edit events."""
+    note_id = uuid.uuid4().hex[:12]
+    conn = _connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (note_id, time.time(), session, app, condition, visit_type, input_mode, input_s, latency_s, note_chars,
+             error),
+        )
+    conn.close()
+    return note_id
+
+
+def record_edit(note_id, edit_s, note_chars, kind="edit", path=None):
+    """Add an edit ("edit") or download ("download") of a generated note, edit_s seconds after generation."""
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT INTO edits VALUES (?, ?, ?, ?, ?)", (note_id, time.time(), kind, edit_s, note_chars))
+    conn.close()
+
+
+def load(since=None, path=None):
+    """One dict per note since the given epoch time, with edit_s (0 if never edited) and total_s."""
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        """
+        SELECT n.*, COALESCE(MAX(e.edit_s), 0) AS edit_s, COUNT(e.note_id) AS edit_events,
+               SUM(e.kind = 'download') AS downloads
+        FROM notes n LEFT JOIN edits e ON e.note_id = n.note_id
+        WHERE n.ts >= ?
+        GROUP BY n.note_id
+        ORDER BY n.ts
+        """,
+        (since or 0,),
+    ).fetchall()
+    conn.close()
+    notes = []
+    for row in rows:
+        note = dict(row)
+        note["total_s"] = (note["input_s"] or 0) + (note["latency_s"] or 0) + note["edit_s"]
+        notes.append(note)
+    return notes
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list, q in [0, 100]."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(notes, group_by, fields=("input_s", "latency_s", "edit_s", "total_s"), quantiles=(50, 90)):
+    """Rows of p50/p90 per field for each value of group_by, plus notes per hour at the median total."""
+    groups = {}
+    for note in notes:
+        if not note["error"]:
+            groups.setdefault(note[group_by] or "unknown", []).append(note)
+    rows = []
+    for name, members in sorted(groups.items()):
+        row = {group_by: name, "notes": len(members)}
+        for field in fields:
+            values = [m[field] for m in members if m[field] is not None]
+            for q in quantiles:
+                row[f"{field} p{q}"] = round(percentile(values, q), 1) if values else None
+        median_total = row.get("total_s p50")
+        row["notes/hour"] = round(3600 / median_total, 1) if median_total else None
+        rows.append(row)
+    return rows
@@ -1,22 +1,93 @@
+import os
+import sys
 import streamlit as st
+
+# Shared helpers live next to the other apps in .streamlit/
+HELPERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit")
+if HELPERS_DIR not in sys.path:
+    sys.path.insert(0, HELPERS_DIR)
+import rerun_profiler
+rerun_profiler.profile_rerun(__file__)
+
 import openai
 import datetime
+import time
+import note_metrics
+import lab_trends
+import ckd_staging
+import prompt_compress
+import multi_problem
+import generation_pool
+import note_jobs
 
 # --------------------------
 # Configure the DeepSeek API
 # --------------------------
-openai.api_base = "https://api.deepseek.com/beta"  # Using the v1 endpoint
-openai.api_key = st.secrets.get("DEEPOSEEK_API_KEY", "YOUR_API_KEY")
+# Passed with each request rather than set on the shared openai module
+DEEPSEEK = {
+    "api_base": os.environ.get("DEEPSEEK_API_BASE", "https://api.deepseek.com/beta"),  # Using the v1 endpoint
+    "api_key": st.secrets.get("DEEPOSEEK_API_KEY", "YOUR_API_KEY"),
+}
 
 # --------------------------
 # Title and Sidebar
 # --------------------------
 st.title("Nephrology Note Generator - Multi-Condition Interface")
 visit_type = st.sidebar.selectbox("Select Visit Type", options=["New Patient", "Follow-Up"])
+note_metrics.render_metrics_panel()
 
 # Get today's date (displayed in all notes)
 visit_date = datetime.date.today().strftime("%B %d, %Y")
 
+# --------------------------
+# Prompt layout
+# --------------------------
+# The system prefix is byte-identical for every tab and every patient, and each tab's instruction is fixed,
+# so the provider's prefix cache can serve them; the visit data (date included) always comes last.
+CLINIC_SYSTEM = (
+    "You are a board-certified nephrologist documenting an outpatient nephrology clinic visit. "
+    "Write the note in SOAP format, focusing on the Subjective and Assessment & Plan sections. "
+    "Use only the visit data provided; do not invent vital signs, labs, medications or history. "
+    "Keep the Subjective section a concise narrative. In the Assessment & Plan, give each problem a brief "
+    "evidence-based assessment followed by the plan as direct imperative statements, including medication "
+    "changes, labs or imaging to order and the follow-up interval."
+)
+
+
+def note_messages(instruction, visit_data):
+    return [
+        {"role": "system", "content": CLINIC_SYSTEM},
+        {"role": "user", "content": f"{instruction}\n\n{visit_data}"},
+    ]
+
+
+def request_note(instruction, visit_data, timer):
+    # Waits for a generation slot first; the wait is recorded as the stage's queue time
+    with generation_pool.slot():
+        timer.dispatched()
+        return openai.ChatCompletion.create(
+            model="deepseek-chat",
+            messages=note_messages(instruction, visit_data),
+            max_tokens=800,
+            temperature=0.7,
+            **DEEPSEEK,
+        )
+
+
+def submit_note(instruction, visit_data, timer):
+    # A background job, so switching tabs or editing another form while it runs does not discard the note
+    def run(job):
+        try:
+            response = request_note(instruction, visit_data, timer)
+        except Exception as e:
+            timer.failed(e)
+            raise
+        timer.finished(response)
+        return response.choices[0].message.content.strip()
+
+    note_jobs.submit(f"{timer.stage} ({visit_date})", run)
+    st.info("Note queued; it appears under Generated Notes when ready.")
+
 # --------------------------
 # Create Tabs for Different Conditions
 # --------------------------
@@ -28,7 +99,8 @@ tab_labels = [
     "Hyponatremia",
     "Hypokalemia",
     "Proteinuria & Hematuria",
-    "Renal Cyst"
+    "Renal Cyst",
+    "Multi-Condition Visit"
 ]
 tabs = st.tabs(tab_labels)
 
@@ -37,15 +109,17 @@ tabs = st.tabs(tab_labels)
 # --------------------------
 with tabs[0]:
     st.header("CKD Evaluation (New Patient)")
-    reason_for_visit = st.text_input("Reason for Visit", "CKD Evaluation")
-    symptoms = st.text_area("Symptoms", "Enter patient's symptoms...")
-    risk_factors = st.text_area("Risk Factors (e.g., NSAIDs, DM, HTN, other nephrotoxins)", "Enter risk factors...")
-    dm_status = st.text_input("Diabetes Mellitus Status", "Present/Absent")
-    htn_status = st.text_input("Hypertension Status", "Present/Absent")
-    labs = st.text_area("Lab Data", "Enter relevant lab data...")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan...")
+    reason_for_visit = st.text_input("Reason for Visit", "CKD Evaluation", key="ckd_new_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter patient's symptoms...", key="ckd_new_symptoms")
+    risk_factors = st.text_area("Risk Factors (e.g., NSAIDs, DM, HTN, other nephrotoxins)", "Enter risk factors...", key="ckd_new_risk_factors")
+    dm_status = st.text_input("Diabetes Mellitus Status", "Present/Absent", key="ckd_new_dm_status")
+    htn_status = st.text_input("Hypertension Status", "Present/Absent", key="ckd_new_htn_status")
+    labs = st.text_area("Lab Data", "Enter relevant lab data...", key="ckd_new_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan...", key="ckd_new_assessment_plan")
 
     if st.button("Generate Note for CKD Evaluation"):
+        timer = note_metrics.StageTimer("clinic_writer", "CKD Evaluation", model="deepseek-chat")
+        instruction = "Generate a comprehensive SOAP note focusing on the Subjective and Assessment & Plan sections for a new patient CKD evaluation."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -61,43 +135,45 @@ Additional Info:
 DM Status: {dm_status}, HTN Status: {htn_status}.
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a comprehensive SOAP note focusing on the Subjective and Assessment & Plan sections for a new patient CKD evaluation.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 2: CKD Follow-Up
 # --------------------------
 with tabs[1]:
     st.header("CKD Follow-Up")
-    reason_for_visit = st.text_input("Reason for Visit", "CKD Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter current symptoms...")
-    ckd_stage = st.selectbox("CKD Stage", options=["1", "2", "3", "4", "5"], index=2)
-    kidney_trend = st.selectbox("Kidney Function Trend", options=["Improving", "Stable", "Worsening"])
-    dm_status = st.text_input("Diabetes Mellitus Status", "Controlled/Uncontrolled")
-    htn_status = st.text_input("Hypertension Status", "Controlled/Uncontrolled")
-    labs = st.text_area("Lab Data", "Enter updated lab data...")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan...")
+    reason_for_visit = st.text_input("Reason for Visit", "CKD Follow-Up", key="ckd_fu_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter current symptoms...", key="ckd_fu_symptoms")
+    # Labs come first so stage and trend can be derived from them (CKD-EPI 2021, KDIGO)
+    labs = st.text_area("Lab Data", "Enter updated lab data...", key="ckd_fu_labs",
+                        help="e.g. Cr 1.8 -> 2.1 over 6 months, UACR 450 fills in stage and trend")
+    age_col, sex_col = st.columns(2)
+    age = age_col.number_input("Age", min_value=18, max_value=110, value=65, key="ckd_fu_age")
+    sex = sex_col.selectbox("Sex", options=["Female", "Male"], key="ckd_fu_sex")
+    derived = ckd_staging.from_labs(labs, age, sex)
+    st.session_state.setdefault("ckd_fu_ckd_stage", "3")
+    ckd_staging.apply_to_widgets(st.session_state, derived, "ckd_fu_ckd_stage", "ckd_fu_kidney_trend", "ckd_fu_derived")
+    ckd_stage = st.selectbox("CKD Stage", options=["1", "2", "3", "4", "5"], key="ckd_fu_ckd_stage")
+    kidney_trend = st.selectbox("Kidney Function Trend", options=["Improving", "Stable", "Worsening"], key="ckd_fu_kidney_trend")
+    if derived:
+        st.caption(f"From labs: {ckd_staging.describe(derived)}")
+    dm_status = st.text_input("Diabetes Mellitus Status", "Controlled/Uncontrolled", key="ckd_fu_dm_status")
+    htn_status = st.text_input("Hypertension Status", "Controlled/Uncontrolled", key="ckd_fu_htn_status")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan...", key="ckd_fu_assessment_plan")
 
     if st.button("Generate Note for CKD Follow-Up"):
+        timer = note_metrics.StageTimer("clinic_writer", "CKD Follow-Up", model="deepseek-chat")
+        instruction = "Generate a comprehensive SOAP note focusing on the Subjective and Assessment & Plan sections for a CKD follow-up visit."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -113,42 +189,34 @@ Additional Info:
 DM Status: {dm_status}, HTN Status: {htn_status}.
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a comprehensive SOAP note focusing on the Subjective and Assessment & Plan sections for a CKD follow-up visit.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 3: Hypertension (HTN)
 # --------------------------
 with tabs[2]:
     st.header("Hypertension (HTN)")
-    reason_for_visit = st.text_input("Reason for Visit", "HTN Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms such as headaches, dizziness, palpitations...")
-    vital_signs = st.text_input("Vital Signs", "e.g., 140/90 mmHg")
-    medications = st.text_area("Medications & Compliance", "Enter current antihypertensive medications and adherence info...")
-    risk_factors = st.text_area("Risk Factors & History", "Enter relevant risk factors (family history, lifestyle, etc.)")
-    labs = st.text_area("Lab Data", "Enter lab data, if any...")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for HTN management...")
+    reason_for_visit = st.text_input("Reason for Visit", "HTN Evaluation/Follow-Up", key="htn_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms such as headaches, dizziness, palpitations...", key="htn_symptoms")
+    vital_signs = st.text_input("Vital Signs", "e.g., 140/90 mmHg", key="htn_vital_signs")
+    medications = st.text_area("Medications & Compliance", "Enter current antihypertensive medications and adherence info...", key="htn_medications")
+    risk_factors = st.text_area("Risk Factors & History", "Enter relevant risk factors (family history, lifestyle, etc.)", key="htn_risk_factors")
+    labs = st.text_area("Lab Data", "Enter lab data, if any...", key="htn_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for HTN management...", key="htn_assessment_plan")
 
     if st.button("Generate Note for HTN"):
+        timer = note_metrics.StageTimer("clinic_writer", "HTN", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the evaluation and management of hypertension."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -167,40 +235,32 @@ Risk Factors & History:
 {risk_factors}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the evaluation and management of hypertension.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 4: Glomerulonephritis
 # --------------------------
 with tabs[3]:
     st.header("Glomerulonephritis")
-    reason_for_visit = st.text_input("Reason for Visit", "Glomerulonephritis Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms such as hematuria, edema, fatigue...")
-    history = st.text_area("History & Risk Factors", "Enter recent infections, family history, systemic symptoms...")
-    labs = st.text_area("Lab Data", "Enter urinalysis results, serum creatinine, complement levels, etc.")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for glomerulonephritis...")
+    reason_for_visit = st.text_input("Reason for Visit", "Glomerulonephritis Evaluation/Follow-Up", key="gn_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms such as hematuria, edema, fatigue...", key="gn_symptoms")
+    history = st.text_area("History & Risk Factors", "Enter recent infections, family history, systemic symptoms...", key="gn_history")
+    labs = st.text_area("Lab Data", "Enter urinalysis results, serum creatinine, complement levels, etc.", key="gn_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for glomerulonephritis...", key="gn_assessment_plan")
 
     if st.button("Generate Note for Glomerulonephritis"):
+        timer = note_metrics.StageTimer("clinic_writer", "Glomerulonephritis", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the evaluation and management of glomerulonephritis."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -213,40 +273,32 @@ History & Risk Factors:
 {history}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the evaluation and management of glomerulonephritis.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 5: Hyponatremia
 # --------------------------
 with tabs[4]:
     st.header("Hyponatremia")
-    reason_for_visit = st.text_input("Reason for Visit", "Hyponatremia Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms such as confusion, headache, nausea...")
-    med_history = st.text_area("Medication & History", "Enter medications and history contributing to hyponatremia...")
-    labs = st.text_area("Lab Data", "Enter serum sodium, osmolality, etc.")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for managing hyponatremia...")
+    reason_for_visit = st.text_input("Reason for Visit", "Hyponatremia Evaluation/Follow-Up", key="hyponatremia_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms such as confusion, headache, nausea...", key="hyponatremia_symptoms")
+    med_history = st.text_area("Medication & History", "Enter medications and history contributing to hyponatremia...", key="hyponatremia_med_history")
+    labs = st.text_area("Lab Data", "Enter serum sodium, osmolality, etc.", key="hyponatremia_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for managing hyponatremia...", key="hyponatremia_assessment_plan")
 
     if st.button("Generate Note for Hyponatremia"):
+        timer = note_metrics.StageTimer("clinic_writer", "Hyponatremia", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the management of hyponatremia."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -259,40 +311,32 @@ Medication & History:
 {med_history}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the management of hyponatremia.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 6: Hypokalemia
 # --------------------------
 with tabs[5]:
     st.header("Hypokalemia")
-    reason_for_visit = st.text_input("Reason for Visit", "Hypokalemia Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms such as muscle weakness, cramps, fatigue...")
-    med_history = st.text_area("Medication & History", "Enter medications (e.g., diuretics) or history causing hypokalemia...")
-    labs = st.text_area("Lab Data", "Enter serum potassium, magnesium levels, ECG changes, etc.")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for hypokalemia management...")
+    reason_for_visit = st.text_input("Reason for Visit", "Hypokalemia Evaluation/Follow-Up", key="hypokalemia_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms such as muscle weakness, cramps, fatigue...", key="hypokalemia_symptoms")
+    med_history = st.text_area("Medication & History", "Enter medications (e.g., diuretics) or history causing hypokalemia...", key="hypokalemia_med_history")
+    labs = st.text_area("Lab Data", "Enter serum potassium, magnesium levels, ECG changes, etc.", key="hypokalemia_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for hypokalemia management...", key="hypokalemia_assessment_plan")
 
     if st.button("Generate Note for Hypokalemia"):
+        timer = note_metrics.StageTimer("clinic_writer", "Hypokalemia", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the management of hypokalemia."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -305,40 +349,32 @@ Medication & History:
 {med_history}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the management of hypokalemia.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 7: Proteinuria & Hematuria
 # --------------------------
 with tabs[6]:
     st.header("Proteinuria & Hematuria")
-    reason_for_visit = st.text_input("Reason for Visit", "Proteinuria & Hematuria Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms (e.g., visible hematuria, flank pain) or note if asymptomatic...")
-    history = st.text_area("History & Risk Factors", "Enter any history of kidney disease, infections, trauma, etc.")
-    labs = st.text_area("Lab Data", "Enter urinalysis details, quantitative proteinuria, etc.")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for proteinuria/hematuria management...")
+    reason_for_visit = st.text_input("Reason for Visit", "Proteinuria & Hematuria Evaluation/Follow-Up", key="prot_hem_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms (e.g., visible hematuria, flank pain) or note if asymptomatic...", key="prot_hem_symptoms")
+    history = st.text_area("History & Risk Factors", "Enter any history of kidney disease, infections, trauma, etc.", key="prot_hem_history")
+    labs = st.text_area("Lab Data", "Enter urinalysis details, quantitative proteinuria, etc.", key="prot_hem_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for proteinuria/hematuria management...", key="prot_hem_assessment_plan")
 
     if st.button("Generate Note for Proteinuria & Hematuria"):
+        timer = note_metrics.StageTimer("clinic_writer", "Proteinuria & Hematuria", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the evaluation and management of proteinuria and hematuria."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -351,40 +387,32 @@ History & Risk Factors:
 {history}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the evaluation and management of proteinuria and hematuria.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
 
 # --------------------------
 # Tab 8: Renal Cyst
 # --------------------------
 with tabs[7]:
     st.header("Renal Cyst")
-    reason_for_visit = st.text_input("Reason for Visit", "Renal Cyst Evaluation/Follow-Up")
-    symptoms = st.text_area("Symptoms", "Enter symptoms (if any, or note if incidental finding)...")
-    imaging = st.text_area("Imaging Findings", "Enter details from imaging (size, location, complexity)...")
-    labs = st.text_area("Lab Data", "Enter any lab data if available (e.g., renal function tests)...")
-    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for renal cyst management...")
+    reason_for_visit = st.text_input("Reason for Visit", "Renal Cyst Evaluation/Follow-Up", key="renal_cyst_reason_for_visit")
+    symptoms = st.text_area("Symptoms", "Enter symptoms (if any, or note if incidental finding)...", key="renal_cyst_symptoms")
+    imaging = st.text_area("Imaging Findings", "Enter details from imaging (size, location, complexity)...", key="renal_cyst_imaging")
+    labs = st.text_area("Lab Data", "Enter any lab data if available (e.g., renal function tests)...", key="renal_cyst_labs")
+    assessment_plan = st.text_area("Assessment & Plan", "Enter assessment and plan for renal cyst management...", key="renal_cyst_assessment_plan")
 
     if st.button("Generate Note for Renal Cyst"):
+        timer = note_metrics.StageTimer("clinic_writer", "Renal Cyst", model="deepseek-chat")
+        instruction = "Generate a SOAP note focused on the evaluation and management of a renal cyst."
         prompt = f"""
 Visit Date: {visit_date}
 Reason for Visit: {reason_for_visit}
@@ -397,24 +425,40 @@ Imaging Findings:
 {imaging}
 
 Lab Data:
-{labs}
+{lab_trends.compact_labs(labs)}
 
 Assessment & Plan:
 {assessment_plan}
-
-Generate a SOAP note focused on the evaluation and management of a renal cyst.
 """
+        prompt, savings = prompt_compress.compress_with_stats(prompt)
+        timer.annotate(**savings)
+        timer.prompt_built()
         st.code(prompt, language="plaintext")
-        with st.spinner("Calling DeepSeek API..."):
-            try:
-                response = openai.Completion.create(
-                    model="deepseek-chat",
-                    prompt=prompt,
-                    max_tokens=800,
-                    temperature=0.7,
-                )
-                generated_note = response.choices[0].text.strip()
-                st.subheader("Generated Note")
-                st.markdown(generated_note)
-            except Exception as e:
-                st.error(f"API call failed: {e}")
+        st.caption(prompt_compress.describe(savings))
+        submit_note(instruction, prompt, timer)
+
+# --------------------------
+# Tab 9: Multi-Condition Visit
+# --------------------------
+with tabs[8]:
+    st.header("Multi-Condition Visit")
+    st.caption("Shared history is entered once; each condition's Assessment & Plan is generated concurrently.")
+    context, problems = multi_problem.render_form("multi", visit_type, visit_date)
+
+    if st.button("Generate Multi-Condition Note", disabled=not problems):
+        st.code(context, language="plaintext")
+
+        def run_visit(job):
+            started = time.perf_counter()
+            subjective, results = multi_problem.generate(context, problems, "clinic_writer", DEEPSEEK, temperature=0.7)
+            # Problems that failed are marked in the stitched note itself
+            job.caption = multi_problem.describe_timing(subjective, results, time.perf_counter() - started)
+            return multi_problem.stitch(context, subjective, results)
+
+        note_jobs.submit(f"Multi-Condition: {', '.join(p['condition'] for p in problems)} ({visit_date})", run_visit)
+        st.info(f"{len(problems)} problems queued; the note appears under Generated Notes when ready.")
+
+# --------------------------
+# Notes generating in the background, from any tab
+# --------------------------
+note_jobs.render_panel("Generated Notes")
@@ -0,0 +1,104 @@
+"""
+Shift-start census load: flat key scan vs census manifest + parallel GETs.
+
+Writes --patients records (a few saves each over the last week) into a local
+store whose calls sleep --latency seconds to stand in for S3 round trips, once
+in the legacy flat layout and once migrated to the service/date layout. Then
+times loading the latest record of everyone saved in the last 48 hours:
+
+    flat      list patients/ (pages of 1000 keys), then a GET per patient, in sequence
+    census    census manifests for the window + parallel GETs (census.preload)
+
+    python benchmarks/bench_census.py --patients 200 --latency 0.03
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, ".streamlit"))
+
+import census  # noqa: E402
+import note_history  # noqa: E402
+
+
+class SlowStore(note_history.LocalStore):
+    """LocalStore with a fixed delay per request; list() pays it once per 1000-key page like S3."""
+
+    def __init__(self, root, latency):
+        super().__init__(root)
+        self.latency = latency
+        self.requests = 0
+
+    def _wait(self, n=1):
+        self.requests += n
+        time.sleep(self.latency * n)
+
+    def get(self, key):
+        self._wait()
+        return super().get(key)
+
+    def list(self, prefix):
+        keys = super().list(prefix)
+        self._wait(max(1, -(-len(keys) // 1000)))
+        return keys
+
+
+def populate(root, patients, saves, now):
+    store = note_history.LocalStore(root)
+    for i in range(patients):
+        for s in range(saves):
+            # Older admissions as well as the current census: saves spread over the last week
+            when = now - datetime.timedelta(hours=(i * 7 + s * 29) % 168)
+            record = {"id": f"P{i:04d}", "note_type": "Progress", "reason": "AKI", "soap_note": "x" * 2000}
+            store.put(f"patients/P{i:04d}_{when:%Y%m%dT%H%M%S}.json", json.dumps(record).encode("utf-8"))
+
+
+def load_flat(store, hours, now):
+    since = f"{now - datetime.timedelta(hours=hours):%Y%m%dT%H%M%S}"
+    latest = {}
+    for key in store.list("patients/"):
+        record_id, stamp = key[len("patients/"):-len(".json")].rsplit("_", 1)
+        if stamp >= since and stamp > latest.get(record_id, ("", ""))[0]:
+            latest[record_id] = (stamp, key)
+    return [json.loads(store.get(key)) for _, key in sorted(latest.values())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--saves", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument("--hours", type=float, default=48)
+    args = parser.parse_args()
+
+    now = datetime.datetime.now()
+    root = tempfile.mkdtemp(prefix="census_")
+    populate(root, args.patients, args.saves, now)
+
+    flat = SlowStore(root, args.latency)
+    started = time.perf_counter()
+    flat_records = load_flat(flat, args.hours, now)
+    flat_s = time.perf_counter() - started
+
+    census.migrate(note_history.LocalStore(root), delete=True, log=lambda message: None)
+    partitioned = SlowStore(root, args.latency)
+    started = time.perf_counter()
+    census_records = census.preload(partitioned, hours=args.hours, now=now)
+    census_s = time.perf_counter() - started
+    assert len(census_records) == len(flat_records)
+
+    print(f"{len(census_records)} patients in the {args.hours:.0f}h census "
+          f"({args.patients} patients, {args.patients * args.saves} records stored)")
+    print(f"  flat scan       : {flat_s:7.3f}s  {flat.requests} requests")
+    print(f"  census preload  : {census_s:7.3f}s  {partitioned.requests} requests "
+          f"({census.WORKERS} workers)  {flat_s / census_s:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput benchmark for the CKD staging engine (.streamlit/ckd_staging.py).
+
+Builds a synthetic cohort (age, sex, creatinine, cystatin C for a share of
+patients, UACR, a prior creatinine and the interval) and reports:
+
+    vectorized      stage_panel over the whole cohort
+    per_patient     the same arithmetic one patient at a time, on a sample,
+                    extrapolated to the cohort size
+    from_labs       single-visit staging from free-text labs, per call
+
+    python benchmarks/bench_ckd_staging.py --patients 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".streamlit"))
+import ckd_staging  # noqa: E402
+
+
+def make_cohort(n, seed=0):
+    rng = np.random.default_rng(seed)
+    scr = rng.lognormal(mean=0.3, sigma=0.5, size=n).clip(0.4, 12)
+    scys = np.where(rng.random(n) < 0.3, (scr * rng.uniform(0.6, 1.0, n)).clip(0.5, 8), np.nan)
+    return {
+        "scr": scr,
+        "age": rng.integers(18, 95, n),
+        "sex": rng.random(n) < 0.5,
+        "scys": scys,
+        "uacr": np.where(rng.random(n) < 0.8, rng.lognormal(3.5, 1.5, n), np.nan),
+        "prior_scr": scr * rng.uniform(0.7, 1.2, n),
+        "years": rng.uniform(0.25, 2, n),
+    }
+
+
+def per_patient(cohort, i):
+    c = {k: v[i] for k, v in cohort.items()}
+    return ckd_staging.stage_panel(c["scr"], c["age"], c["sex"], np.array([c["scys"]]), np.array([c["uacr"]]),
+                                   c["prior_scr"], c["years"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=5_000, help="patients for the per-patient loop")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    cohort = make_cohort(args.patients)
+    timings = []
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        result = ckd_staging.stage_panel(**cohort)
+        timings.append(time.perf_counter() - started)
+    vectorized = min(timings)
+
+    sample = min(args.sample, args.patients)
+    started = time.perf_counter()
+    for i in range(sample):
+        per_patient(cohort, i)
+    loop = (time.perf_counter() - started) / sample * args.patients
+
+    labs = "Cr 1.6 -> 2.1 over 9 months, cystatin C 1.9, UACR 420 mg/g"
+    ckd_staging.from_labs(labs, 67, "F")
+    started = time.perf_counter()
+    for _ in range(1000):
+        ckd_staging.from_labs(labs, 67, "F")
+    visit = (time.perf_counter() - started) / 1000
+
+    stages, counts = np.unique(result["g_category"], return_counts=True)
+    print(f"cohort          {args.patients:,} patients")
+    print(f"vectorized      {vectorized:8.3f}s  ({args.patients / vectorized:,.0f} patients/s)")
+    print(f"per_patient     {loop:8.3f}s  (extrapolated from {sample:,}; {loop / vectorized:,.0f}x slower)")
+    print(f"from_labs       {visit * 1e6:8.1f}us per visit")
+    print("G categories    " + ", ".join(f"{s}={c:,}" for s, c in zip(stages, counts)))
+
+
+if __name__ == "__main__":
+    main()
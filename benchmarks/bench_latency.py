@@ -0,0 +1,225 @@
+"""
+End-to-end latency benchmark for the note writer apps, fully offline.
+
+Boots the local mock LLM server, drives each app's generation path through
+Streamlit's AppTest harness and reports p50/p95/p99 of the wall time per
+generation together with the overhead spent outside the (mocked) LLM calls.
+
+    python benchmarks/bench_latency.py --iterations 20 --latency 0.1 --token-rate 200
+    python benchmarks/bench_latency.py --scenario app_phase1 --json results.json
+
+Overhead is wall time minus the time the mock server spent serving requests
+during that run, so regressions in our own code show up independently of
+provider latency.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from mock_llm_server import MockConfig, MockLLMServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, ".streamlit")
+CLINIC_WRITER = os.path.join(REPO_ROOT, "Nephrology clinic note writter.py")
+
+SECRETS = {
+    "DEEPSEEK_API_KEY": "mock-key",
+    "DEEPOSEEK_API_KEY": "mock-key",
+    "OPENAI_API_KEY": "mock-key",
+}
+
+CLINIC_TAB_BUTTONS = [
+    "Generate Note for CKD Evaluation",
+    "Generate Note for CKD Follow-Up",
+    "Generate Note for HTN",
+    "Generate Note for Glomerulonephritis",
+    "Generate Note for Hyponatremia",
+    "Generate Note for Hypokalemia",
+    "Generate Note for Proteinuria & Hematuria",
+    "Generate Note for Renal Cyst",
+]
+
+
+def _app(path, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(path, default_timeout=timeout)
+    for key, value in SECRETS.items():
+        at.secrets[key] = value
+    return at
+
+
+def _button(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def _settle(at, timeout):
+    """Wait for the background note jobs the last interaction queued, then rerun so the page shows them."""
+    import note_jobs
+
+    if not note_jobs.wait_idle(timeout):
+        raise RuntimeError("Background note jobs did not finish")
+    return at.run()
+
+
+def _check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    errors = [e.value for e in at.error]
+    if errors:
+        raise RuntimeError(errors[0])
+
+
+# Each scenario yields one callable per measured step; a step performs the
+# interaction and the rerun that issues the LLM call(s), waiting for any
+# background note jobs it queued.
+
+def scenario_clinic_tabs(timeout):
+    for label in CLINIC_TAB_BUTTONS:
+        at = _app(CLINIC_WRITER, timeout)
+        at.run()
+        yield (f"clinic:{label.replace('Generate Note for ', '')}",
+               lambda at=at, label=label: _settle(_button(at.button, label).click().run(), timeout))
+
+
+def scenario_app_structured(timeout):
+    at = _app(os.path.join(APP_DIR, "app.py"), timeout)
+    at.run()
+    _button(at.sidebar.button, "Start Timer").click().run()
+    yield "app.py:structured", lambda: at.button(key="generate_note").click().run()
+
+
+def scenario_app_free_text(timeout):
+    at = _app(os.path.join(APP_DIR, "app.py"), timeout)
+    at.run()
+    _button(at.sidebar.button, "Start Timer").click().run()
+    at.radio(key="input_mode").set_value("Free Text").run()
+    at.text_area(key="free_text").input("72M CKD 3b, Cr 1.8 stable, BP 138/84 on losartan.").run()
+    yield "app.py:free_text", lambda: at.button(key="generate_note").click().run()
+
+
+def scenario_appopenai(timeout):
+    at = _app(os.path.join(APP_DIR, "appopenAi.py"), timeout)
+    at.run()
+    for area in at.text_area:
+        area.input({
+            "Current Labs:": "Cr 3.1, Na 134, K 5.2",
+            "Trending Labs:": "Cr 1.2→2.4→3.1 over 3 days",
+            "HPI Context:": "68F with sepsis, hypotension, on pip-tazo and vancomycin.",
+            "Assessment & Plan:": "AKI: AKI workup, avoid nephrotoxins\nHyperkalemia: Lokelma",
+        }.get(area.label, area.value or ""))
+    at.text_input[0].input("AKI")
+    at.run()
+    yield "appopenAi:3-stage", lambda: _button(at.button, "Generate Consultation Note").click().run()
+
+
+def scenario_app_phase1(timeout):
+    at = _app(os.path.join(APP_DIR, "app_phase1.py"), timeout)
+    at.run()
+    yield "app_phase1:consult", lambda: _settle(_button(at.button, "Generate Consultation Note").click().run(), timeout)
+    yield "app_phase1:soap", lambda: _settle(_button(at.button, "Generate SOAP Note").click().run(), timeout)
+    yield "app_phase1:follow_up", lambda: _settle(_button(at.button, "Generate Follow-Up Note").click().run(), timeout)
+
+
+SCENARIOS = {
+    "clinic_tabs": scenario_clinic_tabs,
+    "app_structured": scenario_app_structured,
+    "app_free_text": scenario_app_free_text,
+    "appopenai": scenario_appopenai,
+    "app_phase1": scenario_app_phase1,
+}
+
+
+def run_benchmark(scenarios, iterations, server, timeout):
+    samples = {}
+    for _ in range(iterations):
+        for name in scenarios:
+            for step, action in SCENARIOS[name](timeout):
+                before = server.stats.snapshot()
+                started = time.perf_counter()
+                at = action()
+                wall = time.perf_counter() - started
+                after = server.stats.snapshot()
+                entry = samples.setdefault(step, {"wall": [], "overhead": [], "llm_calls": 0, "failures": 0})
+                entry["llm_calls"] += after["requests"] - before["requests"]
+                try:
+                    _check(at)
+                except RuntimeError:
+                    # Injected provider errors surface as app errors; count them, don't time them
+                    entry["failures"] += 1
+                    continue
+                llm = after["service_seconds"] - before["service_seconds"]
+                entry["wall"].append(wall)
+                entry["overhead"].append(max(wall - llm, 0.0))
+    return samples
+
+
+def summarize(samples):
+    # Imported here: throughput_store reads THROUGHPUT_DB on import, which main() points at a scratch file first
+    from throughput_store import percentile
+
+    report = {}
+    for step, entry in samples.items():
+        row = {"n": len(entry["wall"]), "llm_calls": entry["llm_calls"], "failures": entry["failures"]}
+        if not entry["wall"]:
+            report[step] = row
+            continue
+        for metric in ("wall", "overhead"):
+            for q in (50, 95, 99):
+                row[f"{metric}_p{q}_ms"] = round(percentile(entry[metric], q) * 1000, 1)
+        report[step] = row
+    return report
+
+
+def print_report(report):
+    header = f"{'step':38} {'n':>4} {'calls':>5} {'fail':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'ovh p50':>9} {'ovh p95':>9} {'ovh p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for step, row in report.items():
+        if not row["n"]:
+            print(f"{step:38} {0:>4} {row['llm_calls']:>5} {row['failures']:>4}  (all runs failed)")
+            continue
+        print(f"{step:38} {row['n']:>4} {row['llm_calls']:>5} {row['failures']:>4} "
+              f"{row['wall_p50_ms']:>9} {row['wall_p95_ms']:>9} {row['wall_p99_ms']:>9} "
+              f"{row['overhead_p50_ms']:>9} {row['overhead_p95_ms']:>9} {row['overhead_p99_ms']:>9}")
+    print("(all times in ms; ovh = wall time outside the mocked LLM)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="mock tokens per second")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest timeout per run (s)")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    # Benchmark notes must not count towards the clinicians' throughput data
+    os.environ.setdefault("THROUGHPUT_DB", os.path.join(tempfile.mkdtemp(prefix="bench_latency_"), "throughput.sqlite3"))
+    config = MockConfig(args.latency, args.token_rate, args.completion_tokens, args.error_rate, seed=0)
+    with MockLLMServer(config) as server:
+        os.environ["DEEPSEEK_API_BASE"] = server.url
+        os.environ["OPENAI_API_BASE"] = server.url
+        samples = run_benchmark(args.scenario or list(SCENARIOS), args.iterations, server, args.timeout)
+
+    report = summarize(samples)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Storage and reconstruction benchmark for the patient note version history.
+
+Simulates an admission where the record is saved several times a day: the
+daily SOAP note is the previous one with a few lines edited and new labs are
+appended. Compares the bytes the legacy layout (one full JSON record per save)
+would store with the snapshot + delta history, then times reconstructing
+every version with a cold cache and runs compaction.
+
+    python benchmarks/bench_note_history.py --days 30 --saves-per-day 3
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, ".streamlit"))
+
+import note_history  # noqa: E402
+
+PROBLEMS = ["AKI", "Hyperkalemia", "Metabolic acidosis", "Volume overload", "Anemia of CKD", "Hypertension"]
+
+
+def _note(rng, day):
+    lines = [f"Subjective: hospital day {day}, patient reports {rng.choice(['less', 'more', 'stable'])} edema."]
+    for problem in PROBLEMS:
+        lines.append(f"{problem}:")
+        lines.extend(f"- {problem} plan item {i}: continue current management, reassess in 24 hours." for i in range(6))
+    return lines
+
+
+def simulate(days, saves_per_day, seed=7):
+    """(saved_at, record) for every save of one admission."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2026, 1, 1, 8)
+    lines = _note(rng, 1)
+    consult = "\n".join(lines)
+    labs = {"Cr": [], "K": [], "HCO3": []}
+    saves = []
+    for day in range(days):
+        for save in range(saves_per_day):
+            lines[0] = f"Subjective: hospital day {day + 1}, update {save + 1}."
+            for _ in range(rng.randint(1, 4)):
+                i = rng.randrange(1, len(lines))
+                lines[i] = lines[i].split(":")[0] + f": adjusted on day {day + 1} ({rng.randint(0, 999)})."
+            for name in labs:
+                labs[name].append([f"2026-01-{day % 28 + 1:02d}", round(rng.uniform(1, 6), 1)])
+            saved_at = start + datetime.timedelta(days=day, hours=4 * save)
+            record = {"id": "AB", "note_type": "Progress", "reason": "AKI secondary to hypovolemia",
+                      "consultation_note": consult, "soap_note": "\n".join(lines),
+                      "last_updated": str(saved_at), "lab_series": json.loads(json.dumps(labs))}
+            saves.append((saved_at.isoformat(timespec="seconds"), record))
+    return saves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--saves-per-day", type=int, default=3)
+    parser.add_argument("--snapshot-every", type=int, default=note_history.SNAPSHOT_EVERY)
+    parser.add_argument("--keep-days", type=int, default=7)
+    args = parser.parse_args()
+
+    saves = simulate(args.days, args.saves_per_day)
+    legacy = sum(len(json.dumps(record)) for _, record in saves)
+
+    store = note_history.LocalStore(tempfile.mkdtemp(prefix="note_history_"))
+    started = time.perf_counter()
+    for saved_at, record in saves:
+        note_history.save(store, record, args.snapshot_every, saved_at)
+    save_s = time.perf_counter() - started
+    entries = note_history.versions(store, "AB")
+    stored = sum(e["size"] for e in entries)
+    snaps = sum(e["kind"] == "snap" for e in entries)
+
+    timings = []
+    for entry, (_, record) in zip(entries, saves):
+        note_history._CACHE.clear()  # cold: from the snapshot and deltas in the store
+        started = time.perf_counter()
+        assert note_history.load(store, "AB", entry["v"]) == record
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    print(f"{len(saves)} saves over {args.days} days")
+    print(f"  legacy full records : {legacy:>10,} bytes")
+    print(f"  snapshot + deltas   : {stored:>10,} bytes ({snaps} snapshots)  {legacy / stored:.1f}x smaller")
+    print(f"  save                : {1000 * save_s / len(saves):.2f} ms per version")
+    print(f"  reconstruct (cold)  : p50 {1000 * timings[len(timings) // 2]:.2f} ms, max {1000 * timings[-1]:.2f} ms")
+
+    today = datetime.date.fromisoformat(saves[-1][0][:10])
+    n_before, n_after, before, after = note_history.compact(store, "AB", args.keep_days, args.snapshot_every, today)
+    print(f"  compact (keep {args.keep_days}d) : {n_before} -> {n_after} versions, {before:,} -> {after:,} bytes "
+          f"({legacy / after:.1f}x smaller than legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Prefix-cache benchmark for the note prompt layout, fully offline.
+
+Runs the mock LLM server with provider prefix caching emulated (cache blocks
+of --cache-block whitespace tokens, uncached prompt tokens charged at
+--prefill-rate) and reports the share of prompt tokens served from cache and
+the request latency for:
+
+    layout      synthetic clinic visits sent two ways: the old completion
+                layout (visit data first, instructions last) and the chat
+                layout the apps now use (static system prefix and tab
+                instruction first, visit data last). The system prefix and
+                tab instructions are read from the clinic writer source.
+    clinic      every clinic writer tab driven through AppTest, with the hit
+                rate taken from the usage fields recorded by note_metrics
+
+    python benchmarks/bench_prefix_cache.py --visits 40 --prefill-rate 1000
+"""
+
+import argparse
+import ast
+import os
+import random
+import sys
+import time
+
+import openai
+
+from bench_latency import APP_DIR, CLINIC_TAB_BUTTONS, CLINIC_WRITER, _app, _button, _check, _settle
+from mock_llm_server import MockConfig, MockLLMServer
+
+SYMPTOMS = ["fatigue", "ankle edema", "nocturia", "foamy urine", "poor appetite", "muscle cramps", "no complaints"]
+MEDS = ["losartan 50 mg daily", "amlodipine 10 mg daily", "furosemide 40 mg daily", "empagliflozin 10 mg daily",
+        "atorvastatin 40 mg nightly", "sodium bicarbonate 650 mg BID"]
+
+
+def clinic_prompt_parts():
+    """CLINIC_SYSTEM and every tab's instruction, read from the clinic writer without running it."""
+    tree = ast.parse(open(CLINIC_WRITER).read())
+    system, instructions = None, []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name == "CLINIC_SYSTEM":
+                system = ast.literal_eval(node.value)
+            elif name == "instruction" and isinstance(node.value, ast.Constant):
+                instructions.append(node.value.value)
+    return system, instructions
+
+
+def synthetic_visit(rng):
+    cr = [round(rng.uniform(1.2, 3.5), 1) for _ in range(3)]
+    return (f"Visit Date: {time.strftime('%B %d, %Y')}\n"
+            f"Reason for Visit: follow-up, patient {rng.randint(1000, 9999)}\n\n"
+            f"Subjective:\nPatient reports {', '.join(rng.sample(SYMPTOMS, 2))} over the last "
+            f"{rng.randint(1, 12)} weeks.\n\nMedications:\n" + "\n".join(rng.sample(MEDS, 3)) + "\n\n"
+            f"Lab Data:\nCr {cr[0]} -> {cr[1]} -> {cr[2]}, K {round(rng.uniform(3.5, 5.8), 1)}, "
+            f"UACR {rng.randint(20, 900)} mg/g\n\nAssessment & Plan:\nCKD: continue current plan, recheck labs.")
+
+
+def run_layout(make_config, visits, seed):
+    system, instructions = clinic_prompt_parts()
+    rng = random.Random(seed)
+    requests = [(rng.choice(instructions), synthetic_visit(rng)) for _ in range(visits)]
+    results = {}
+    for layout in ("data_first", "static_prefix"):
+        with MockLLMServer(make_config()) as server:
+            latencies = []
+            for instruction, data in requests:
+                started = time.perf_counter()
+                if layout == "data_first":
+                    openai.Completion.create(model="deepseek-chat", prompt=f"{data}\n\n{system}\n{instruction}",
+                                             max_tokens=50, api_base=server.url, api_key="mock-key")
+                else:
+                    openai.ChatCompletion.create(
+                        model="deepseek-chat", max_tokens=50, api_base=server.url, api_key="mock-key",
+                        messages=[{"role": "system", "content": system},
+                                  {"role": "user", "content": f"{instruction}\n\n{data}"}])
+                latencies.append(time.perf_counter() - started)
+            stats = server.stats.snapshot()
+        results[f"layout:{layout}"] = {"requests": len(latencies),
+                                       "hit_rate": stats["cached_tokens"] / max(stats["prompt_tokens"], 1),
+                                       "mean_ms": 1000 * sum(latencies) / len(latencies)}
+    return results
+
+
+def run_clinic(make_config, rounds, timeout):
+    import note_metrics
+
+    with MockLLMServer(make_config()) as server:
+        os.environ["DEEPSEEK_API_BASE"] = server.url
+        before = len(note_metrics.all_records())
+        for _ in range(rounds):
+            for label in CLINIC_TAB_BUTTONS:
+                at = _app(CLINIC_WRITER, timeout)
+                at.run()
+                _check(_settle(_button(at.button, label).click().run(), timeout))
+    records = note_metrics.all_records()[before:]
+    return {"clinic:tabs": {"requests": len(records),
+                            "hit_rate": note_metrics.cache_hit_rate(records) or 0.0,
+                            "mean_ms": 1000 * sum(r["latency_s"] for r in records) / max(len(records), 1)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=["layout", "clinic"],
+                        help="scenario to run (repeatable, default: both)")
+    parser.add_argument("--visits", type=int, default=40, help="synthetic visits for the layout scenario")
+    parser.add_argument("--rounds", type=int, default=2, help="passes over the clinic tabs")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock time to first token (s)")
+    parser.add_argument("--prefill-rate", type=float, default=1000.0, help="uncached prompt tokens per second")
+    parser.add_argument("--cache-block", type=int, default=64, help="cache block size in tokens")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest timeout per run (s)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    # A fresh server (and so an empty cache) for every layout and scenario
+    def make_config():
+        return MockConfig(latency=args.latency, token_rate=0, completion_tokens=50, seed=0, prefix_cache=True,
+                          cache_block=args.cache_block, prefill_rate=args.prefill_rate)
+
+    results = {}
+    scenarios = args.scenario or ["layout", "clinic"]
+    if "layout" in scenarios:
+        results.update(run_layout(make_config, args.visits, seed=0))
+    if "clinic" in scenarios:
+        results.update(run_clinic(make_config, args.rounds, args.timeout))
+
+    print(f"{'scenario':24} {'requests':>8} {'cache hit':>10} {'mean ms':>9}")
+    for name, row in results.items():
+        print(f"{name:24} {row['requests']:>8} {row['hit_rate']:>9.1%} {row['mean_ms']:>9.1f}")
+    print(f"(hit = share of prompt tokens served from the emulated cache, {args.cache_block}-token blocks)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Throughput and accuracy benchmark for the free-text note segmenter.
+
+Builds a corpus of free-text visit notes whose parts are labeled with the
+section they belong to: synthetic notes in three typing styles (headed lines,
+one run-on paragraph, a mix), or notes assembled from saved app1.py dataset
+entries (--corpus dataset_entries.jsonl). Reports segmentation throughput,
+per-section recall (share of labeled parts that land in their section) and
+the prompt tokens of the Free Text prompt as typed vs the structured prompt.
+
+    python benchmarks/bench_segmenter.py --notes 2000
+    python benchmarks/bench_segmenter.py --corpus dataset_entries.jsonl
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, ".streamlit"))
+
+import note_segmenter  # noqa: E402
+import prompt_compress  # noqa: E402
+
+REASONS = ["here for CKD f/u", "presents for evaluation of hyponatremia", "referred for proteinuria",
+           "f/u HTN and CKD 3b", "seen for hypokalemia follow-up", "here with new renal cyst on CT"]
+HISTORY = ["Reports more ankle edema over the last two weeks", "Denies dysuria or gross hematuria",
+           "Had a fall at home last month, no LOC", "Appetite is fair and weight is down 3 lb",
+           "BP at home mostly in the 140s", "Was admitted in March for pneumonia"]
+LABS = ["Cr 1.8 -> 2.1 over 6 months, K 5.2", "Na 128, K 3.1, HCO3 19", "UACR 450 mg/g, Hgb 10.9",
+        "Cr 2.4, BUN 40, Phos 5.1", "eGFR 38, Ca 9.2, PTH 180"]
+MEDS = ["lisinopril 20 mg daily", "amlodipine 5 mg daily", "furosemide 40 mg bid", "metformin 500 mg bid",
+        "sertraline 50 mg daily", "atorvastatin 40 mg qhs"]
+PLANS = ["CKD 3b - continue lisinopril, recheck BMP in 3 months", "HTN - increase amlodipine to 10 mg",
+         "Hyponatremia - fluid restrict 1.5 L, repeat Na in 1 week", "Start sodium bicarbonate 650 mg bid",
+         "Refer to dietitian for low potassium diet", "Follow up in 3 months with labs"]
+
+
+def _sentence(text):
+    return text[0].upper() + text[1:] + "."
+
+
+def synthetic(n, seed=11):
+    """[(text, [(section, part), ...])] in headed, run-on and mixed styles."""
+    rng = random.Random(seed)
+    notes = []
+    for i in range(n):
+        parts = [("reason", rng.choice(REASONS))]
+        parts += [("history", h) for h in rng.sample(HISTORY, 2)]
+        parts += [("labs", rng.choice(LABS))]
+        meds = rng.sample(MEDS, 2)
+        plans = rng.sample(PLANS, 2)
+        style = ("headed", "runon", "mixed")[i % 3]
+        if style == "headed":
+            text = (f"CC: {parts[0][1]}\nHPI: {parts[1][1]}. {parts[2][1]}.\nLabs: {parts[3][1]}\n"
+                    f"Meds:\n" + "\n".join(meds) + "\nA/P:\n" + "\n".join(f"{k + 1}. {p}" for k, p in enumerate(plans)))
+        elif style == "runon":
+            text = " ".join(_sentence(p) for _, p in parts) + f" On {meds[0]}, {meds[1]}. " + \
+                " ".join(_sentence(p) for p in plans)
+        else:
+            text = " ".join(_sentence(p) for _, p in parts) + f"\nMeds: {', '.join(meds)}\nPlan: " + "; ".join(plans)
+        parts += [("meds", m) for m in meds] + [("assessment_plan", p) for p in plans]
+        notes.append((text, parts))
+    return notes
+
+
+def from_entries(path):
+    """Run-on notes assembled from saved app1.py entries, labeled by the field each part came from."""
+    fields = [("reason", "reason_for_consultation"), ("history", "presenting_symptoms"),
+              ("history", "clinical_history_context"), ("labs", "labs"), ("assessment_plan", "assessment_plan_input")]
+    notes = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            parts = [(section, entry.get(key, "").strip()) for section, key in fields]
+            parts = [(section, text) for section, text in parts if text]
+            if parts and parts[0][0] == "reason":
+                parts[0] = ("reason", f"Here for {parts[0][1]}")
+            notes.append(("\n".join(text for _, text in parts), parts))
+    return notes
+
+
+def _norm(text):
+    return " ".join(text.lower().replace(".", " ").replace(";", " ").split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--corpus", help="dataset_entries.jsonl from app1.py instead of synthetic notes")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    notes = from_entries(args.corpus) if args.corpus else synthetic(args.notes)
+    texts = [text for text, _ in notes]
+    note_segmenter.segment(texts[0])  # load the drug term file outside the timing
+
+    best = None
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        segmented = [note_segmenter.segment(text) for text in texts]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    hits, totals = collections.Counter(), collections.Counter()
+    for (_, parts), segments in zip(notes, segmented):
+        for section, part in parts:
+            totals[section] += 1
+            hits[section] += _norm(part) in _norm(segments[section])
+
+    raw_tokens = structured_tokens = 0
+    for text, segments in zip(texts, segmented):
+        raw = f"\nVisit Date: October 19, 2026\n\n{text}\n"
+        structured = note_segmenter.structured_prompt(segments, "CKD", "Follow-Up", "October 19, 2026")
+        raw_tokens += prompt_compress.count_tokens(prompt_compress.compress(raw))[0]
+        structured_tokens += prompt_compress.count_tokens(prompt_compress.compress(structured))[0]
+
+    chars = sum(len(text) for text in texts)
+    print(f"{len(notes)} notes, {chars / 1024:.0f} KiB")
+    print(f"  throughput : {len(notes) / best:,.0f} notes/s, {chars / 1024 / best:,.0f} KiB/s "
+          f"({1e6 * best / len(notes):.0f} us/note)")
+    for section in note_segmenter.SECTIONS:
+        if totals[section]:
+            print(f"  recall {section:16} {hits[section] / totals[section]:6.1%}  ({totals[section]} parts)")
+    print(f"  recall overall          {sum(hits.values()) / sum(totals.values()):6.1%}")
+    print(f"  prompt tokens per note : as typed {raw_tokens / len(notes):.0f}, "
+          f"structured {structured_tokens / len(notes):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Cold-start benchmark for hugging_face.py.
+
+Each measurement runs in a fresh interpreter so imports are genuinely cold.
+Three numbers are reported (median over --repeats runs):
+
+    eager_load_s    import transformers + load the model, i.e. what the first
+                    page load used to block on before anything rendered
+    first_render_s  first AppTest run of hugging_face.py (page interactive)
+    model_ready_s   first render until the background preload finishes
+                    (HF_PRELOAD=1)
+
+    python benchmarks/bench_startup.py --repeats 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, ".streamlit")
+HF_APP = os.path.join(APP_DIR, "hugging_face.py")
+
+EAGER_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+tokenizer = AutoTokenizer.from_pretrained("gpt2")
+model = AutoModelForCausalLM.from_pretrained("gpt2")
+pipeline("text-generation", model=model, tokenizer=tokenizer)
+print(json.dumps({"eager_load_s": time.perf_counter() - t0}))
+"""
+
+LAZY_SNIPPET = """
+import json, sys, threading, time
+sys.path.insert(0, {app_dir!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=600)
+at.secrets["AWS_ACCESS_KEY_ID"] = at.secrets["AWS_SECRET_ACCESS_KEY"] = "x"
+at.secrets["AWS_DEFAULT_REGION"] = "us-east-1"
+at.secrets["BUCKET_NAME"] = "x"
+t0 = time.perf_counter()
+at.run()
+first_render = time.perf_counter() - t0
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+result = {{"first_render_s": first_render}}
+preload = [t for t in threading.enumerate() if t.name == "hf-model-preload"]
+if preload:
+    preload[0].join()
+    result["model_ready_s"] = time.perf_counter() - t0
+print(json.dumps(result))
+"""
+
+
+def _run(snippet, env=None):
+    out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True,
+                         env={**os.environ, **(env or {})}, cwd=REPO_ROOT, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-eager", action="store_true", help="skip the eager-import baseline")
+    args = parser.parse_args()
+
+    samples = {}
+    lazy = LAZY_SNIPPET.format(app_dir=APP_DIR, app=HF_APP)
+    for _ in range(args.repeats):
+        results = [_run(lazy, {"HF_PRELOAD": "1"})]
+        if not args.skip_eager:
+            results.append(_run(EAGER_SNIPPET))
+        for result in results:
+            for key, value in result.items():
+                samples.setdefault(key, []).append(value)
+
+    for key in ("eager_load_s", "first_render_s", "model_ready_s"):
+        if key in samples:
+            print(f"{key:16} median {statistics.median(samples[key]):8.3f}s  "
+                  f"min {min(samples[key]):8.3f}s  max {max(samples[key]):8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
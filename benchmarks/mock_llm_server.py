@@ -0,0 +1,303 @@
+"""
+Local mock of the DeepSeek / OpenAI HTTP API used by the note writer apps.
+
+Serves the two endpoints the apps call through the openai SDK:
+    POST /completions        (DeepSeek "deepseek-chat" completions)
+    POST /chat/completions   (GPT-4 chat, including function calls)
+
+Latency is simulated as a fixed time-to-first-token plus completion tokens
+divided by a token rate, so benchmarks can separate provider time from the
+time our own code spends around each call.
+
+With prefix caching on, the server emulates provider context caching: prompt
+tokens are hashed in fixed-size blocks from the start of the prompt (system
+message first), a request reuses the longest run of blocks seen before, and
+usage reports the hits the way DeepSeek (prompt_cache_hit_tokens /
+prompt_cache_miss_tokens) and OpenAI (prompt_tokens_details.cached_tokens)
+do. Uncached prompt tokens cost 1 / prefill_rate seconds each.
+
+Run standalone:
+    python benchmarks/mock_llm_server.py --port 8765 --latency 0.2 --token-rate 80
+then point the apps at it:
+    DEEPSEEK_API_BASE=http://127.0.0.1:8765 OPENAI_API_BASE=http://127.0.0.1:8765 streamlit run .streamlit/app.py
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    def __init__(self, latency=0.2, token_rate=80.0, completion_tokens=200,
+                 error_rate=0.0, error_status=500, seed=None,
+                 prefix_cache=False, cache_block=64, prefill_rate=0.0):
+        self.latency = latency                      # seconds before the first token
+        self.token_rate = token_rate                # completion tokens per second
+        self.completion_tokens = completion_tokens  # tokens per reply (capped by max_tokens)
+        self.error_rate = error_rate                # probability of an injected error
+        self.error_status = error_status            # HTTP status for injected errors
+        self.rng = random.Random(seed)
+        self.prefix_cache = prefix_cache            # emulate provider prefix caching
+        self.cache_block = cache_block              # cache granularity in prompt tokens
+        self.prefill_rate = prefill_rate            # uncached prompt tokens per second (0 = free)
+
+
+class PrefixCache:
+    """Block-hash prefix cache: the longest cached run of whole blocks from the start of the prompt."""
+
+    def __init__(self, block, max_blocks=50000):
+        self.block = block
+        self.max_blocks = max_blocks
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_and_store(self, tokens):
+        """Return the number of prompt tokens served from cache, then cache every whole block."""
+        digest = hashlib.sha1()
+        hit, hashes = 0, []
+        for start in range(0, len(tokens) - self.block + 1, self.block):
+            digest.update(" ".join(tokens[start:start + self.block]).encode())
+            hashes.append(digest.copy().hexdigest())
+        with self._lock:
+            for h in hashes:
+                if h not in self._blocks:
+                    break
+                hit += self.block
+            for h in hashes:
+                self._blocks[h] = True
+                self._blocks.move_to_end(h)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return hit
+
+
+class MockStats:
+    """Thread-safe counters shared by all handler threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.service_seconds = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, seconds, error=False, prompt_tokens=0, cached_tokens=0):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.service_seconds += seconds
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors,
+                    "service_seconds": self.service_seconds,
+                    "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens}
+
+
+def _tokens(text):
+    # Whitespace tokens are close enough for simulated usage numbers and cache blocks
+    return text.split()
+
+
+def _prompt_text(body):
+    if "messages" in body:
+        return "\n".join(m.get("content") or "" for m in body["messages"])
+    prompt = body.get("prompt", "")
+    return "\n".join(prompt) if isinstance(prompt, list) else prompt
+
+
+def _completion_words(n):
+    words = ["Assessment:", "patient", "stable", "creatinine", "improving", "continue",
+             "current", "management", "monitor", "labs", "weekly", "Plan:"]
+    return [words[i % len(words)] for i in range(n)]
+
+
+def _function_arguments(body):
+    # Only the appopenAi extractor uses function calling; answer with one generic section
+    return json.dumps({
+        "sections": [
+            {"heading": "AKI", "content": "Mock extracted content", "related_triggers": ["AKI workup"]}
+        ]
+    })
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        started = time.perf_counter()
+        config = self.server.config
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.rstrip("/")
+
+        if config.error_rate and config.rng.random() < config.error_rate:
+            self._send_json(config.error_status, {
+                "error": {"message": "Injected mock error", "type": "server_error", "code": None}
+            })
+            self.server.stats.record(time.perf_counter() - started, error=True)
+            return
+
+        if not path.endswith("/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            self.server.stats.record(time.perf_counter() - started, error=True)
+            return
+
+        chat = path.endswith("/chat/completions")
+        n_tokens = min(body.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+        words = _completion_words(n_tokens)
+        prompt_tokens = _tokens(_prompt_text(body))
+        usage = {
+            "prompt_tokens": len(prompt_tokens),
+            "completion_tokens": n_tokens,
+            "total_tokens": len(prompt_tokens) + n_tokens,
+        }
+        cached = 0
+        if config.prefix_cache:
+            cached = self.server.prefix_cache.lookup_and_store(prompt_tokens)
+            usage["prompt_cache_hit_tokens"] = cached
+            usage["prompt_cache_miss_tokens"] = len(prompt_tokens) - cached
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
+
+        time.sleep(config.latency)
+        if config.prefill_rate:
+            time.sleep((len(prompt_tokens) - cached) / config.prefill_rate)
+        if body.get("stream"):
+            self._stream(body, chat, words, config)
+        else:
+            if config.token_rate:
+                time.sleep(n_tokens / config.token_rate)
+            self._send_json(200, self._completion(body, chat, " ".join(words), usage))
+        self.server.stats.record(time.perf_counter() - started, prompt_tokens=len(prompt_tokens), cached_tokens=cached)
+
+    def _completion(self, body, chat, text, usage):
+        reply = {
+            "id": f"mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "usage": usage,
+        }
+        if not chat:
+            reply["choices"] = [{"index": 0, "text": text, "finish_reason": "stop"}]
+        elif body.get("functions"):
+            name = (body.get("function_call") or {}).get("name") or body["functions"][0]["name"]
+            reply["choices"] = [{
+                "index": 0,
+                "finish_reason": "function_call",
+                "message": {"role": "assistant", "content": None,
+                            "function_call": {"name": name, "arguments": _function_arguments(body)}},
+            }]
+        else:
+            reply["choices"] = [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}]
+        return reply
+
+    def _stream(self, body, chat, words, config):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        delay = 1.0 / config.token_rate if config.token_rate else 0.0
+        for i, word in enumerate(words):
+            token = word if i == 0 else " " + word
+            if chat:
+                choice = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+            else:
+                choice = {"index": 0, "text": token, "finish_reason": None}
+            chunk = {"id": "mock-stream", "object": "chat.completion.chunk" if chat else "text_completion",
+                     "created": int(time.time()), "model": body.get("model", "mock"), "choices": [choice]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockLLMServer:
+    """Runs the mock API on a background thread; usable as a context manager."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.httpd = ThreadingHTTPServer((host, port), MockLLMHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.httpd.stats = MockStats()
+        self.httpd.prefix_cache = PrefixCache(self.config.cache_block)
+        self._thread = None
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock DeepSeek/OpenAI server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=80.0, help="completion tokens per second")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--prefix-cache", action="store_true", help="emulate provider prefix caching")
+    parser.add_argument("--cache-block", type=int, default=64, help="prefix cache block size in tokens")
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="uncached prompt tokens per second")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.token_rate, args.completion_tokens,
+                        args.error_rate, args.error_status, prefix_cache=args.prefix_cache,
+                        cache_block=args.cache_block, prefill_rate=args.prefill_rate)
+    server = MockLLMServer(config, args.host, args.port)
+    print(f"Mock LLM server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
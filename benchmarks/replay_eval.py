@@ -0,0 +1,305 @@
+"""
+Offline replay evaluation over saved dataset entries.
+
+Replays the inputs of saved entries (dataset_entries.jsonl from app1.py,
+fine_tuning_dataset.jsonl from the inpatient notebook) through the current
+prompts in .streamlit/consult_prompts.py and a chosen backend, fanned out over
+a process pool, and reports throughput, tokens and latency together with cheap
+local quality metrics per entry:
+
+    sections    share of the expected note sections present
+    rouge_l     ROUGE-L F1 against the note saved with the entry
+    triggers    share of the order-set triggers named in the Assessment & Plan
+                input whose orders appear in the note (note_triggers.coverage)
+
+Backends: mock (the local mock LLM server, no network), deepseek and openai
+(keys from DEEPSEEK_API_KEY / OPENAI_API_KEY, endpoints from *_API_BASE) and
+local (the Hugging Face model, loaded once per worker from the model store).
+
+    python benchmarks/replay_eval.py dataset_entries.jsonl --backend mock --workers 8
+    python benchmarks/replay_eval.py dataset_entries.jsonl --backend deepseek --soap --out new.jsonl \\
+        --consult-system new_prompt.txt --baseline old.jsonl
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, ".streamlit")
+sys.path.insert(0, APP_DIR)
+
+import consult_prompts  # noqa: E402
+import lab_trends  # noqa: E402
+import model_router  # noqa: E402
+import note_metrics  # noqa: E402
+import note_sanitizer  # noqa: E402
+import note_triggers  # noqa: E402
+import prompt_compress  # noqa: E402
+
+EXPECTED_SECTIONS = {
+    "consult": ["Reason for Consultation", "History of Present Illness (HPI)", "Assessment and Plan"],
+    "soap": ["Subjective", "Assessment and Plan"],
+}
+
+BACKENDS = {
+    # name: (style, default model, endpoint env var, default endpoint, key env var)
+    "deepseek": ("chat", "deepseek-chat", "DEEPSEEK_API_BASE", "https://api.deepseek.com/beta", "DEEPSEEK_API_KEY"),
+    "openai": ("chat", "gpt-4-0613", "OPENAI_API_BASE", "https://api.openai.com/v1", "OPENAI_API_KEY"),
+    "mock": ("chat", "deepseek-chat", None, None, None),
+    "local": ("local", "gpt2", None, None, None),
+}
+
+_TOKEN = re.compile(r"\w+")
+
+
+# ---- quality metrics ----
+
+def rouge_l(candidate, reference):
+    """ROUGE-L F1 over lowercased word tokens."""
+    a, b = _TOKEN.findall(candidate.lower()), _TOKEN.findall(reference.lower())
+    if not a or not b:
+        return None
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(a), lcs / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def section_completeness(note, kind):
+    found = set()
+    for line in note.splitlines():
+        section, _ = note_sanitizer.section_of(note_sanitizer.strip_markdown(line))
+        if section:
+            found.add(section)
+    expected = EXPECTED_SECTIONS[kind]
+    return sum(s in found for s in expected) / len(expected)
+
+
+def trigger_coverage(source, note):
+    covered, requested = note_triggers.coverage(source, note)
+    return covered / requested if requested else None
+
+
+# ---- workers ----
+
+_ROUTER = None
+_SYSTEMS = {}
+_PARAMS = {}
+
+
+def _local_generate_factory(model_name):
+    import model_store
+    from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+    if model_store.has_model(model_name):
+        model, tokenizer = model_store.load_model(model_name)  # weights shared by every worker through mmap
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+    generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+    def generate(prompt, max_tokens):
+        output = generator(prompt, max_new_tokens=max_tokens, return_full_text=False, temperature=0.7)
+        return note_sanitizer.sanitize(output[0]["generated_text"], prompt)
+
+    return generate
+
+
+def _init_worker(backend, model, api_base, api_key, systems, params):
+    global _ROUTER
+    style = BACKENDS[backend][0]
+    if style == "local":
+        target = model_router.Backend(backend, "local", generate=_local_generate_factory(model))
+    else:
+        target = model_router.Backend(backend, style, api_base, api_key)
+    policy = {task: {"candidates": [[backend, model]], "latency_budget_s": None} for task in EXPECTED_SECTIONS}
+    _ROUTER = model_router.ModelRouter([target], policy)
+    _SYSTEMS.update(systems)
+    _PARAMS.update(params)
+
+
+def _stage(kind, prompt, max_tokens):
+    timer = note_metrics.StageTimer("replay_eval", kind)
+    timer.prompt_built()
+    messages = [{"role": "system", "content": _SYSTEMS[kind]}, {"role": "user", "content": prompt}]
+    try:
+        result = _ROUTER.complete(kind, messages, "replay_eval", timer=timer, max_tokens=max_tokens,
+                                  temperature=_PARAMS["temperature"])
+    except model_router.RoutingError as e:
+        return "", {"latency_s": timer.as_record()["latency_s"], "error": str(e)}
+    record = timer.as_record()
+    if record["prompt_tokens"] is None:  # the local backend reports no usage
+        record["prompt_tokens"] = prompt_compress.count_tokens(prompt)[0]
+        record["completion_tokens"] = prompt_compress.count_tokens(result["text"])[0]
+    return result["text"], {k: record[k] for k in ("latency_s", "prompt_tokens", "completion_tokens", "error")}
+
+
+def replay_entry(index, entry):
+    """Consult note (and SOAP note when requested) for one saved entry, with its metrics."""
+    rows = []
+    prompt = consult_prompts.consult_prompt(
+        entry.get("reason_for_consultation", ""), entry.get("presenting_symptoms", ""),
+        entry.get("clinical_history_context", ""), lab_trends.compact_labs(entry.get("labs", "")),
+        entry.get("assessment_plan_input", ""))
+    note, stats = _stage("consult", prompt, 1200)
+    rows.append(_row(index, "consult", note, entry.get("consultation_note", ""), entry, stats))
+    if _PARAMS["soap"] and note and entry.get("case_update"):
+        soap, stats = _stage("soap", consult_prompts.soap_prompt(note, entry["case_update"]), 800)
+        rows.append(_row(index, "soap", soap, entry.get("soap_note", ""), entry, stats))
+    return rows
+
+
+def _row(index, kind, note, saved, entry, stats):
+    return {
+        "entry": index, "stage": kind, **stats,
+        "sections": section_completeness(note, kind) if note else 0.0,
+        "rouge_l": rouge_l(note, saved) if note else None,
+        "triggers": trigger_coverage(entry.get("assessment_plan_input", ""), note),
+        "note": note,
+    }
+
+
+# ---- driver ----
+
+def load_entries(paths, limit=None):
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    return entries[:limit] if limit else entries
+
+
+def summarize(rows, wall_s=None):
+    summary = {}
+    for kind in EXPECTED_SECTIONS:
+        stage = [r for r in rows if r["stage"] == kind]
+        if not stage:
+            continue
+        ok = [r for r in stage if not r["error"]]
+
+        def mean(field):
+            values = [r[field] for r in ok if r.get(field) is not None]
+            return statistics.mean(values) if values else None
+
+        latencies = sorted(r["latency_s"] for r in ok)
+        summary[kind] = {
+            "n": len(stage), "errors": len(stage) - len(ok),
+            "latency_p50_s": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "prompt_tokens": mean("prompt_tokens"), "completion_tokens": mean("completion_tokens"),
+            "sections": mean("sections"), "rouge_l": mean("rouge_l"), "triggers": mean("triggers"),
+        }
+    if wall_s:
+        entries = len({r["entry"] for r in rows})
+        completion = sum(r.get("completion_tokens") or 0 for r in rows)
+        summary["throughput"] = {"entries_per_s": entries / wall_s, "completion_tokens_per_s": completion / wall_s,
+                                 "wall_s": wall_s}
+    return summary
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def print_report(summary, baseline=None):
+    for kind, stats in summary.items():
+        if kind == "throughput":
+            continue
+        print(f"\n{kind}")
+        for field, value in stats.items():
+            line = f"  {field:18} {_fmt(value):>10}"
+            base = (baseline or {}).get(kind, {}).get(field)
+            if isinstance(value, (int, float)) and isinstance(base, (int, float)):
+                line += f"   baseline {_fmt(base):>10}   delta {value - base:+.3f}"
+            print(line)
+    if "throughput" in summary:
+        t = summary["throughput"]
+        print(f"\n{t['entries_per_s']:.2f} entries/s, {t['completion_tokens_per_s']:.1f} completion tokens/s "
+              f"over {t['wall_s']:.1f}s")
+
+
+def run(entries, workers, init_args):
+    rows = []
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args) as pool:
+        futures = [pool.submit(replay_entry, i, entry) for i, entry in enumerate(entries)]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            rows.extend(future.result())
+            if done % 50 == 0:
+                print(f"{done}/{len(entries)} entries", file=sys.stderr)
+    rows.sort(key=lambda r: (r["entry"], r["stage"]))
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("datasets", nargs="+", help="JSONL files of saved entries")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mock")
+    parser.add_argument("--model", help="model name (default depends on the backend)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="worker processes")
+    parser.add_argument("--limit", type=int, help="replay only the first N entries")
+    parser.add_argument("--soap", action="store_true", help="also replay the SOAP note from each generated consult")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--consult-system", help="file with a candidate consult system prompt")
+    parser.add_argument("--soap-system", help="file with a candidate SOAP system prompt")
+    parser.add_argument("--out", help="write one JSON row per entry and stage")
+    parser.add_argument("--baseline", help="rows from an earlier --out run to compare against")
+    parser.add_argument("--mock-latency", type=float, default=0.2, help="mock time to first token (s)")
+    args = parser.parse_args()
+
+    entries = load_entries(args.datasets, args.limit)
+    style, model, base_env, base_default, key_env = BACKENDS[args.backend]
+    systems = {"consult": consult_prompts.CONSULT_SYSTEM, "soap": consult_prompts.SOAP_SYSTEM}
+    for kind, path in (("consult", args.consult_system), ("soap", args.soap_system)):
+        if path:
+            with open(path) as f:
+                systems[kind] = f.read().strip()
+    params = {"temperature": args.temperature, "soap": args.soap}
+
+    server = None
+    if args.backend == "mock":
+        from mock_llm_server import MockConfig, MockLLMServer
+
+        server = MockLLMServer(MockConfig(latency=args.mock_latency, token_rate=0, seed=0))
+        server.start()
+        api_base, api_key = server.url, "mock-key"
+    else:
+        api_base = os.environ.get(base_env, base_default) if base_env else None
+        api_key = os.environ.get(key_env) if key_env else None
+        if key_env and not api_key:
+            parser.error(f"{key_env} is not set")
+    try:
+        rows, wall_s = run(entries, args.workers, (args.backend, args.model or model, api_base, api_key, systems, params))
+    finally:
+        if server:
+            server.stop()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = summarize([json.loads(line) for line in f if line.strip()])
+    print(f"{len(entries)} entries via {args.backend}/{args.model or model}, {args.workers} workers")
+    print_report(summarize(rows, wall_s), baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app modules are flat scripts in .streamlit/ and import each other by name
+sys.path.insert(0, os.path.join(REPO_ROOT, ".streamlit"))
@@ -0,0 +1,63 @@
+import datetime
+
+import pytest
+
+import census
+import note_history
+
+NOW = datetime.datetime(2026, 3, 10, 9, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    census._RECORDS.clear()
+    note_history._CACHE.clear()
+    return note_history.LocalStore(str(tmp_path))
+
+
+def _record(record_id, reason="AKI", **fields):
+    return {"id": record_id, "reason": reason, "note_type": "Consult", **fields}
+
+
+def test_census_lists_window_and_newest_entry(store):
+    census.save_record(store, _record("AB", soap_note="day 1"), NOW - datetime.timedelta(hours=30))
+    census.save_record(store, _record("AB", soap_note="day 2"), NOW - datetime.timedelta(hours=2))
+    census.save_record(store, _record("CD"), NOW - datetime.timedelta(days=4))
+    entries = census.census(store, hours=48, now=NOW)
+    assert set(entries) == {"AB"}
+    assert [r["soap_note"] for r in census.preload(store, hours=48, now=NOW)] == ["day 2"]
+
+
+def test_find_latest_outside_the_window(store):
+    census.save_record(store, _record("AB", soap_note="old"), datetime.datetime.now() - datetime.timedelta(days=5))
+    census.save_record(store, _record("AB", soap_note="newer"), datetime.datetime.now() - datetime.timedelta(days=3))
+    assert census.find_latest(store, "AB")["soap_note"] == "newer"
+    assert census.find_latest(store, "ZZ") is None
+
+
+def test_latest_pointer_does_not_go_back_in_time(store):
+    census.save_record(store, _record("AB", soap_note="newer"), datetime.datetime.now() - datetime.timedelta(days=3))
+    census.save_record(store, _record("AB", soap_note="old"), datetime.datetime.now() - datetime.timedelta(days=9))
+    assert census.find_latest(store, "AB")["soap_note"] == "newer"
+
+
+def test_find_latest_without_pointer_lists_partitions(store):
+    when = datetime.datetime.now() - datetime.timedelta(days=3)
+    store.put(census.record_key(census.SERVICE, "AB", when), b'{"id": "AB", "soap_note": "partitioned"}')
+    store.put(census.record_key(census.SERVICE, "AB_2", when), b'{"id": "AB_2"}')
+    assert census.find_latest(store, "AB")["soap_note"] == "partitioned"
+
+
+def test_history_saves_are_found_through_the_pointer(store):
+    record = _record("EF", soap_note="from history")
+    entry = note_history.save(store, record, saved_at="2026-01-02T08:00:00")
+    census.record_saved(store, record, entry["saved_at"])
+    assert census.find_latest(store, "EF")["soap_note"] == "from history"
+
+
+def test_migrate_moves_flat_records_and_is_repeatable(store):
+    store.put("patients/AB_20260102T080000.json", b'{"id": "AB", "soap_note": "flat"}')
+    assert census.migrate(store, delete=True, log=lambda line: None) == (1, 0)
+    assert census.migrate(store, log=lambda line: None) == (0, 0)
+    assert census.find_latest(store, "AB")["soap_note"] == "flat"
+    assert census.read_manifest(store, census.SERVICE, "2026-01-02")["AB"]["saved_at"] == "2026-01-02T08:00:00"
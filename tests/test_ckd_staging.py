@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import ckd_staging
+
+
+@pytest.mark.parametrize("uacr, category", [
+    (0, "A1"), (29.9, "A1"), (30, "A2"), (150, "A2"), (300, "A2"), (300.1, "A3"), (1200, "A3"),
+])
+def test_a_category_boundaries(uacr, category):
+    assert ckd_staging.a_category(uacr) == category
+
+
+def test_a_category_missing_uacr():
+    assert list(ckd_staging.a_category([np.nan, 30, 301])) == ["", "A2", "A3"]
+
+
+@pytest.mark.parametrize("egfr, category, stage", [
+    (14.9, "G5", "5"), (15, "G4", "4"), (30, "G3b", "3"), (45, "G3a", "3"), (60, "G2", "2"), (90, "G1", "1"),
+])
+def test_g_category_boundaries(egfr, category, stage):
+    assert ckd_staging.g_category(egfr) == category
+    assert ckd_staging.clinic_stage(egfr) == stage
+
+
+def test_egfr_cr_reference_values():
+    # CKD-EPI 2021: 50-year-old, creatinine 1.0 mg/dL
+    assert ckd_staging.egfr_cr(1.0, 50, "M") == pytest.approx(91.7, abs=0.1)
+    assert ckd_staging.egfr_cr(1.0, 50, "F") == pytest.approx(68.6, abs=0.1)
+
+
+def test_classify_trend():
+    assert list(ckd_staging.classify_trend([60, 60, 60], [40, 58, 80])) == ["Worsening", "Stable", "Improving"]
+    assert ckd_staging.classify_trend(60, 54, years=1) == "Worsening"
+
+
+def test_from_labs():
+    derived = ckd_staging.from_labs("Cr 1.8 -> 2.1 over 6 months, UACR 300", 68, "M")
+    assert derived["a_category"] == "A2"
+    assert derived["ckd_stage"] == "3"
+    assert derived["trend"] == "Worsening"
+    assert ckd_staging.from_labs("Na 138", 68, "M") is None
+
+
+@pytest.mark.parametrize("cystatin_c", [2.6, 1.0])
+def test_cystatin_c_refines_the_stage_but_not_the_trend(cystatin_c):
+    labs = f"Cr 1.8 -> 1.8 over 6 months, Cystatin C {cystatin_c}"
+    derived = ckd_staging.from_labs(labs, 65, "M")
+    assert derived["trend"] == "Stable"
+    assert derived["source"] == "CKD-EPI 2021 cr-cys"
+    assert derived["egfr"] == pytest.approx(float(ckd_staging.egfr_cr_cys(1.8, cystatin_c, 65, "M")))
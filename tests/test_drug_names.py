@@ -0,0 +1,49 @@
+import pytest
+
+import drug_names
+import formulary_index
+
+
+@pytest.mark.parametrize("typed, other_drug", [
+    ("prednisolone", "prednisone"),
+    ("hydroxyzine", "hydralazine"),
+    ("nicardipine", "nifedipine"),
+    ("nisoldipine", "nifedipine"),
+    ("terazosin", "prazosin"),
+])
+def test_near_miss_drug_is_not_swapped(typed, other_drug):
+    match = drug_names.normalize(typed)
+    assert match["ingredient"] != other_drug
+    assert match["ingredient"] is None
+
+
+@pytest.mark.parametrize("typed, ingredient", [
+    ("lisinoprl", "lisinopril"),
+    ("amlodipin 5 mg", "amlodipine"),
+    ("Eliquis 5 mg BID", "apixaban"),
+    ("metformin hcl er 500 mg", "metformin"),
+])
+def test_exact_and_single_typo_matches(typed, ingredient):
+    assert drug_names.normalize(typed)["ingredient"] == ingredient
+
+
+def test_short_names_need_an_exact_match():
+    assert drug_names.normalize("asx")["ingredient"] is None
+    assert drug_names.max_distance("lasix") == 0
+
+
+def test_combination_with_spaces_matches_hyphenated_form():
+    assert drug_names.normalize("losartan hctz")["ingredient"] == drug_names.normalize("losartan-hctz")["ingredient"]
+    assert drug_names.normalize("losartan hctz")["ingredient"] == "losartan / hydrochlorothiazide"
+    assert drug_names.normalize("lisinopril-hctz")["ingredient"] == "lisinopril / hydrochlorothiazide"
+
+
+def test_exact_lookup_skips_typo_correction():
+    assert drug_names.normalize("lisinoprl", fuzzy=False)["ingredient"] is None
+    assert drug_names.canonical("Lisinopril 10mg", fuzzy=False) == "lisinopril"
+
+
+def test_formulary_ingestion_keys_are_exact():
+    assert formulary_index._drug_key("prednisolone") == "prednisolone"
+    assert formulary_index._drug_key("lisinoprl") == "lisinoprl"
+    assert formulary_index._drug_key("Zestril 10 mg") == drug_names.canonical("lisinopril")
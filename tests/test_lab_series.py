@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+import lab_series
+
+DAY = lab_series.DAY
+
+
+def test_append_grows_and_keeps_aggregates():
+    series = lab_series.LabSeries("Cr", "mg/dL", capacity=2)
+    values = [1.0, 1.4, 2.0, 2.6, 3.0]
+    for day, value in enumerate(values):
+        assert series.append(day * DAY, value)
+    assert series.n == 5 and len(series.t) >= 5
+    assert (series.min, series.max) == (1.0, 3.0)
+    assert series.slope_per_day() == pytest.approx(np.polyfit(np.arange(5), values, 1)[0])
+    times, latest = series.latest(3)
+    assert list(latest) == [2.0, 2.6, 3.0]
+    assert list(times) == [2 * DAY, 3 * DAY, 4 * DAY]
+
+
+def test_older_values_are_ignored():
+    series = lab_series.LabSeries("K", "mEq/L")
+    assert series.append(DAY, 5.0)
+    assert not series.append(DAY, 5.5)
+    assert not series.append(0, 4.0)
+    assert series.n == 1 and series.slope_per_day() is None
+
+
+def test_add_text_spreads_series_over_span():
+    store = lab_series.LabStore()
+    assert store.add_text("Cr 1.2 -> 2.4 -> 3.1 over 2 days, K 5.2", timestamp=10 * DAY) == 4
+    cr = store.series["Cr"]
+    assert list(cr.t[:cr.n]) == [8 * DAY, 9 * DAY, 10 * DAY]
+    assert store.series["K"].n == 1
+
+
+def test_add_text_skips_resubmission_and_stored_leading_value():
+    store = lab_series.LabStore()
+    store.add_text("Cr 3.1", timestamp=DAY)
+    assert store.add_text("Cr 3.1", timestamp=2 * DAY) == 0
+    assert store.add_text("Cr 3.1 -> 2.6", timestamp=2 * DAY) == 1
+    assert list(store.series["Cr"].v[:2]) == [3.1, 2.6]
+
+
+def test_round_trip_through_json():
+    store = lab_series.LabStore()
+    for day in range(20):
+        store.add("Cr", 1 + day / 10, timestamp=day * DAY, unit="mg/dL")
+    restored = lab_series.LabStore.from_dict(json.loads(json.dumps(store.to_dict())))
+    assert restored.trends() == store.trends()
+    assert restored.add("Cr", 5.0, timestamp=20 * DAY)
+    assert restored.series["Cr"].trend()["max"] == 5.0
+
+
+def test_summary_line():
+    store = lab_series.LabStore()
+    for day, value in enumerate([1.1, 3.4, 3.1, 2.6, 2.2]):
+        store.add("Cr", value, timestamp=day * DAY, unit="mg/dL")
+    line = store.summary()
+    assert line.startswith("Cr (5 values since ")
+    assert "3.1→2.6→2.2 mg/dL, peak 3.4, low 1.1" in line
@@ -0,0 +1,90 @@
+import pytest
+
+import lab_trends
+
+
+def _trend(text, analyte="Cr"):
+    trends, _ = lab_trends.summarize(text)
+    return next(t for t in trends if t["analyte"] == analyte)
+
+
+def test_parse_labs_series_and_span():
+    series, rest = lab_trends.parse_labs("Cr 1.2→2.4→3.1 over 3 days, Na 138, K 5.2")
+    assert [s["analyte"] for s in series] == ["Cr", "Na", "K"]
+    assert list(series[0]["values"]) == [1.2, 2.4, 3.1]
+    assert series[0]["span_hours"] == 72
+    assert rest == ""
+
+
+@pytest.mark.parametrize("text", ["Cr 4.0 -> 4.1", "Cr 4.2 -> 4.3 over 2 days"])
+def test_high_stable_creatinine_is_not_aki(text):
+    assert _trend(text).get("aki_stage", 0) == 0
+
+
+def test_no_stage_without_a_span():
+    assert "aki_stage" not in _trend("Cr 1.0 -> 3.5")
+
+
+@pytest.mark.parametrize("text, stage", [
+    ("Cr 1.1 -> 1.4 over 24h", 1),
+    ("Cr 1.0 -> 1.6 over 5 days", 1),
+    ("Cr 1.2→2.4→3.1 over 3 days", 2),
+    ("Cr 1.0 -> 3.2 over 4 days", 3),
+    ("Cr 3.0 -> 4.1 over 36 h", 3),
+    ("Cr 1.0 -> 1.2 over 24h", 0),
+    ("Cr 1.0 -> 1.3 over 72h", 0),
+])
+def test_kdigo_stages(text, stage):
+    assert _trend(text)["aki_stage"] == stage
+
+
+@pytest.mark.parametrize("text", ["Cr 2.0→1.0→1.1 over 3 days", "Cr 3.1→2.4→1.2 over 2 days", "Cr 4.2 -> 3.0 over 24h"])
+def test_falling_creatinine_is_not_aki(text):
+    assert _trend(text)["aki_stage"] == 0
+
+
+def test_recovering_creatinine_is_staged_by_its_rise():
+    t = _trend("Cr 1.0→3.2→1.4 over 3 days")
+    assert t["aki_stage"] == 3
+    assert t["aki_ratio"] == pytest.approx(3.2)
+
+
+def test_rise_is_measured_from_the_lowest_earlier_value():
+    # 2.0 is before the nadir, so it is not the baseline for the rise to 1.6
+    t = _trend("Cr 2.0→0.8→1.6 over 3 days")
+    assert t["aki_stage"] == 2
+    assert t["aki_ratio"] == pytest.approx(2.0)
+
+
+def test_slow_rise_is_not_staged():
+    assert "aki_stage" not in _trend("Cr 1.5 -> 3.2 over 6 months")
+
+
+def test_kdigo_requires_established_aki():
+    assert lab_trends.kdigo_aki_stage(4.0, 4.1, 24)[0] == 0
+    assert lab_trends.kdigo_aki_stage(3.8, 4.1, 24)[0] == 3
+
+
+def test_compact_labs_replaces_parsed_text():
+    compact = lab_trends.compact_labs("Cr 1.2→2.4→3.1 over 3 days, Na 138, K 5.2")
+    assert compact.startswith("Cr 1.2→2.4→3.1 mg/dL over 3 d: +1.9 (+158%)")
+    assert "KDIGO AKI stage 2" in compact
+    assert compact.endswith("; Na 138 mEq/L; K 5.2 mEq/L")
+    assert "over 3 days" not in compact
+
+
+def test_compact_labs_keeps_only_the_unparsed_text():
+    compact = lab_trends.compact_labs("Cr 1.0 -> 1.3 over 24h, renal US 3.5 cm cyst, K 5.25")
+    assert compact.endswith("; K 5.25 mEq/L; renal US 3.5 cm cyst")
+    assert compact.count("1.3") == 2  # the value and the ratio, not the raw text again
+
+
+def test_compact_labs_without_trends_is_unchanged():
+    assert lab_trends.compact_labs("Na 138, K 5.2") == "Na 138, K 5.2"
+    assert lab_trends.compact_labs("renal US pending") == "renal US pending"
+
+
+def test_sodium_correction_limit():
+    t = _trend("Na 118 -> 130 in 24h", "Na")
+    assert t["na_rate_24h"] == pytest.approx(12)
+    assert "exceeds" in lab_trends.describe(t)
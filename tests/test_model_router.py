@@ -0,0 +1,53 @@
+import pytest
+
+import generation_pool
+import model_router
+
+
+def _router(generate):
+    router = model_router.ModelRouter([], {"note": {"candidates": [["local", "gpt2"]], "latency_budget_s": 10}})
+    router.register_local(generate)
+    return router
+
+
+def test_unconsumed_stream_holds_no_slot():
+    calls = []
+    router = _router(lambda prompt, max_tokens: calls.append(prompt) or "note")
+    active = generation_pool.get_pool().active
+    pieces, route = router.stream("note", [{"role": "user", "content": "AKI"}], "test")
+    del pieces
+    assert generation_pool.get_pool().active == active
+    assert calls == [] and route["backend"] is None
+
+
+def test_stream_releases_slot_when_done_or_closed():
+    router = _router(lambda prompt, max_tokens: "note")
+    active = generation_pool.get_pool().active
+    pieces, route = router.stream("note", [{"role": "user", "content": "AKI"}], "test")
+    assert next(pieces) == "note"
+    assert generation_pool.get_pool().active == active + 1
+    pieces.close()
+    assert generation_pool.get_pool().active == active
+
+    pieces, route = router.stream("note", [{"role": "user", "content": "AKI"}], "test")
+    assert list(pieces) == ["note"]
+    assert (route["backend"], route["model"]) == ("local", "gpt2")
+    assert generation_pool.get_pool().active == active
+
+
+def test_stream_raises_when_every_candidate_fails():
+    def fail(prompt, max_tokens):
+        raise ConnectionError("down")
+
+    router = _router(fail)
+    active = generation_pool.get_pool().active
+    pieces, route = router.stream("note", [{"role": "user", "content": "AKI"}], "test")
+    with pytest.raises(model_router.RoutingError):
+        list(pieces)
+    assert route["attempts"] == ["local/gpt2: down"]
+    assert generation_pool.get_pool().active == active
+
+
+def test_extraction_policy_uses_live_models():
+    models = [model for _, model in model_router.DEFAULT_POLICY["extraction"]["candidates"]]
+    assert "gpt-3.5-turbo-0613" not in models
@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+
+import note_history
+
+
+@pytest.fixture
+def store(tmp_path):
+    note_history._CACHE.clear()
+    return note_history.LocalStore(str(tmp_path))
+
+
+def _records(days, saves_per_day=2):
+    lines = [f"Problem {i}: continue current management, reassess in 24 hours." for i in range(20)]
+    start = datetime.datetime(2026, 1, 1, 8)
+    for day in range(days):
+        for save in range(saves_per_day):
+            lines[(day * saves_per_day + save) % len(lines)] = f"Problem edited on day {day + 1}, save {save + 1}."
+            saved_at = (start + datetime.timedelta(days=day, hours=4 * save)).isoformat(timespec="seconds")
+            yield saved_at, {"id": "AB", "note_type": "Progress", "soap_note": "\n".join(lines),
+                             "lab_series": {"Cr": [day, 1 + day / 10]}, "last_updated": saved_at}
+
+
+@pytest.mark.parametrize("old, new", [
+    ("a\nb\nc", "a\nB\nc\nd"),
+    ("", "x\ny"),
+    ("x\ny", ""),
+    ("same\n", "same\n"),
+])
+def test_line_delta_round_trip(old, new):
+    assert note_history.apply_line_delta(old, note_history.line_delta(old, new)) == new
+
+
+def test_record_delta_round_trip():
+    old = {"id": "AB", "soap_note": "a\nb", "labs": {"Cr": [1.2]}, "reason": "AKI", "gone": 1}
+    new = {"id": "AB", "soap_note": "a\nc", "labs": {"Cr": [1.2, 2.4]}, "reason": None}
+    assert note_history.apply_record_delta(old, note_history.record_delta(old, new)) == new
+
+
+def test_every_version_reconstructs(store):
+    saves = list(_records(10))
+    for saved_at, record in saves:
+        assert note_history.save(store, record, snapshot_every=4, saved_at=saved_at) is not None
+    entries = note_history.versions(store, "AB")
+    assert len(entries) == len(saves)
+    assert entries[0]["kind"] == "snap" and any(e["kind"] == "delta" for e in entries)
+    for entry, (_, record) in zip(entries, saves):
+        note_history._CACHE.clear()
+        assert note_history.load(store, "AB", entry["v"]) == record
+    assert note_history.load(store, "AB") == saves[-1][1]
+
+
+def test_unchanged_record_is_not_saved(store):
+    saved_at, record = next(_records(1))
+    assert note_history.save(store, record, saved_at=saved_at) is not None
+    assert note_history.save(store, dict(record), saved_at=saved_at) is None
+    assert len(note_history.versions(store, "AB")) == 1
+
+
+def test_compact_keeps_recent_and_last_per_day(store):
+    saves = list(_records(10, saves_per_day=3))
+    for saved_at, record in saves:
+        note_history.save(store, record, saved_at=saved_at)
+    before = {e["v"]: r for e, (_, r) in zip(note_history.versions(store, "AB"), saves)}
+    n_before, n_after, _, _ = note_history.compact(store, "AB", keep_days=3, today=datetime.date(2026, 1, 10))
+    kept = note_history.versions(store, "AB")
+    # Jan 1-6: last save of each day; Jan 7-10: every save
+    assert (n_before, n_after) == (30, 6 + 4 * 3)
+    assert kept[-1]["v"] == 30
+    note_history._CACHE.clear()
+    for entry in kept:
+        assert note_history.load(store, "AB", entry["v"]) == before[entry["v"]]
+    assert {k for k in store.list(note_history.PREFIX) if ".g0." in k} == set()
+
+
+def test_missing_version_and_patient(store):
+    assert note_history.load(store, "ZZ") is None
+    saved_at, record = next(_records(1))
+    note_history.save(store, record, saved_at=saved_at)
+    with pytest.raises(KeyError):
+        note_history.load(store, "AB", 99)
+
+
+def test_import_legacy_orders_by_time(store):
+    saves = list(_records(2))
+    assert note_history.import_legacy(store, list(reversed(saves))) == len(saves)
+    assert [e["saved_at"] for e in note_history.versions(store, "AB")] == [s for s, _ in saves]
+    assert note_history.patients(store) == ["AB"]
+    assert note_history._legacy_time("patients/AB_20260102T080000.json") == "2026-01-02T08:00:00"
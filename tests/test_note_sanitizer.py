@@ -0,0 +1,58 @@
+import note_sanitizer
+
+REPEATED_LABS_HEADER = """History of Present Illness (HPI): 64M with CKD 3b admitted with weakness.
+Labs: K 6.4, HCO3 14, Cr 2.9.
+
+Assessment and Plan:
+AKI on CKD 3b: likely prerenal, IV fluids, hold lisinopril.
+Labs: repeat BMP in AM
+Hyperkalemia: lokelma 10 g TID, low potassium diet, cardiac monitoring.
+Metabolic acidosis: sodium bicarbonate 650 mg TID, recheck HCO3 in AM.
+"""
+
+
+def _stream(text, size=7, prompt=""):
+    sanitizer = note_sanitizer.NoteSanitizer(prompt)
+    released = "".join(sanitizer.feed(text[i:i + size]) for i in range(0, len(text), size)) + sanitizer.close()
+    assert released == sanitizer.text
+    return sanitizer.result
+
+
+def test_repeated_header_inside_plan_keeps_following_lines():
+    note = _stream(REPEATED_LABS_HEADER)
+    assert "Labs: repeat BMP in AM" in note
+    assert "Hyperkalemia: lokelma 10 g TID" in note
+    assert "Metabolic acidosis: sodium bicarbonate 650 mg TID" in note
+    assert note == note_sanitizer.sanitize(REPEATED_LABS_HEADER)
+
+
+def test_exact_restart_of_a_section_is_dropped():
+    section = "Assessment and Plan:\nAKI: IV fluids, hold lisinopril.\nHyperkalemia: lokelma 10 g TID.\n"
+    note = _stream("HPI: 64M with AKI.\n\n" + section + "\n" + section)
+    assert note.count("Hyperkalemia: lokelma") == 1
+    assert note.count("Assessment and Plan:") == 1
+
+
+def test_partial_restart_is_kept():
+    note = _stream("Assessment and Plan:\nAKI: IV fluids.\nHyperkalemia: lokelma.\n\n"
+                   "Assessment and Plan:\nAKI: IV fluids.\nAnemia: iron studies.\n")
+    assert "Anemia: iron studies." in note
+    assert note.count("Hyperkalemia: lokelma.") == 1
+
+
+def test_headers_markdown_and_blank_runs():
+    note = note_sanitizer.sanitize("## **A&P**\n\n\n* AKI: fluids  \n* AKI: fluids  \n")
+    assert note == "Assessment and Plan:\n\n- AKI: fluids"
+
+
+def test_prompt_echo_is_removed():
+    prompt = "Write a note for: AKI"
+    assert _stream(prompt + "\nReason for Consult: AKI", prompt=prompt) == "Reason for Consultation: AKI"
+
+
+def test_consume_reports_raw_and_first_piece():
+    calls = []
+    raw, note = note_sanitizer.consume(iter(["**HPI:** 64M", " with AKI\n"]), on_first_piece=lambda: calls.append(1))
+    assert raw == "**HPI:** 64M with AKI\n"
+    assert note == "History of Present Illness (HPI): 64M with AKI"
+    assert calls == [1]
@@ -0,0 +1,57 @@
+import pytest
+
+import note_segmenter
+
+RUN_ON = ("68M here for CKD f/u. Reports more ankle edema. Cr 1.8 -> 2.1 over 6 mo, K 5.2. "
+          "On lisinopril 20 mg daily, losartan hctz. Plan: continue lisinopril, recheck BMP in 3 mo.")
+
+
+def test_run_on_note():
+    segments = note_segmenter.segment(RUN_ON)
+    assert segments["reason"] == "68M here for CKD f/u."
+    assert segments["history"] == "Reports more ankle edema."
+    assert segments["labs"] == "Cr 1.8 -> 2.1 over 6 mo, K 5.2."
+    assert segments["meds"] == "On lisinopril 20 mg daily, losartan hctz."
+    assert "recheck BMP in 3 mo" in segments["assessment_plan"]
+
+
+def test_headers_apply_until_the_next_header():
+    text = ("CC: hyponatremia\nHPI: Na 128 last week. Drinks 4 L of water a day.\n"
+            "Meds:\nsertraline 50 mg daily\nhctz 25 mg daily\n"
+            "A/P:\n1. Hyponatremia - fluid restrict 1.5 L\n2. HTN - stop hctz")
+    segments = note_segmenter.segment(text)
+    assert segments["reason"] == "hyponatremia"
+    assert segments["history"] == "Na 128 last week. Drinks 4 L of water a day."
+    assert segments["meds"] == "sertraline 50 mg daily; hctz 25 mg daily"
+    assert segments["assessment_plan"] == "1. Hyponatremia - fluid restrict 1.5 L\n2. HTN - stop hctz"
+
+
+@pytest.mark.parametrize("sentence, section", [
+    ("Presents for evaluation of proteinuria.", "reason"),
+    ("CKD 3b - continue lisinopril.", "assessment_plan"),
+    ("Start amlodipine 5 mg daily.", "assessment_plan"),
+    ("Na 128, K 3.1, HCO3 19.", "labs"),
+    ("Taking furosemide 40 mg bid and metformin 500 mg bid.", "meds"),
+    ("Had a fall at home last month, no LOC.", "history"),
+    ("Her son is a pharmacist and helps with her pills.", "history"),
+])
+def test_classify(sentence, section):
+    assert note_segmenter.classify(sentence) == section
+
+
+def test_prose_word_is_not_a_header():
+    segments = note_segmenter.segment("Wife says the plan from last visit was hard to follow.\nPlan\nRTC 3 months")
+    assert segments["history"] == "Wife says the plan from last visit was hard to follow."
+    assert segments["assessment_plan"] == "RTC 3 months"
+
+
+def test_empty_note():
+    assert note_segmenter.segment("") == {s: "" for s in note_segmenter.SECTIONS}
+
+
+def test_structured_prompt_defaults_reason():
+    segments = note_segmenter.segment("Cr 2.4. Recheck BMP in 1 week.")
+    prompt = note_segmenter.structured_prompt(segments, "CKD", "Follow-Up", "March 10, 2026")
+    assert "Reason for Visit: CKD Follow-Up" in prompt
+    assert "Lab Data: Cr 2.4." in prompt
+    assert "Assessment & Plan:\nRecheck BMP in 1 week" in prompt
@@ -0,0 +1,39 @@
+import asyncio
+import io
+
+import openai
+
+import generation_pool
+import partd_batch
+
+CREDENTIALS = {"api_base": "http://mock", "api_key": "mock-key"}
+
+
+class _Choice:
+    def __init__(self, content):
+        self.message = type("Message", (), {"content": content})()
+
+
+def _rows(n):
+    return [{"patient": f"p{i}", "zip": "10001", "medications": ["lisinopril"]} for i in range(n)]
+
+
+def test_summaries_take_a_slot_and_carry_their_credentials(monkeypatch):
+    pool = generation_pool.GenerationPool(workers=2, max_queue=64, session_queue=8)
+    monkeypatch.setattr(generation_pool, "_POOL", pool)
+    calls = []
+
+    async def acreate(**kwargs):
+        calls.append((pool.active, kwargs["api_base"], kwargs["api_key"]))
+        await asyncio.sleep(0.01)
+        return type("Response", (), {"choices": [_Choice("summary")]})()
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    out = io.StringIO()
+    lookup = lambda zip_code, meds: [{"plan_name": "A", "premium": 10, "tier_info": "1"}]
+    # More rows in flight than the session may queue: the batch waits for slots rather than failing rows
+    counts = asyncio.run(partd_batch.run_batch(_rows(24), out, lookup, 24, "gpt-4", None, CREDENTIALS))
+    assert counts == {"ok": 24}
+    assert len(calls) == 24
+    assert all(1 <= active <= 2 and base == "http://mock" and key == "mock-key" for active, base, key in calls)
+    assert pool.active == 0
@@ -0,0 +1,44 @@
+import prompt_compress
+
+REPEATED = "Continue lisinopril 20 mg daily and recheck BMP in one week."
+
+
+def test_typed_text_starting_like_a_placeholder_is_kept():
+    prompt = "Plan: Enter hospice referral, family meeting Friday"
+    assert prompt_compress.compress(prompt) == prompt
+    assert prompt_compress.compress("Vitals: e.g. BP improved to 128/70 at home") == \
+        "Vitals: e.g. BP improved to 128/70 at home"
+    assert not prompt_compress.is_placeholder("Enter hospice referral")
+
+
+def test_widget_defaults_are_dropped():
+    prompt = ("Subjective:\n"
+              "Patient presents with the following symptoms: Enter patient's symptoms....\n"
+              "Risk Factors: Enter risk factors....\n"
+              "Additional Info: Diabetes Mellitus Status: Present/Absent, Hypertension Status: Controlled.\n"
+              "Lab Data: Cr 1.8.\n\n"
+              "Assessment & Plan:\n"
+              "Enter assessment and plan...\n")
+    assert prompt_compress.compress(prompt) == \
+        "Subjective:\nAdditional Info: Hypertension Status: Controlled.\nLab Data: Cr 1.8."
+    assert prompt_compress.is_placeholder("Type your note here...")
+
+
+def test_repeated_data_lines_are_kept():
+    prompt = f"Interval History:\n{REPEATED}\n\nAssessment & Plan:\n{REPEATED}"
+    assert prompt_compress.compress(prompt).count(REPEATED) == 2
+
+
+def test_repeated_instruction_lines_are_deduplicated():
+    instruction = "Do not add any extra summary sections beyond the requested ones."
+    prompt = f"Lab Data: Cr 1.8.\n\n{instruction}\nEnsure that the final note is evidence-based and concise.\n\n" \
+             f"{instruction}\nEnsure that the final note is evidence-based and concise."
+    compressed = prompt_compress.compress(prompt)
+    assert compressed.count(instruction) == 1
+    assert compressed.count("evidence-based") == 1
+
+
+def test_whitespace_and_stats():
+    compressed, stats = prompt_compress.compress_with_stats("Lab Data:   Cr 1.8.\n\n\n\nMeds:  none\n")
+    assert compressed == "Lab Data: Cr 1.8.\n\nMeds: none"
+    assert stats["tokens_saved"] >= 0 and stats["tokens_after"] <= stats["tokens_before"]